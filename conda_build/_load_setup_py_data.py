@@ -2,11 +2,75 @@ import os
 import sys
 import logging
 
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+import io
+
+
+def _record_opened_files(read_files):
+    """Patch open so that the paths of files opened while setup.py runs end up in read_files.
+    Returns a function that undoes the patch."""
+    original_open, original_io_open = builtins.open, io.open
+
+    def recording(open_func):
+        def _open(file, *args, **kwargs):
+            if isinstance(file, (str, type(u''))):
+                read_files.append(os.path.abspath(file))
+            return open_func(file, *args, **kwargs)
+        return _open
+
+    builtins.open = recording(original_open)
+    io.open = recording(original_io_open)
+
+    def restore():
+        builtins.open, io.open = original_open, original_io_open
+    return restore
+
+
+def _record_module_file(module, folder, read_files):
+    module_file = getattr(module, '__file__', None) or ''
+    if os.path.abspath(module_file).startswith(folder):
+        if module_file.endswith(('.pyc', '.pyo')):
+            module_file = module_file[:-1]
+        read_files.append(os.path.abspath(module_file))
+
+
+def _record_imported_files(read_files, folder):
+    """Patch __import__ so that the files of the modules from folder that setup.py imports end
+    up in read_files - also those that were imported before, and so are not loaded again.
+    Returns a function that undoes the patch."""
+    original_import = builtins.__import__
+    folder = os.path.join(os.path.abspath(folder), '')
+
+    def _import(name, *args, **kwargs):
+        module = original_import(name, *args, **kwargs)
+        fromlist = args[2] if len(args) > 2 else kwargs.get('fromlist')
+        level = args[3] if len(args) > 3 else kwargs.get('level', 0)
+        if level <= 0:
+            parts = name.split('.')
+            names = ['.'.join(parts[:i + 1]) for i in range(len(parts))]
+            names.extend(name + '.' + sub for sub in fromlist or ())
+            for full_name in names:
+                _record_module_file(sys.modules.get(full_name), folder, read_files)
+        return module
+
+    builtins.__import__ = _import
+
+    def restore():
+        builtins.__import__ = original_import
+    return restore
+
 
 def load_setup_py_data(setup_file, from_recipe_dir=False, recipe_dir=None, work_dir=None,
-                       permit_undefined_jinja=True):
+                       permit_undefined_jinja=True, read_files=None):
+    """read_files: optional list.  Paths of the files that were read to get the setup.py data are
+    appended to it, so that callers can tell when the data may have changed."""
     _setuptools_data = {}
     log = logging.getLogger(__name__)
+    if read_files is None:
+        read_files = []
 
     import setuptools
     import distutils.core
@@ -37,6 +101,7 @@ def load_setup_py_data(setup_file, from_recipe_dir=False, recipe_dir=None, work_
         else:
             raise RuntimeError(message)
 
+    read_files.extend([setup_file, os.path.join(os.path.dirname(setup_file), 'setup.cfg')])
     setup_cfg_data = {}
     try:
         from setuptools.config import read_configuration
@@ -82,7 +147,19 @@ def load_setup_py_data(setup_file, from_recipe_dir=False, recipe_dir=None, work_
     if os.path.isfile(setup_file):
         with open(setup_file) as f:
             code = compile(f.read(), setup_file, 'exec', dont_inherit=1)
+        # modules imported from the source tree (versioneer, _version.py, ...) are read too
+        setup_dir = os.path.dirname(setup_file)
+        modules_before = set(sys.modules)
+        restore_open = _record_opened_files(read_files)
+        restore_import = _record_imported_files(read_files, setup_dir)
+        try:
             exec(code, ns, ns)
+        finally:
+            restore_import()
+            restore_open()
+        # imports that don't go through __import__ (importlib.import_module)
+        for name in set(sys.modules) - modules_before:
+            _record_module_file(sys.modules[name], os.path.join(setup_dir, ''), read_files)
     else:
         if not permit_undefined_jinja:
             raise TypeError('{} is not a file that can be read'.format(setup_file))
@@ -119,8 +196,11 @@ if __name__ == '__main__':
                         default=False, action="store_true")
     args = parser.parse_args()
     # we get back a dict of the setup data
-    data = load_setup_py_data(**args.__dict__)
+    read_files = []
+    data = load_setup_py_data(read_files=read_files, **args.__dict__)
     with open(os.path.join(args.work_dir, 'conda_build_loaded_setup_py.json'), 'w') as f:
         # this is lossy.  Anything that can't be serialized is either forced to None or
         #     removed completely.
         json.dump(data, f, skipkeys=True, default=lambda x: None)
+    with open(os.path.join(args.work_dir, 'conda_build_loaded_setup_py_files.json'), 'w') as f:
+        json.dump(sorted(set(read_files)), f)
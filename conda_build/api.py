@@ -62,6 +62,22 @@ def render(recipe_path, config=None, variants=None, permit_unsatisfiable_variant
     return list(output_metas.values())
 
 
+def render_recipes(recipe_paths, config=None, variants=None, permit_unsatisfiable_variants=True,
+                   finalize=True, bypass_env_check=False, processes=None, **kwargs):
+    """Render many recipes at once, on a pool of worker processes (one per CPU by default).
+
+    The build index and shared variant config files are loaded only once for the whole batch.
+
+    Returns an iterator of JSON-serializable dictionaries, one per recipe, in the order that
+    recipes finish rendering.  Each has keys 'recipe', 'outputs' and 'error'."""
+    from conda_build.render import render_recipes
+    config = get_or_merge_config(config, **kwargs)
+    return render_recipes(_ensure_list(recipe_paths), config=config, variants=variants,
+                          permit_unsatisfiable_variants=permit_unsatisfiable_variants,
+                          finalize=finalize, bypass_env_check=bypass_env_check,
+                          processes=processes)
+
+
 def output_yaml(metadata, file_path=None):
     """Save a rendered recipe in its final form to the path given by file_path"""
     from conda_build.render import output_yaml
@@ -74,6 +90,10 @@ def get_output_file_paths(recipe_path_or_metadata, no_download_source=False, con
 
     Both split packages (recipes with more than one output) and build matrices,
     created with variants, contribute to the list of file paths here.
+
+    With offline_render=True, paths are computed without channel data or the solver where
+    possible (see conda_build.render.render_offline).  Pass pins_lockfile to supply solved
+    build/host environments for hashed filenames.
     """
     from conda_build.render import bldpkg_path
     from conda_build.conda_interface import string_types
@@ -89,8 +109,13 @@ def get_output_file_paths(recipe_path_or_metadata, no_download_source=False, con
             raise ValueError("received mixed list of metas: {}".format(recipe_path_or_metadata))
     elif isinstance(recipe_path_or_metadata, string_types):
         # first, render the parent recipe (potentially multiple outputs, depending on variants).
-        metadata = render(recipe_path_or_metadata, no_download_source=no_download_source,
-                            variants=variants, config=config, finalize=True, **kwargs)
+        if config.offline_render:
+            from conda_build.render import render_offline
+            metadata = render_offline(recipe_path_or_metadata, config, variants=variants,
+                                      no_download_source=no_download_source)
+        else:
+            metadata = render(recipe_path_or_metadata, no_download_source=no_download_source,
+                              variants=variants, config=config, finalize=True, **kwargs)
     else:
         assert hasattr(recipe_path_or_metadata, 'config'), ("Expecting metadata object - got {}"
                                                             .format(recipe_path_or_metadata))
@@ -288,6 +313,18 @@ def convert(package_file, output_dir=".", show_imports=False, platforms=None, fo
         raise RuntimeError("cannot convert: %s" % package_file)
 
 
+def convert_batch(packages, output_dir=".", platforms=None, force=False, dependencies=None,
+                  verbose=False, quiet=True, processes=None, dry_run=False):
+    """Convert many packages (files, directories of them or glob patterns) in one go.  Packages
+    whose converted outputs are up to date are skipped, the rest are converted in parallel and
+    every output subdir is indexed once.  Returns {package: reason} for those that failed."""
+    from .convert import conda_convert_batch
+    return conda_convert_batch(_ensure_list(packages), output_dir=output_dir,
+                               platforms=_ensure_list(platforms), force=force,
+                               dependencies=dependencies, verbose=verbose, quiet=quiet,
+                               processes=processes, dry_run=dry_run)
+
+
 def test_installable(channel='defaults'):
     """Check to make sure that packages in channel are installable.
     This is a consistency check for the channel."""
@@ -296,11 +333,12 @@ def test_installable(channel='defaults'):
 
 
 def inspect_linkages(packages, prefix=_sys.prefix, untracked=False, all_packages=False,
-                     show_files=False, groupby='package', sysroot=''):
+                     show_files=False, groupby='package', sysroot='', linkage_method='pyldd'):
     from .inspect import inspect_linkages
     packages = _ensure_list(packages)
     return inspect_linkages(packages, prefix=prefix, untracked=untracked, all_packages=all_packages,
-                            show_files=show_files, groupby=groupby, sysroot=sysroot)
+                            show_files=show_files, groupby=groupby, sysroot=sysroot,
+                            linkage_method=linkage_method)
 
 
 def inspect_objects(packages, prefix=_sys.prefix, groupby='filename'):
@@ -17,8 +17,15 @@ import stat
 import subprocess
 import sys
 import tarfile
+import time
+import traceback
 import hashlib
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 # this is to compensate for a requests idna encoding error.  Conda is a better place to fix,
 #   eventually
 # exception is raises: "LookupError: unknown encoding: idna"
@@ -45,14 +52,14 @@ from .conda_interface import dist_str_in_index
 from .conda_interface import MatchSpec
 
 from conda_build import __version__
-from conda_build import environ, source, tarcheck, utils
+from conda_build import checksums, environ, source, tarcheck, utils
 from conda_build.index import get_build_index, update_index
 from conda_build.render import (output_yaml, bldpkg_path, render_recipe, reparse, finalize_metadata,
                                 distribute_variants, expand_outputs, try_download)
 import conda_build.os_utils.external as external
 from conda_build.metadata import MetaData
-from conda_build.post import (post_process, post_build,
-                              fix_permissions, get_build_metadata)
+from conda_build.post import (post_process, post_build, check_overlinking,
+                              fix_permissions, get_build_metadata, reset_lib_indexes)
 
 from conda_build.exceptions import indent, DependencyNeedsBuildingError, CondaBuildException
 from conda_build.variants import (set_language_env_vars, dict_of_lists_to_list_of_dicts,
@@ -491,6 +498,7 @@ def create_info_files(m, files, prefix):
     write_about_json(m)
     write_link_json(m)
     write_run_exports(m)
+    check_overlinking(m, files, prefix)
 
     copy_recipe(m)
     copy_readme(m)
@@ -760,8 +768,10 @@ def bundle_conda(output, metadata, env, **kw):
             t.add(join(metadata.config.host_prefix, f), f)
         t.close()
 
-        # we're done building, perform some checks
-        tarcheck.check_all(tmp_path, metadata.config)
+        # we're done building, perform some checks.  They run on what was just written, so the
+        #    package doesn't need to be decompressed again for them.
+        tarcheck.check_files(output_filename, files, metadata.config.host_prefix,
+                             metadata.config)
         if getattr(metadata.config, "verify", False):
             verifier = Verify()
             ignore_scripts = metadata.config.ignore_package_verify_scripts if \
@@ -863,6 +873,8 @@ def build(m, post=None, need_source_download=True, need_reparse_in_env=False, bu
         utils.print_skip_message(m)
         return default_return
 
+    # the prefixes of this build may have the same paths as those of an earlier one
+    reset_lib_indexes()
     log = utils.get_logger(__name__)
     host_actions = []
     build_actions = []
@@ -1688,6 +1700,251 @@ Error:
 """ % (os.pathsep.join(external.dir_paths)))
 
 
+def local_recipe_dirs(recipe_parent_dir, pkg):
+    """Recipe or feedstock folders for pkg next to (or one level above) recipe_parent_dir."""
+    recipe_glob = glob(os.path.join(recipe_parent_dir, pkg))
+    # conda-forge style.  meta.yaml lives one level deeper.
+    if not recipe_glob:
+        recipe_glob = glob(os.path.join(recipe_parent_dir, '..', pkg))
+    feedstock_glob = glob(os.path.join(recipe_parent_dir, pkg + '-feedstock'))
+    if not feedstock_glob:
+        feedstock_glob = glob(os.path.join(recipe_parent_dir, '..', pkg + '-feedstock'))
+    return recipe_glob + feedstock_glob
+
+
+def _build_and_test(metadata, post, need_source_download, need_reparse_in_env, built_packages,
+                    notest):
+    packages_from_this = build(metadata,
+                               post=post,
+                               need_source_download=need_source_download,
+                               need_reparse_in_env=need_reparse_in_env,
+                               built_packages=built_packages,
+                               notest=notest,
+                               )
+    if not notest:
+        for pkg in packages_from_this:
+            if pkg.endswith('.tar.bz2'):
+                # we only know how to test conda packages
+                test(pkg, config=metadata.config)
+    return packages_from_this
+
+
+def _requirement_specs(m, build_only=False):
+    """Everything m needs from other packages to build and test: its own build, host, run and
+    test requirements and those of its outputs.  With build_only, just the build and host
+    requirements, which m can not be built without."""
+    sections = [m.meta.get('requirements', {}), {'test': m.get_value('test/requires', [])}]
+    for output in m.meta.get('outputs', []):
+        requirements = output.get('requirements', {})
+        # outputs may list their run requirements directly
+        sections.append(requirements if hasattr(requirements, 'keys') else
+                        {'run': requirements})
+        sections.append({'test': output.get('test', {}).get('requires', [])})
+    return [spec for section in sections for kind, specs in section.items()
+            if not build_only or kind in ('build', 'host')
+            for spec in utils.ensure_list(specs) if spec]
+
+
+def _provided_names(m):
+    return {m.name()} | set(output.get('name') for output in m.meta.get('outputs', []))
+
+
+def _render_build_nodes(recipe, config, variants):
+    """Render one recipe (a path or metadata) into graph nodes, one per variant."""
+    if hasattr(recipe, 'config'):
+        variants_ = (dict_of_lists_to_list_of_dicts(variants) if variants else
+                     get_package_variants(recipe))
+        metadata_tuples = distribute_variants(recipe, variants_,
+                                              permit_unsatisfiable_variants=False)
+    else:
+        metadata_tuples = render_recipe(recipe.rstrip("/").rstrip("\\"), config=config,
+                                        variants=variants, permit_unsatisfiable_variants=False,
+                                        reset_build_id=not config.dirty, bypass_env_check=True)
+    return [{'metadata': m, 'need_source_download': need_source_download,
+             'need_reparse_in_env': need_reparse_in_env, 'deps': set(), 'run_deps': set()}
+            for (m, need_source_download, need_reparse_in_env) in metadata_tuples]
+
+
+def _connect_build_nodes(nodes):
+    """Point each node's deps at the (indexes of) other nodes that provide its build and host
+    requirements, and its run_deps at those that provide only its run and test requirements.
+    A requirement on another recipe's top-level package must also match that recipe's version
+    and shared variant keys."""
+    providers = {}
+    for index, node in enumerate(nodes):
+        for name in _provided_names(node['metadata']):
+            providers.setdefault(name, []).append(index)
+    for index, node in enumerate(nodes):
+        m = node['metadata']
+        own_names = _provided_names(m)
+        build_specs = set(_requirement_specs(m, build_only=True))
+        for spec in _requirement_specs(m):
+            name = spec.split()[0]
+            if name in own_names:
+                continue
+            for provider in providers.get(name, []):
+                other_m = nodes[provider]['metadata']
+                if name != other_m.name() or utils.match_peer_job(MatchSpec(spec), other_m, m):
+                    node['deps' if spec in build_specs else 'run_deps'].add(provider)
+
+
+def _add_local_dependencies(nodes, rendered, node=None, specs=None):
+    """Add nodes for the local recipes (see local_recipe_dirs) that provide requirements no
+    node provides yet, and for their own requirements in turn.  With node and specs, look for
+    providers of just those specs of that node.  rendered holds the recipe folders that have
+    nodes already.  Returns whether any nodes were added."""
+    count = len(nodes)
+    todo = [(node, specs)] if node else [(node, None) for node in nodes]
+    while todo:
+        node, specs = todo.pop()
+        m = node['metadata']
+        provided = set(name for other in nodes for name in _provided_names(other['metadata']))
+        for spec in (specs if specs is not None else _requirement_specs(m)):
+            name = spec.split()[0]
+            if specs is None and name in provided:
+                continue
+            for recipe_dir in local_recipe_dirs(os.path.dirname(m.path), name):
+                recipe_dir = os.path.normpath(recipe_dir)
+                if recipe_dir in rendered:
+                    continue
+                rendered.add(recipe_dir)
+                new_nodes = [new for new in _render_build_nodes(recipe_dir, m.config, None)
+                             if utils.match_peer_job(MatchSpec(spec), new['metadata'], m)]
+                if new_nodes:
+                    print(("Missing dependency {0}, but found recipe directory, so building "
+                           "{0} first").format(name))
+                    nodes.extend(new_nodes)
+                    todo.extend((new, None) for new in new_nodes)
+    return len(nodes) > count
+
+
+def _build_job(result_queue, index, node, notest, built_packages):
+    """Build and test one node, in a worker process.  Reports back through result_queue."""
+    metadata = node['metadata']
+    try:
+        packages = _build_and_test(metadata, None, node['need_source_download'],
+                                   node['need_reparse_in_env'], built_packages, notest)
+        metadata.clean()
+        result_queue.put((index, 'built', list(packages)))
+    except DependencyNeedsBuildingError as e:
+        names = set(pkg.split()[0] for pkg in e.packages)
+        result_queue.put((index, 'missing', [spec for spec in e.matchspecs
+                                             if spec.split()[0] in names] or sorted(names)))
+    except BaseException as e:
+        result_queue.put((index, 'failed', traceback.format_exc() if isinstance(e, Exception)
+                          else str(e)))
+
+
+def _fork_context():
+    """The multiprocessing context that forks its workers, or None where there is none."""
+    import multiprocessing
+    if not hasattr(multiprocessing, 'get_context'):
+        # python 2 always forks, except on windows
+        return None if utils.on_win else multiprocessing
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def build_tree_parallel(recipe_list, config, jobs, notest=False, variants=None):
+    """Build recipes, and the local recipes they depend on, on up to jobs worker processes.
+
+    All recipes are rendered first, into a graph of which recipe variant needs which.  A
+    variant is built once everything it needs is built; each build has a build folder (build
+    id) of its own, and its packages are indexed into the output folder as soon as it is done,
+    for later builds to use.  Returns the built packages, like build_tree.
+
+    Workers are forked (see _fork_context), so that they get the rendered metadata without
+    pickling it."""
+    context = _fork_context()
+    nodes = []
+    rendered = set()
+    for recipe in recipe_list:
+        if not hasattr(recipe, 'config'):
+            rendered.add(os.path.normpath(recipe))
+        nodes.extend(_render_build_nodes(recipe, config, variants))
+    _add_local_dependencies(nodes, rendered)
+    _connect_build_nodes(nodes)
+
+    built_packages = OrderedDict()
+    result_queue = context.Queue()
+    waiting = list(range(len(nodes)))
+    running = {}
+    built = set()
+    build_ids = set()
+    failures = []
+    while running or waiting and not failures:
+        ready = [index for index in waiting
+                 if nodes[index]['deps'] | nodes[index]['run_deps'] <= built]
+        if not ready and not running:
+            # run and test requirements can form cycles (A runs with B, and B is tested with
+            #    A).  Only build and host requirements have to be built first.
+            ready = [index for index in waiting if nodes[index]['deps'] <= built]
+        if not ready and not running:
+            raise RuntimeError("Can't build {}: their dependencies form a cycle".format(
+                utils.comma_join(nodes[index]['metadata'].name() for index in waiting)))
+        for index in ready[:max(jobs - len(running), 0) if not failures else 0]:
+            waiting.remove(index)
+            metadata = nodes[index]['metadata']
+            utils.rm_rf(metadata.config.host_prefix)
+            utils.rm_rf(metadata.config.build_prefix)
+            utils.rm_rf(metadata.config.test_prefix)
+            # build ids are made from the time in ms; two variants of a recipe started at
+            #    once must not share one
+            metadata.config.compute_build_id(metadata.name(), reset=True)
+            while metadata.config.build_id in build_ids:
+                time.sleep(0.001)
+                metadata.config.compute_build_id(metadata.name(), reset=True)
+            build_ids.add(metadata.config.build_id)
+            process = context.Process(target=_build_job,
+                                      args=(result_queue, index, nodes[index], notest,
+                                            built_packages))
+            process.start()
+            running[index] = process
+
+        try:
+            index, status, result = result_queue.get(timeout=1)
+        except queue.Empty:
+            for index, process in list(running.items()):
+                if not process.is_alive() and result_queue.empty():
+                    del running[index]
+                    failures.append((index, "worker exited with code {}"
+                                            .format(process.exitcode)))
+            continue
+        running.pop(index).join()
+        node = nodes[index]
+        if status == 'built':
+            built.add(index)
+            built_packages.update((pkg, (None, node['metadata'])) for pkg in result)
+        elif status == 'missing':
+            # a requirement the up-front look for local recipes could not see (e.g. from
+            #    run_exports, or a pin): look again for just those packages
+            count = len(nodes)
+            added = _add_local_dependencies(nodes, rendered, node, result)
+            if added:
+                _connect_build_nodes(nodes)
+                waiting.extend(range(count, len(nodes)))
+            # or nodes that were started before this one, on a run or test requirement cycle
+            names = set(spec.split()[0] for spec in result)
+            providers = set(other for other in range(len(nodes)) if other not in built and
+                            other != index and
+                            names & _provided_names(nodes[other]['metadata']))
+            if added or providers - node['deps']:
+                node['deps'].update(providers)
+                waiting.append(index)
+            else:
+                failures.append((index, "Missing dependencies: {}".format(
+                    utils.comma_join(result))))
+        else:
+            failures.append((index, result))
+
+    if failures:
+        raise RuntimeError("\n".join("Building {} failed:\n{}".format(
+            nodes[index]['metadata'].name(), error) for index, error in failures))
+    return built_packages
+
+
 def build_tree(recipe_list, config, build_only=False, post=False, notest=False,
                need_source_download=True, need_reparse_in_env=False, variants=None):
 
@@ -1702,6 +1959,17 @@ def build_tree(recipe_list, config, build_only=False, post=False, notest=False,
             subprocess.call('del /s /q "{0}\\*.*" >nul 2>&1'.format(trash_dir), shell=True)
         # delete_trash(None)
 
+    # parallel builds each need a build folder of their own (so no --dirty, which reuses one).
+    #    post is False (not None) when the command line does not ask for --post.
+    if (config.build_jobs > 1 and not post and not build_only and config.set_build_id and
+            not config.dirty and _fork_context() is not None):
+        built_packages = build_tree_parallel(recipe_list, config, config.build_jobs,
+                                             notest=notest, variants=variants)
+        handle_anaconda_upload([f for f in built_packages if f.endswith('.tar.bz2')],
+                               config=config)
+        handle_pypi_upload([f for f in built_packages if f.endswith('.whl')], config=config)
+        return list(built_packages.keys())
+
     extra_help = ""
     built_packages = OrderedDict()
     retried_recipes = []
@@ -1710,6 +1978,13 @@ def build_tree(recipe_list, config, build_only=False, post=False, notest=False,
     #     the loop below.
     metadata = None
 
+    # recipes that are already rendered can have their sources downloading while the
+    #    ones ahead of them build.
+    if need_source_download and not config.no_download_source:
+        upcoming = [recipe for recipe in list(recipe_list)[1:] if hasattr(recipe, 'config')]
+        if upcoming:
+            source.download_sources_in_background(upcoming)
+
     while recipe_list:
         # This loop recursively builds dependencies if recipes exist
         if build_only:
@@ -1768,21 +2043,9 @@ def build_tree(recipe_list, config, build_only=False, post=False, notest=False,
                 if metadata.name() not in metadata.config.build_folder:
                     metadata.config.compute_build_id(metadata.name(), reset=True)
 
-                packages_from_this = build(metadata,
-                                           post=post,
-                                           need_source_download=need_source_download,
-                                           need_reparse_in_env=need_reparse_in_env,
-                                           built_packages=built_packages,
-                                           notest=notest,
-                                           )
-                if not notest:
-                    for pkg, dict_and_meta in packages_from_this.items():
-                        if pkg.endswith('.tar.bz2'):
-                            # we only know how to test conda packages
-                            test(pkg, config=metadata.config)
-                        built_packages.update({pkg: dict_and_meta})
-                else:
-                    built_packages.update(packages_from_this)
+                built_packages.update(_build_and_test(metadata, post, need_source_download,
+                                                      need_reparse_in_env, built_packages,
+                                                      notest))
             # each metadata element here comes from one recipe, thus it will share one build id
             #    cleaning on the last metadata in the loop should take care of all of the stuff.
             metadata.clean()
@@ -1813,17 +2076,10 @@ needs to be rebuilt (e.g., a conflict with 'python 3.5*'
 and 'x' means 'x' or one of 'x' dependencies isn't built
 for Python 3.5 and needs to be rebuilt."""
 
-                recipe_glob = glob(os.path.join(recipe_parent_dir, pkg))
-                # conda-forge style.  meta.yaml lives one level deeper.
-                if not recipe_glob:
-                    recipe_glob = glob(os.path.join(recipe_parent_dir, '..', pkg))
-                feedstock_glob = glob(os.path.join(recipe_parent_dir, pkg + '-feedstock'))
-                if not feedstock_glob:
-                    feedstock_glob = glob(os.path.join(recipe_parent_dir, '..',
-                                                       pkg + '-feedstock'))
+                recipe_dirs = local_recipe_dirs(recipe_parent_dir, pkg)
                 available = False
-                if recipe_glob or feedstock_glob:
-                    for recipe_dir in recipe_glob + feedstock_glob:
+                if recipe_dirs:
+                    for recipe_dir in recipe_dirs:
                         if not any(path.startswith(recipe_dir) for path in built_package_paths):
                             dep_metas = render_recipe(recipe_dir, config=metadata.config)
                             for dep_meta in dep_metas:
@@ -1960,6 +2216,8 @@ def clean_build(config, folders=None):
         folders = utils.get_build_folders(config.croot)
     for folder in folders:
         utils.rm_rf(folder)
+    # the checksums of files in removed build folders are no use any more
+    checksums.prune()
 
 
 def is_package_built(metadata, env):
@@ -0,0 +1,204 @@
+"""Checksums of files, remembered across runs.
+
+Digests are kept in a sqlite database (~/.conda_build_checksums.db, or conda-build/checksum_db
+in condarc), keyed by the path of the file together with its inode, size and modification
+time.  Any change to the file changes one of those, so a stale digest is never returned.
+Rows for files that are gone are pruned now and then (see prune).
+"""
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+from multiprocessing.pool import ThreadPool
+import os
+import sqlite3
+import threading
+import time
+
+from .conda_interface import cc_conda_build
+
+checksum_db_path = os.path.expanduser(cc_conda_build.get(
+    'checksum_db', os.path.join('~', '.conda_build_checksums.db')))
+
+# size of the blocks read from disk and fed to every hasher
+_chunk_size = 1024 * 1024
+# files at least this big get each requested digest computed on its own thread.  hashlib
+#    releases the GIL for large updates, so md5 and sha256 of one file really run together.
+_parallel_digest_size = 16 * 1024 * 1024
+
+# in-process layer over the database: (path, hash_type) -> (stat key, digest)
+_memory_cache = {}
+_memory_cache_lock = threading.Lock()
+
+# one connection to the database per thread (sqlite connections can't be shared between them)
+_local = threading.local()
+# seconds between prunes of the rows for files that no longer exist
+_prune_interval = 7 * 24 * 60 * 60
+# database paths checked for a due prune by this process
+_prune_checked = set()
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1e9)
+    return (st.st_ino, st.st_size, mtime_ns)
+
+
+def _open(db_path):
+    db = sqlite3.connect(db_path, timeout=30)
+    db.execute('CREATE TABLE IF NOT EXISTS checksums (path TEXT, hash_type TEXT, '
+               'inode INTEGER, size INTEGER, mtime_ns INTEGER, digest TEXT, '
+               'PRIMARY KEY (path, hash_type))')
+    db.execute('CREATE TABLE IF NOT EXISTS pruned (time REAL)')
+    return db
+
+
+def _connect():
+    """This thread's connection to the checksum database, or None if it can't be used
+    (read-only home, ...).  The cache then only lives for this process."""
+    # a connection inherited from the parent of a forked process must not be used (or closed)
+    key = (checksum_db_path, os.getpid())
+    if getattr(_local, 'key', None) != key:
+        if getattr(_local, 'db', None) and _local.key[1] == key[1]:
+            _local.db.close()
+        try:
+            _local.db = _open(checksum_db_path)
+        except sqlite3.Error:
+            _local.db = None
+        _local.key = key
+        if _local.db and checksum_db_path not in _prune_checked:
+            _prune_checked.add(checksum_db_path)
+            _prune_if_due(_local.db)
+    return _local.db
+
+
+def _prune(db):
+    paths = [row[0] for row in db.execute('SELECT DISTINCT path FROM checksums')]
+    gone = [(path, ) for path in paths if not os.path.exists(path)]
+    with db:
+        db.executemany('DELETE FROM checksums WHERE path = ?', gone)
+        db.execute('DELETE FROM pruned')
+        db.execute('INSERT INTO pruned VALUES (?)', (time.time(), ))
+    return len(gone)
+
+
+def _prune_if_due(db):
+    try:
+        last = db.execute('SELECT MAX(time) FROM pruned').fetchone()[0]
+        if last is None or time.time() - last > _prune_interval:
+            _prune(db)
+    except sqlite3.Error:
+        pass
+
+
+def prune():
+    """Forget the digests of files that no longer exist.  Returns how many files that was."""
+    db = _connect()
+    if not db:
+        return 0
+    try:
+        return _prune(db)
+    except sqlite3.Error:
+        return 0
+
+
+def _lookup(path, hash_types, key):
+    found = {}
+    with _memory_cache_lock:
+        for hash_type in hash_types:
+            cached = _memory_cache.get((path, hash_type))
+            if cached and cached[0] == key:
+                found[hash_type] = cached[1]
+    missing = [hash_type for hash_type in hash_types if hash_type not in found]
+    if missing:
+        db = _connect()
+        if db:
+            try:
+                rows = db.execute('SELECT hash_type, inode, size, mtime_ns, digest FROM checksums '
+                                  'WHERE path = ?', (path,)).fetchall()
+            except sqlite3.Error:
+                rows = []
+            for hash_type, inode, size, mtime_ns, digest in rows:
+                if hash_type in missing and (inode, size, mtime_ns) == key:
+                    found[hash_type] = digest
+    return found
+
+
+def record_hashes(path, digests, key=None):
+    """Remember digests ({hash_type: hexdigest}) of the file at path as it is right now.  For
+    callers that computed them anyway, e.g. while downloading."""
+    path = os.path.abspath(path)
+    key = key or _stat_key(path)
+    with _memory_cache_lock:
+        for hash_type, digest in digests.items():
+            _memory_cache[(path, hash_type)] = (key, digest)
+    db = _connect()
+    if db:
+        try:
+            with db:
+                db.executemany('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?)',
+                               [(path, hash_type) + key + (digest, )
+                                for hash_type, digest in digests.items()])
+        except sqlite3.Error:
+            pass
+
+
+def _compute(path, hash_types, size):
+    hashers = [hashlib.new(hash_type) for hash_type in hash_types]
+    pool = None
+    if len(hashers) > 1 and size >= _parallel_digest_size:
+        pool = ThreadPool(len(hashers))
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_chunk_size), b''):
+                if pool:
+                    pool.map(lambda hasher: hasher.update(chunk), hashers)
+                else:
+                    for hasher in hashers:
+                        hasher.update(chunk)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return {hash_type: hasher.hexdigest() for hash_type, hasher in zip(hash_types, hashers)}
+
+
+def file_hashes(path, hash_types=('md5', ), cached=True):
+    """Return {hash_type: hexdigest} for the file at path.  Digests that are not known yet
+    for this exact file are all computed in a single read.  With cached=False, all are read
+    from the file, for callers that must catch changes that keep its size and mtime."""
+    path = os.path.abspath(path)
+    key = _stat_key(path)
+    digests = _lookup(path, hash_types, key) if cached else {}
+    missing = [hash_type for hash_type in hash_types if hash_type not in digests]
+    if missing:
+        computed = _compute(path, missing, key[1])
+        record_hashes(path, computed, key)
+        digests.update(computed)
+    return digests
+
+
+def hash_files(paths, hash_types=('md5', ), threads=4, cached=True):
+    """file_hashes for many files at once, hashing up to `threads` of them concurrently.
+    Returns {path: {hash_type: hexdigest}}."""
+    paths = list(paths)
+    if threads < 2 or len(paths) < 2:
+        return {path: file_hashes(path, hash_types, cached) for path in paths}
+    pool = ThreadPool(min(threads, len(paths)))
+    try:
+        return dict(zip(paths, pool.map(lambda path: file_hashes(path, hash_types, cached),
+                                        paths)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def hashsum_file(path, mode='md5'):
+    """Drop-in for conda's hashsum_file."""
+    return file_hashes(path, (mode, ))[mode]
+
+
+def md5_file(path):
+    """Drop-in for conda's md5_file."""
+    return hashsum_file(path, 'md5')
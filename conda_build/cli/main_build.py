@@ -95,7 +95,7 @@ different sets of packages."""
     p.add_argument(
         'recipe',
         metavar='RECIPE_PATH',
-        nargs='+',
+        nargs='*',
         help="Path to recipe directory.  Pass 'purge' here to clean the "
         "work and test intermediates.",
     )
@@ -274,9 +274,30 @@ different sets of packages."""
               "in the future.")
     )
 
+    p.add_argument(
+        '--src-cache-max-size',
+        help=("Largest size the source cache may grow to, in bytes or with a K, M, G or T "
+              "suffix.  The least recently used sources are removed to stay below it."),
+        default=cc_conda_build.get('src_cache_max_size'),
+    )
+    p.add_argument(
+        '-j', '--jobs', dest='build_jobs', type=int,
+        default=int(cc_conda_build.get('build_jobs', 1)),
+        help=("Number of recipes to build at once.  With more than one, all recipes (and the "
+              "local recipes they depend on) are rendered first, then built in dependency order "
+              "on that many worker processes.  Not available on Windows."),
+    )
+    p.add_argument(
+        '--clean-source-cache', action='store_true',
+        help=("Remove the least recently used sources from the source cache until it fits "
+              "--src-cache-max-size (everything, if no size is set), then exit."),
+    )
+
     add_parser_channels(p)
 
     args = p.parse_args(args)
+    if not args.recipe and not args.clean_source_cache:
+        p.error("at least one RECIPE_PATH is required")
     return p, args
 
 
@@ -324,6 +345,10 @@ def execute(args):
     config.override_channels = args.override_channels
     config.verbose = not args.quiet or args.debug
 
+    if args.clean_source_cache:
+        source.clean_source_cache(config)
+        return
+
     if 'purge' in args.recipe:
         build.clean_build(config)
         return
@@ -4,14 +4,16 @@
 # conda is distributed under the terms of the BSD 3-clause license.
 # Consult LICENSE.txt or http://opensource.org/licenses/BSD-3-Clause.
 
+import glob
 from locale import getpreferredencoding
 import logging
-from os.path import abspath, expanduser
+from os.path import abspath, expanduser, isdir
 import sys
 
 from conda_build.conda_interface import ArgumentParser
 
 from conda_build import api
+from conda_build.convert import find_packages
 from conda_build.utils import PY3
 
 logging.basicConfig(level=logging.INFO)
@@ -38,6 +40,11 @@ install on Mac OS X):
 
     conda convert package-1.0-py33.tar.bz2 -p win-64
 
+Convert every package of a channel subdirectory; packages converted before are
+skipped, and the output subdirectories are indexed at the end:
+
+    conda convert channel/linux-64 -p all -o channel
+
 """
 
 
@@ -54,7 +61,8 @@ all.""",
     p.add_argument(
         'files',
         nargs='+',
-        help="Package files to convert."
+        help="""Package files to convert.  Directories and glob patterns convert all the
+        packages in them, in one batch."""
     )
     p.add_argument(
         '-p', "--platform",
@@ -95,6 +103,13 @@ all.""",
         action='store_true',
         help="Print verbose output."
     )
+    p.add_argument(
+        '-j', '--processes',
+        type=int,
+        default=None,
+        help="""Number of packages to convert at the same time when converting many.
+        Defaults to the number of cpus.""",
+    )
     p.add_argument(
         "--dry-run",
         action="store_true",
@@ -114,14 +129,26 @@ def execute(args):
     _, args = parse_args(args)
     files = args.files
     del args.__dict__['files']
-
-    for f in files:
-        # Don't use byte literals for paths in Python 2
-        if not PY3:
-            f = f.decode(getpreferredencoding())
-
-        f = abspath(expanduser(f))
-        api.convert(f, **args.__dict__)
+    processes = args.__dict__.pop('processes')
+
+    # Don't use byte literals for paths in Python 2
+    if not PY3:
+        files = [f.decode(getpreferredencoding()) for f in files]
+    files = [abspath(expanduser(f)) for f in files]
+
+    if args.show_imports:
+        for f in find_packages(files):
+            api.convert(f, **args.__dict__)
+    elif not any(isdir(f) or glob.has_magic(f) for f in files):
+        for f in files:
+            api.convert(f, **args.__dict__)
+    else:
+        failed = api.convert_batch(files, output_dir=args.output_dir, platforms=args.platforms,
+                                   force=args.force, dependencies=args.dependencies,
+                                   verbose=args.verbose, quiet=args.quiet, processes=processes,
+                                   dry_run=args.dry_run)
+        if failed:
+            sys.exit("Error: %d package(s) could not be converted" % len(failed))
 
 
 def main():
@@ -78,6 +78,15 @@ libraries that ought to be dependent conda packages.  """
         action='store_true',
         help="Generate a report for all packages in the environment.",
     )
+    linkages.add_argument(
+        '--linkage-method',
+        action='store',
+        default='pyldd',
+        choices=('pyldd', 'ldd', 'verify'),
+        help="""How to find the libraries each file links to (default: %(default)s).
+        pyldd reads the files directly; ldd runs ldd (Linux) or otool -L (OS X) on each
+        of them; verify runs ldd/otool and warns where pyldd disagrees.""",
+    )
     add_parser_prefix(linkages)
 
     objects_help = """
@@ -195,7 +204,8 @@ def execute(args):
         print(api.inspect_linkages(args.packages, prefix=get_prefix(args),
                                    untracked=args.untracked, all_packages=args.all,
                                    show_files=args.show_files, groupby=args.groupby,
-                                   sysroot=expanduser(args.sysroot)))
+                                   sysroot=expanduser(args.sysroot),
+                                   linkage_method=args.linkage_method))
     elif args.subcommand == 'objects':
         print(api.inspect_objects(args.packages, prefix=get_prefix(args), groupby=args.groupby))
     elif args.subcommand == 'prefix-lengths':
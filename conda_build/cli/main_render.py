@@ -6,6 +6,7 @@
 
 from __future__ import absolute_import, division, print_function
 
+import json
 import logging
 import sys
 import os
@@ -121,11 +122,33 @@ def parse_args(args):
         help="write YAML to file, given as argument here.\
               Overwrites existing files."
     )
-    # we do this one separately because we only allow one entry to conda render
+    # we do this one separately because conda build has its own help text for it
     p.add_argument(
         'recipe',
         metavar='RECIPE_PATH',
-        help="Path to recipe directory.",
+        nargs='+',
+        help="Path to recipe directory.  When more than one is given, recipes are rendered "
+             "in parallel and a JSON summary of each recipe's outputs is printed per line.",
+    )
+    p.add_argument(
+        '--processes',
+        type=int,
+        help="Number of worker processes to use when rendering more than one recipe.  "
+             "Defaults to the number of CPUs.",
+    )
+    p.add_argument(
+        '--offline',
+        dest='offline_render',
+        action='store_true',
+        help="With --output, compute package paths without loading channel data or solving "
+             "environments, where possible.  A warning is shown when a recipe needs the solver "
+             "anyway.",
+    )
+    p.add_argument(
+        '--pins-lockfile',
+        dest='pins_lockfile',
+        help="YAML file of solved build/host environments (and their run_exports) to use in "
+             "place of the solver.  Used by --offline to compute hashed package paths.",
     )
     # this is here because we have a different default than build
     p.add_argument(
@@ -141,8 +164,6 @@ def execute(args):
     p, args = parse_args(args)
 
     config = get_or_merge_config(None, **args.__dict__)
-    variants = get_package_variants(args.recipe, config)
-    set_language_env_vars(variants)
 
     channel_urls = args.__dict__.get('channel') or args.__dict__.get('channels') or ()
     config.channel_urls = []
@@ -159,7 +180,31 @@ def execute(args):
 
     config.override_channels = args.override_channels
 
-    metadata_tuples = api.render(args.recipe, config=config,
+    if len(args.recipe) > 1:
+        with LoggingContext(logging.CRITICAL + 1):
+            config.verbose = False
+            config.debug = False
+            for result in api.render_recipes(args.recipe, config=config,
+                                             no_download_source=args.no_source,
+                                             processes=args.processes):
+                print(json.dumps(result, sort_keys=True))
+                sys.stdout.flush()
+        return
+
+    recipe = args.recipe[0]
+    variants = get_package_variants(recipe, config)
+    set_language_env_vars(variants)
+
+    if args.output and config.offline_render:
+        with LoggingContext(logging.CRITICAL + 1):
+            config.verbose = False
+            config.debug = False
+            paths = api.get_output_file_paths(recipe, config=config,
+                                              no_download_source=args.no_source)
+            print('\n'.join(sorted(paths)))
+        return
+
+    metadata_tuples = api.render(recipe, config=config,
                                  no_download_source=args.no_source)
 
     if args.output:
@@ -379,15 +379,9 @@ def which_package(path):
     the conda packages the file came from.  Usually the iteration yields
     only one package.
     """
-    from os.path import abspath, join
-    path = abspath(path)
-    prefix = which_prefix(path)
-    if prefix is None:
-        raise RuntimeError("could not determine conda prefix from: %s" % path)
-    for dist in linked(prefix):
-        meta = is_linked(prefix, dist)
-        if any(abspath(join(prefix, f)) == path for f in meta['files']):
-            yield dist
+    # the lookup goes through the index of the prefix that conda_build.utils keeps
+    from conda_build.utils import which_package
+    return which_package(path)
 
 
 def which_prefix(path):
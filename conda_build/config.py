@@ -85,6 +85,24 @@ DEFAULTS = [Setting('activate', True),
             Setting('keep_old_work', False),
             Setting('_src_cache_root', cc_conda_build.get('cache_dir')),
             Setting('copy_test_source_files', True),
+            # number of source files (and mirrors of a single file) fetched at once
+            Setting('download_threads', 4),
+            # number of recipes built at once.  With more than one, all recipes are rendered
+            #    first and built in dependency order on that many worker processes.
+            Setting('build_jobs', int(cc_conda_build.get('build_jobs', 1))),
+            # bytes (or a size like '20G') the source cache may use before the least recently
+            #    used sources are removed.  None means no limit.
+            Setting('src_cache_max_size', cc_conda_build.get('src_cache_max_size')),
+            # extract each source archive once, and fill work dirs from there with reflinks or
+            #    copies
+            Setting('cache_extracted_sources', True),
+            # keep downloaded, unpacked and patched work dirs, keyed by source and patch hashes
+            Setting('cache_prepared_sources', True),
+            # minutes after a fetch during which a git mirror is not fetched again
+            Setting('git_mirror_max_age', int(cc_conda_build.get('git_mirror_max_age', 0))),
+            # make new git mirrors with --filter=blob:none (needs git >= 2.19 on both ends)
+            Setting('git_partial_clone',
+                    cc_conda_build.get('git_partial_clone', 'false').lower() == 'true'),
 
             Setting('index', None),
 
@@ -99,6 +117,11 @@ DEFAULTS = [Setting('activate', True),
             Setting('ignore_system_variants', False),
             Setting('hash_length', 7),
 
+            # offline rendering: compute output paths without channel data or the solver.
+            #    Solved build/host environments can be supplied with a pins lockfile.
+            Setting('offline_render', False),
+            Setting('pins_lockfile', None),
+
             # append/clobber metadata section data (for global usage.  Can also add files to
             #    recipe.)
             Setting('append_sections_file', None),
@@ -534,6 +557,20 @@ class Config(object):
         _ensure_dir(path)
         return path
 
+    @property
+    def extracted_cache(self):
+        """Where downloaded archives are kept extracted, for reuse across builds"""
+        path = join(self.src_cache_root, 'extracted_cache')
+        _ensure_dir(path)
+        return path
+
+    @property
+    def prepared_cache(self):
+        """Where fully prepared (unpacked and patched) sources are kept for reuse"""
+        path = join(self.src_cache_root, 'prepared_cache')
+        _ensure_dir(path)
+        return path
+
     @property
     def git_cache(self):
         """Where local clones of git sources are stored"""
@@ -608,8 +645,8 @@ class Config(object):
     def copy(self):
         new = copy.copy(self)
         new.variant = copy.deepcopy(self.variant)
-        if hasattr(self, 'variants'):
-            new.variants = copy.deepcopy(self.variants)
+        # the variants list is shared, not copied.  It can be very long, and is only ever
+        #    replaced (see conform_variants_to_value), never modified in place.
         return new
 
     # context management - automatic cleanup if self.dirty or self.keep_old_work is not True
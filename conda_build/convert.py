@@ -8,15 +8,44 @@
 Tools for converting conda packages
 
 """
+from __future__ import print_function
+
+import copy
 import glob
 import json
 import hashlib
+import io
+import multiprocessing
 import os
 import re
-import shutil
 import sys
 import tarfile
-import tempfile
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def c_extension_imports(names):
+    """List the imports of the compiled C files among the member names of a package.
+
+    Positional arguments:
+    names (List[str]) -- the names of the members of the source package
+    """
+    c_extension_pattern = re.compile(
+        r'(Lib\/|lib\/python\d\.\d\/|lib\/)(site-packages\/|lib-dynload)?(.*)')
+
+    imports = []
+    for filename in names:
+        if filename.endswith(('.pyd', '.so')):
+            filename_match = c_extension_pattern.match(filename)
+            import_name = 'import {}' .format(filename_match.group(3).replace('/', '.'))
+            imports.append(import_name)
+
+    return imports
 
 
 def retrieve_c_extensions(file_path, show_imports=False):
@@ -32,29 +61,16 @@ def retrieve_c_extensions(file_path, show_imports=False):
     Keyword arguments:
     show_imports (bool) -- output the C extensions included in the package
     """
-    c_extension_pattern = re.compile(
-        r'(Lib\/|lib\/python\d\.\d\/|lib\/)(site-packages\/|lib-dynload)?(.*)')
-
-    imports = []
     with tarfile.open(file_path) as tar:
-        for filename in tar.getnames():
-            if filename.endswith(('.pyd', '.so')):
-                filename_match = c_extension_pattern.match(filename)
-                import_name = 'import {}' .format(filename_match.group(3).replace('/', '.'))
-                imports.append(import_name)
+        return c_extension_imports(tar.getnames())
 
-    return imports
 
-
-def retrieve_package_platform(file_path):
-    """Retrieve the platform and architecture of the source package.
+def package_platform(index):
+    """Retrieve the platform and architecture from a package's index.json contents.
 
     Positional arguments:
-    file_path (str) -- the file path to the source package tar file
+    index (dict) -- the source package's parsed info/index.json
     """
-    with tarfile.open(file_path) as tar:
-        index = json.loads(tar.extractfile('info/index.json').read().decode('utf-8'))
-
     platform = index['platform']
     architecture = '64' if index['arch'] == 'x86_64' else '32'
 
@@ -66,6 +82,28 @@ def retrieve_package_platform(file_path):
         raise RuntimeError('Package platform not recognized.')
 
 
+def retrieve_package_platform(file_path):
+    """Retrieve the platform and architecture of the source package.
+
+    Positional arguments:
+    file_path (str) -- the file path to the source package tar file
+    """
+    return package_platform(read_index(file_path))
+
+
+def index_python_version(index):
+    """Retrieve the python version, like 'python3.6', from the build string in index.json.
+
+    Positional arguments:
+    index (dict) -- the source package's parsed info/index.json
+    """
+    build_version_number = re.search('(.*)?(py)(\d\d)(.*)?', index['build']).group(3)
+    build_version = re.sub('\A.*py\d\d.*\Z', 'python', index['build'])
+
+    return '{}{}.{}' .format(build_version,
+        build_version_number[0], build_version_number[1])
+
+
 def retrieve_python_version(file_path):
     """Retrieve the python version from a path.
 
@@ -99,26 +137,21 @@ def retrieve_python_version(file_path):
             with open(path_file) as index_file:
                 index = json.load(index_file)
 
-        build_version_number = re.search('(.*)?(py)(\d\d)(.*)?', index['build']).group(3)
-        build_version = re.sub('\A.*py\d\d.*\Z', 'python', index['build'])
+        return index_python_version(index)
 
-        return '{}{}.{}' .format(build_version,
-            build_version_number[0], build_version_number[1])
 
-
-def extract_temporary_directory(file_path):
-    """Extract the source tar archive contents to a temporary directory.
+def read_index(file_path):
+    """Read the source package's info/index.json, and no further into the package.
 
     Positional arguments:
     file_path (str) -- the file path to the source package tar file
     """
-    temporary_directory = tempfile.mkdtemp()
-
-    source = tarfile.open(file_path)
-    source.extractall(temporary_directory)
-    source.close()
+    with tarfile.open(file_path, 'r|*') as tar:
+        for member in tar:
+            if member.name == 'info/index.json':
+                return json.loads(tar.extractfile(member).read().decode('utf-8'))
 
-    return temporary_directory
+    raise RuntimeError('No info/index.json in {}' .format(file_path))
 
 
 def update_dependencies(new_dependencies, existing_dependencies):
@@ -152,21 +185,17 @@ def update_dependencies(new_dependencies, existing_dependencies):
     return existing_dependencies
 
 
-def update_index_file(temp_dir, target_platform, dependencies, verbose):
-    """Update the source package's index file with the target platform's information.
+def converted_index(index, target_platform, dependencies, verbose):
+    """Return a copy of the source package's index with the target platform's information.
 
     Positional arguments:
-    temp_dir (str) -- the file path to the temporary directory that contains
-        the source package's extracted contents
+    index (dict) -- the source package's parsed info/index.json
     target_platform (str) -- the target platform and architecture in
         the form of platform-architecture such as linux-64
     dependencies (List[str]) -- the dependencies passed from the command line
     verbose (bool) -- show output of items that are updated
     """
-    index_file = os.path.join(temp_dir, 'info/index.json')
-
-    with open(index_file) as file:
-        index = json.load(file)
+    index = copy.deepcopy(index)
 
     platform, architecture = target_platform.split('-')
     source_architecture = '64' if index['arch'] == 'x86_64' else '32'
@@ -183,183 +212,33 @@ def update_index_file(temp_dir, target_platform, dependencies, verbose):
     if dependencies:
         index['depends'] = update_dependencies(dependencies, index['depends'])
 
-    with open(index_file, 'w') as file:
-        json.dump(index, file)
-
-    return index_file
-
-
-def update_lib_path(path, target_platform, temp_dir=None):
-    """Update the lib path found in the source package's paths.json file.
-
-    For conversions from unix to windows, the 'lib/pythonx.y/' paths are
-    renamed to 'Lib/' and vice versa for conversions from windows to unix.
-
-    Positional arguments:
-    path (str) -- path to rename in the paths.json file
-    target_platform (str) -- the platform to target: 'unix' or 'win'
-
-    Keyword arguments:
-    temp_dir (str) -- the file path to the temporary directory that
-        contains the source package's extracted contents
-    """
-    if target_platform == 'win':
-        python_version = retrieve_python_version(path)
-        renamed_lib_path = re.sub('\Alib', 'Lib', path).replace(python_version, '')
-
-    elif target_platform == 'unix':
-        python_version = retrieve_python_version(temp_dir)
-        renamed_lib_path = re.sub('\ALib', os.path.join('lib', python_version), path)
-
-    return os.path.normpath(renamed_lib_path)
-
-
-def update_lib_contents(lib_directory, temp_dir, target_platform, file_path):
-    """Update the source package's 'lib' directory.
+    return index
 
-    When converting from unix to windows, the 'lib' directory is renamed to
-    'Lib' and the contents inside the 'pythonx.y' directory are renamed to
-    exclude the 'pythonx.y' prefix. When converting from windows to unix,
-    the 'Lib' is renamed to 'lib' and the pythonx.y' prefix is added.
 
-    Positional arguments:
-    lib_directory (str) -- the file path to the 'lib' directory located in the
-        temporary directory that stores the package contents
-    temp_dir (str) -- the file path to the temporary directory that contains
-        the source package's extracted contents
-    target_platform (str) -- the platform to target: 'unix' or win'
-    file_path (str) -- the file path to the source package tar file
-    """
-    if target_platform == 'win':
-        try:
-            for lib_file in glob.iglob('{}/python*/**' .format(lib_directory)):
-                if 'site-packages' in lib_file:
-                    new_site_packages_path = os.path.join(temp_dir, 'lib/site-packages')
-                    os.renames(lib_file, new_site_packages_path)
-                else:
-                    if retrieve_python_version(lib_file) is not None:
-                        python_version = retrieve_python_version(lib_file)
-                        os.renames(lib_file, lib_file.replace(python_version, ''))
-        except OSError:
-            pass
-
-        try:
-            shutil.rmtree(glob.glob('{}/python*' .format(lib_directory))[0])
-        except IndexError:
-            pass
-
-        os.rename(os.path.join(temp_dir, 'lib'), os.path.join(temp_dir, 'Lib'))
-
-    elif target_platform == 'unix':
-        try:
-            for lib_file in glob.iglob('{}/**' .format(lib_directory)):
-                python_version = retrieve_python_version(file_path)
-                new_lib_file = re.sub('Lib', os.path.join('lib', python_version), lib_file)
-                os.renames(lib_file, new_lib_file)
-
-            os.rename(os.path.join(temp_dir, 'Lib'), os.path.join(temp_dir, 'lib'))
-
-        except OSError:
-            pass
-
-
-def update_executable_path(file_path, target_platform):
-    """Update the name of the executable files found in the paths.json file.
+def retrieve_executable_name(executable):
+    """Retrieve the name of the executable to rename.
 
-    When converting from unix to windows, executables are renamed with a '-script.py'
-    suffix. When converting from windows to unix, this suffix is removed. The
-    paths in paths.json need to be updated accordingly.
+    When converting between unix and windows, we need to be careful
+    that the executables are renamed without their file extensions.
 
     Positional arguments:
-    file_path (str) -- the file path to the executable to rename in paths.json
-    target_platform (str) -- the platform to target: 'unix' or 'win'
+    executable (str) -- the executable to rename including its file extension
     """
-    if target_platform == 'win':
-        renamed_path = os.path.splitext(re.sub('\Abin', 'Scripts', file_path))[0]
-        renamed_executable_path = '{}-script.py' .format(renamed_path)
-
-    elif target_platform == 'unix':
-        renamed_path = os.path.splitext(re.sub('\AScripts', 'bin', file_path))[0]
-        renamed_executable_path = renamed_path.replace('-script.py', '')
-
-    return renamed_executable_path
-
+    return os.path.splitext(os.path.basename(executable))[0]
 
-def add_new_windows_path(executable_directory, executable):
-    """Add a new path to the paths.json file.
 
-    When an executable is renamed during a unix to windows conversion, a
-    an exe is also created. The paths.json file is updated with the
-    exe file's information.
+def is_binary_data(file_contents):
+    """Check whether the start of a file's contents is binary rather than text.
 
-    Positional arguments:
-    executable_directory (str) -- the file path to temporary directory's 'Scripts' directory
-    executable (str) -- the filename of the script to add to paths.json
-    """
-    with open(os.path.join(executable_directory, executable), 'rb') as script_file:
-        script_file_contents = script_file.read()
-        new_path = {"_path": "Scripts/{}" .format(executable),
-                    "path_type": "hardlink",
-                    "sha256": hashlib.sha256(script_file_contents).hexdigest(),
-                    "size_in_bytes": os.path.getsize(
-                        os.path.join(executable_directory, executable))
-                    }
-    return new_path
-
-
-def update_paths_file(temp_dir, target_platform):
-    """Update the paths.json file when converting between platforms.
+    Source: https://stackoverflow.com/questions/898669/
 
     Positional arguments:
-    temp_dir (str) -- the file path to the temporary directory containing the source
-        package's extracted contents
-    target_platform (str) -- the platform to target: 'unix' or 'win'
+    file_contents (bytes) -- the contents of the file, or at least its first 1024 bytes
     """
-    paths_file = os.path.join(temp_dir, 'info/paths.json')
-
-    if os.path.isfile(paths_file):
-        with open(paths_file) as file:
-            paths = json.load(file)
-
-        if target_platform == 'win':
-            for path in paths['paths']:
-                if path['_path'].startswith('lib'):
-                    path['_path'] = update_lib_path(path['_path'], 'win')
-
-                elif path['_path'].startswith('bin'):
-                    path['_path'] = update_executable_path(path['_path'], 'win')
-
-            script_directory = os.path.join(temp_dir, 'Scripts')
-            if os.path.isdir(script_directory):
-                for script in os.listdir(script_directory):
-                    if script.endswith('.exe'):
-                        paths['paths'].append(add_new_windows_path(script_directory, script))
-
-        elif target_platform == 'unix':
-            for path in paths['paths']:
-                if path['_path'].startswith('Lib'):
-                    path['_path'] = update_lib_path(path['_path'], 'unix', temp_dir)
-
-                elif path['_path'].startswith('Scripts'):
-                    path['_path'] = update_executable_path(path['_path'], 'unix')
-
-                if path['_path'].endswith(('.bat', '.exe')):
-                    paths['paths'].remove(path)
-
-        with open(paths_file, 'w') as file:
-            json.dump(paths, file)
-
-
-def retrieve_executable_name(executable):
-    """Retrieve the name of the executable to rename.
+    text_characters = bytearray({7, 8, 9, 10, 12, 13, 27}.union(
+        set(range(0x20, 0x100)) - {0x7f}))
 
-    When converting between unix and windows, we need to be careful
-    that the executables are renamed without their file extensions.
-
-    Positional arguments:
-    executable (str) -- the executable to rename including its file extension
-    """
-    return os.path.splitext(os.path.basename(executable))[0]
+    return bool(file_contents[:1024].translate(None, text_characters))
 
 
 def is_binary_file(directory, executable):
@@ -368,8 +247,6 @@ def is_binary_file(directory, executable):
     When converting files, we need to check that binary files are not
     converted.
 
-    Source: https://stackoverflow.com/questions/898669/
-
     Positional arguments:
     directory (str) -- the file path to the 'bin' or 'Scripts' directory
     executable (str) -- the name of the executable to rename
@@ -378,81 +255,15 @@ def is_binary_file(directory, executable):
 
     if os.path.isfile(file_path):
         with open(file_path, 'rb') as buffered_file:
-            file_contents = buffered_file.read(1024)
-
-        text_characters = bytearray({7, 8, 9, 10, 12, 13, 27}.union(
-            set(range(0x20, 0x100)) - {0x7f}))
-
-        return bool(file_contents.translate(None, text_characters))
+            return is_binary_data(buffered_file.read(1024))
 
     return False
 
 
-def rename_executable(directory, executable, target_platform):
-    """Rename an executable file when converting between platforms.
-
-    When converting from unix to windows, each file inside the 'bin' directory
-    is renamed to include '-script.py' as a suffix. When converting from windows
-    to unix, each executable inside the 'Scripts' directory has its '-script.py'
-    suffix removed.
+def read_exe_file(target_platform):
+    """Read the exe launcher added for each script during a unix to windows conversion.
 
     Positional arguments:
-    directory (str) -- the file path to the 'bin' or 'Scripts' directory
-    executable (str) -- the name of the executable to rename
-    target_platform (str) -- the platform to target: 'unix' or 'win'
-    """
-    old_executable_path = os.path.join(directory, executable)
-
-    if target_platform == 'win':
-        new_executable_path = os.path.join(directory, '{}-script.py' .format(
-            retrieve_executable_name(executable)))
-
-        with open(old_executable_path) as script_file_in:
-            lines = script_file_in.read().splitlines()
-
-        with open(old_executable_path, 'w') as script_file_out:
-            for line in lines[1:]:
-                script_file_out.write(line + '\n')
-
-        os.renames(old_executable_path, new_executable_path)
-
-    else:
-        if old_executable_path.endswith('.py'):
-
-            new_executable_path = old_executable_path.replace('-script.py', '')
-
-            with open(old_executable_path) as script_file_in:
-                lines = script_file_in.read().splitlines()
-
-            with open(old_executable_path, 'w') as script_file_out:
-                script_file_out.write('#!/opt/anaconda1anaconda2anaconda3/bin/python' + '\n')
-                for line in lines:
-                    script_file_out.write(line + '\n')
-
-            os.renames(old_executable_path, new_executable_path)
-
-
-def remove_executable(directory, executable):
-    """Remove an executable from the 'Scripts' directory.
-
-    When converting from windows to unix, the .exe or .bat files
-    need to be removed as they do not exist in unix packages.
-
-    Positional arguments:
-    directory (str) -- the file path to the 'Scripts' directory
-    executable (str) -- the filename of the executable to remove
-    """
-    if executable.endswith(('.exe', '.bat')):
-        script = os.path.join(directory, executable)
-        os.remove(script)
-
-
-def create_exe_file(directory, executable, target_platform):
-    """Create an exe file for each executable during a unix to windows conversion.
-
-    Positional arguments:
-    directory (str) -- the file path to the 'Scripts' directory
-    executable (str) -- the filename of the executable to create an exe file for
     target_platform -- the platform to target: 'win-64' or 'win-32'
     """
     exe_directory = os.path.dirname(__file__)
@@ -463,215 +274,373 @@ def create_exe_file(directory, executable, target_platform):
     else:
         executable_file = os.path.join(exe_directory, 'cli-64.exe')
 
-    renamed_executable_file = os.path.join(directory, '{}.exe' .format(executable))
-
-    shutil.copyfile(executable_file, renamed_executable_file)
+    with open(executable_file, 'rb') as exe_file:
+        return exe_file.read()
 
 
-def update_prefix_file(temp_dir, prefixes):
-    """Update the source package's 'has_prefix' file.
+def rename_member(name, target_platform, python_version):
+    """Work out the path of a package member on the other operating system.
 
-    Each file in the 'bin' or 'Scripts' folder will be written
-    to the 'has_prefix' file located in the package's 'info' directory.
+    For conversions from unix to windows, 'lib/pythonx.y/' and 'lib/' become
+    'Lib/' and 'bin/' becomes 'Scripts/', and vice versa for conversions from
+    windows to unix.
 
     Positional arguments:
-    temp_dir (str) -- the file path to the temporary directory containing the source
-        package's extracted contents
-    prefixes (List[str])-- the prefixes to write to 'has_prefix'
+    name (str) -- the path of the member in the source package
+    target_platform (str) -- the platform to target: 'unix' or 'win'
+    python_version (str) -- the python version of the package, like 'python3.6'
     """
-    has_prefix_file = os.path.join(temp_dir, 'info/has_prefix')
-
-    with open(has_prefix_file, 'w+') as prefix_file:
-        for prefix in prefixes:
-            prefix_file.write(prefix)
-
+    parts = name.split('/')
 
-def update_files_file(temp_dir, verbose):
-    """Update the source package's 'files' file.
-
-    The file path to each file that will be in the target archive is
-    written to the 'files' file.
-
-    Positional arguments:
-    temp_dir (str) -- the file path to the temporary directory containing the source
-        package's extracted contents
-    verbose (bool) -- show output of items that are updated
-    """
-    files_file = os.path.join(temp_dir, 'info/files')
+    if target_platform == 'win':
+        if parts[0] == 'lib':
+            if len(parts) > 2 and re.match(r'python\d\.\d\Z', parts[1]):
+                parts = parts[1:]
+            parts[0] = 'Lib'
+        elif parts[0] == 'bin':
+            parts[0] = 'Scripts'
 
-    with open(files_file, 'w+') as files:
-        file_paths = []
-        for dirpath, dirnames, filenames in os.walk(temp_dir):
-            for filename in filenames:
-                package_file_path = os.path.join(
-                    dirpath, filename).replace(temp_dir, '').lstrip(os.sep)
-                if not package_file_path.startswith('info'):
-                    # files.write(package_file_path + '\n')
-                    file_paths.append(package_file_path)
+    elif target_platform == 'unix':
+        if parts[0] == 'Lib':
+            parts = ['lib', python_version] + parts[1:]
+        elif parts[0] == 'Scripts':
+            parts[0] = 'bin'
 
-                    if verbose:
-                        print('Updating {}' .format(package_file_path))
+    return '/'.join(parts)
 
-        for file_path in sorted(file_paths):
-            files.write(file_path + '\n')
 
+def convert_script(name, contents, target_platform):
+    """Rewrite a text script found directly in 'bin' or 'Scripts'.
 
-def create_target_archive(file_path, temp_dir, platform, output_dir):
-    """Create the converted package's tar file.
+    When converting from unix to windows, the shebang line is dropped and the
+    script gets a '-script.py' suffix. When converting from windows to unix,
+    scripts with a '-script.py' suffix lose it and get a shebang line; '.bat'
+    files are dropped. Returns the new name, or None to drop the script, and
+    the new contents.
 
     Positional arguments:
-    file_path (str) -- the file path to the source package's tar file
-    temp_dir (str) -- the file path to the temporary directory containing the source
-        package's extracted contents
-    platform (str) -- the platform to convert to: 'win-64', 'win-32', 'linux-64',
-        'linux-32', or 'osx-64'
+    name (str) -- the path of the script in the converted package
+    contents (bytes) -- the contents of the script
+    target_platform (str) -- the platform to target: 'unix' or 'win'
     """
-    output_directory = os.path.join(output_dir, platform)
-
-    if not os.path.isdir(output_directory):
-        os.makedirs(output_directory)
-
-    destination = os.path.join(output_directory, os.path.basename(file_path))
+    lines = contents.splitlines()
 
-    with tarfile.open(destination, 'w:bz2') as target:
-        for dirpath, dirnames, filenames in os.walk(temp_dir):
-            for filename in filenames:
-                destination_file_path = os.path.join(
-                    dirpath, filename).replace(temp_dir, '').lstrip(os.sep)
-                target.add(os.path.join(dirpath, filename), arcname=destination_file_path)
-
-
-def convert_between_unix_platforms(file_path, output_dir, platform, dependencies, verbose):
-    """Convert package between unix platforms.
+    if target_platform == 'win':
+        name = '{}-script.py' .format(os.path.splitext(name)[0])
+        lines = lines[1:]
 
-    Positional arguments:
-    file_path (str) -- the file path to the source package's tar file
-    output_dir (str) -- the file path to where to output the converted tar file
-    platform (str) -- the platform to convert to: 'linux-64', 'linux-32', or 'osx-64'
-    dependencies (List[str]) -- the dependencies passed from the command line
-    verbose (bool) -- show output of items that are updated
-    """
-    temp_dir = extract_temporary_directory(file_path)
+    elif name.endswith('.bat'):
+        return None, None
 
-    update_index_file(temp_dir, platform, dependencies, verbose)
+    elif name.endswith('.py'):
+        name = name.replace('-script.py', '')
+        lines = [b'#!/opt/anaconda1anaconda2anaconda3/bin/python'] + lines
 
-    create_target_archive(file_path, temp_dir, platform, output_dir)
+    else:
+        return name, contents
 
-    # we need to manually remove the temporary directory created by tempfile.mkdtemp
-    shutil.rmtree(temp_dir)
+    return name, b''.join(line + b'\n' for line in lines)
 
 
-def convert_between_windows_architechtures(file_path, output_dir, platform,
-                                           dependencies, verbose):
-    """Convert package between windows architectures.
+def is_script(name):
+    """Whether a member may be a script to rewrite: a file right in 'bin' or 'Scripts'.
 
     Positional arguments:
-    file_path (str) -- the file path to the source package's tar file
-    output_dir (str) -- the file path to where to output the converted tar file
-    platform (str) -- the platform to convert to: 'win-64' or 'win-32'
-    dependencies (List[str]) -- the dependencies passed from the command line
-    verbose (bool) -- show output of items that are updated
+    name (str) -- the path of the member in the source package
     """
-    temp_dir = extract_temporary_directory(file_path)
+    directory, filename = os.path.split(name)
+    return directory in ('bin', 'Scripts') and not filename.startswith('.')
 
-    update_index_file(temp_dir, platform, dependencies, verbose)
 
-    create_target_archive(file_path, temp_dir, platform, output_dir)
+# the end of a target package, or of the source package when a conversion is given up
+_end = object()
 
-    # we need to manually remove the temporary directory created by tempfile.mkdtemp
-    shutil.rmtree(temp_dir)
 
+class _Aborted(Exception):
+    pass
 
-def convert_from_unix_to_windows(file_path, output_dir, platform, dependencies, verbose):
-    """Convert a package from a unix platform to windows.
 
-    Positional arguments:
-    file_path (str) -- the file path to the source package's tar file
-    output_dir (str) -- the file path to where to output the converted tar file
-    platform (str) -- the platform to convert to: 'win-64' or 'win-32'
-    dependencies (List[str]) -- the dependencies passed from the command line
-    verbose (bool) -- show output of items that are updated
-    """
-    temp_dir = extract_temporary_directory(file_path)
-
-    prefixes = set()
-
-    for entry in os.listdir(temp_dir):
-        directory = os.path.join(temp_dir, entry)
-        if os.path.isdir(directory) and entry.strip(os.sep) == 'lib':
-            update_lib_contents(directory, temp_dir, 'win', file_path)
-
-        if os.path.isdir(directory) and entry.strip(os.sep) == 'bin':
-            for script in os.listdir(directory):
-                if (os.path.isfile(os.path.join(directory, script)) and
-                        not is_binary_file(directory, script) and
-                        not script.startswith('.')):
-                    rename_executable(directory, script, 'win')
-                    create_exe_file(directory, retrieve_executable_name(script),
-                                      platform)
-
-                    prefixes.add('/opt/anaconda1anaconda2anaconda3 text Scripts/{}-script.py\n'
-                        .format(retrieve_executable_name(script)))
+class _QueueReader(object):
+    """The contents of one member, read from the chunks put on a target package's queue."""
 
-            new_bin_path = os.path.join(temp_dir, 'Scripts')
-            os.renames(directory, new_bin_path)
+    def __init__(self, queue):
+        self.queue = queue
+        self.chunk = b''
+        self.offset = 0
 
-    update_index_file(temp_dir, platform, dependencies, verbose)
-    update_prefix_file(temp_dir, prefixes)
-    update_paths_file(temp_dir, target_platform='win')
-    update_files_file(temp_dir, verbose)
+    def read(self, size):
+        parts = []
+        while size > 0:
+            if self.offset == len(self.chunk):
+                self.chunk = self.queue.get()
+                self.offset = 0
+                if self.chunk is _end:
+                    raise _Aborted()
+            part = self.chunk[self.offset:self.offset + size]
+            self.offset += len(part)
+            size -= len(part)
+            parts.append(part)
+        return b''.join(parts)
 
-    create_target_archive(file_path, temp_dir, platform, output_dir)
 
-    shutil.rmtree(temp_dir)
+class TargetPackage(object):
+    """The source package converted to one platform, written while the source is read.
 
+    Members are handed over as they come out of the source package and are written
+    on a thread of the target's own, so all targets compress at the same time. Only
+    info/ files and scripts are held in memory; other members pass through in chunks.
+    """
 
-def convert_from_windows_to_unix(file_path, output_dir, platform, dependencies, verbose):
-    """Convert a package from windows to a unix platform.
+    def __init__(self, file_path, index, platform, conversion_platform, dependencies,
+                 verbose, output_dir):
+        self.platform = platform
+        self.target_platform = 'win' if platform.startswith('win') else 'unix'
+        self.other_os = self.target_platform != conversion_platform
+        self.python_version = (index_python_version(index)
+                               if self.other_os and self.target_platform == 'unix' else None)
+        self.index = converted_index(index, platform, dependencies, verbose)
+        self.verbose = verbose
+
+        # source member name -> target member name, None for members that are dropped
+        self.renames = {}
+        # target member name -> new contents
+        self.contents = {}
+        # the info/ files that are rewritten once every member is known
+        self.info = {}
+        self.names = []
+        self.new_names = []
+        self.prefixes = set()
+
+        output_directory = os.path.join(output_dir, platform)
+        if not os.path.isdir(output_directory):
+            os.makedirs(output_directory)
+        self.destination = os.path.join(output_directory, os.path.basename(file_path))
+
+        self.error = None
+        # at most a few chunks wait for each target
+        self.queue = queue.Queue(maxsize=8)
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _write(self):
+        ended = False
+        try:
+            with tarfile.open(self.destination, 'w:bz2') as target:
+                try:
+                    while True:
+                        item = self.queue.get()
+                        if item is _end:
+                            ended = True
+                            break
+                        member, data = item
+                        if data is not None:
+                            target.addfile(member, io.BytesIO(data))
+                        elif member.isreg():
+                            target.addfile(member, _QueueReader(self.queue))
+                        else:
+                            target.addfile(member)
+                except _Aborted:
+                    ended = True
+        except Exception as e:
+            self.error = e
+            # keep taking what the source reader hands over, so that it never waits for us
+            while not ended:
+                ended = self.queue.get() is _end
+
+    def _put(self, member, name, data=None):
+        target_member = copy.copy(member)
+        target_member.name = name
+        if member.islnk():
+            target_member.linkname = self.renames.get(member.linkname) or member.linkname
+        if data is not None:
+            target_member.size = len(data)
+        if not name.startswith('info/'):
+            self.names.append(name)
+        self.queue.put((target_member, data))
+
+    def _new_member(self, name, data):
+        member = tarfile.TarInfo(name)
+        member.size = len(data)
+        member.mode = 0o755 if name.endswith('.exe') else 0o644
+        member.mtime = time.time()
+        if not name.startswith('info/'):
+            self.contents[name] = data
+            self.new_names.append(name)
+        self._put(member, name, data)
+
+    def add(self, member, data):
+        """Add a member whose whole contents were read, like an info/ file or a text script.
+
+        Positional arguments:
+        member (TarInfo) -- the member of the source package
+        data (bytes) -- the contents of the member
+        """
+        if member.name == 'info/index.json':
+            data = json.dumps(self.index).encode('utf-8')
+        elif self.other_os and member.name in ('info/files', 'info/has_prefix',
+                                               'info/paths.json'):
+            self.info[member.name] = data
+            return
+        elif self.other_os and is_script(member.name) and member.isreg():
+            name = rename_member(member.name, self.target_platform, self.python_version)
+            if self.target_platform == 'unix' and name.endswith('.exe'):
+                self.renames[member.name] = None
+                return
+            name, data = convert_script(name, data, self.target_platform)
+            self.renames[member.name] = name
+            if name is None:
+                return
+            self.contents[name] = data
+            self.prefixes.add('/opt/anaconda1anaconda2anaconda3 text {}\n' .format(name))
+            self._put(member, name, data)
+            if self.target_platform == 'win':
+                self._new_member('{}.exe' .format(name[:-len('-script.py')]),
+                                 read_exe_file(self.platform))
+            return
+        name = member.name
+        if self.other_os and not name.startswith('info/'):
+            name = rename_member(name, self.target_platform, self.python_version)
+        self.renames[member.name] = name
+        self._put(member, name, data)
+
+    def add_member(self, member):
+        """Add a member whose contents, if any, follow through add_chunk. Returns whether
+        the member is in the target package at all.
+
+        Positional arguments:
+        member (TarInfo) -- the member of the source package
+        """
+        name = member.name
+        if self.other_os and not name.startswith('info/'):
+            if (self.target_platform == 'unix' and is_script(name) and
+                    name.endswith('.exe')):
+                self.renames[name] = None
+                return False
+            name = rename_member(name, self.target_platform, self.python_version)
+        self.renames[member.name] = name
+        self._put(member, name)
+        return True
+
+    def add_chunk(self, chunk):
+        self.queue.put(chunk)
+
+    def finish(self):
+        """Write the info/ files that depend on all members and close the target package."""
+        if self.other_os:
+            if self.verbose:
+                for name in sorted(self.names):
+                    print('Updating {}' .format(name))
+            self._new_member('info/files', ''.join(
+                name + '\n' for name in sorted(self.names)).encode('utf-8'))
+            self._new_member('info/has_prefix', ''.join(sorted(self.prefixes)).encode('utf-8'))
+            if 'info/paths.json' in self.info:
+                self._new_member('info/paths.json', json.dumps(self.paths()).encode('utf-8'))
+        self.queue.put(_end)
+        self.thread.join()
+        if self.error:
+            raise self.error
+        return self.destination
+
+    def abort(self):
+        """Give up on the target package and remove what was written of it."""
+        if self.thread.is_alive():
+            self.queue.put(_end)
+            self.thread.join()
+        if os.path.isfile(self.destination):
+            os.remove(self.destination)
+
+    def paths(self):
+        """The source package's paths.json, updated to the renamed, rewritten and new
+        members."""
+        paths = json.loads(self.info['info/paths.json'].decode('utf-8'))
+        for path in paths['paths']:
+            path['_path'] = self.renames.get(path['_path'], path['_path'])
+        paths['paths'] = [path for path in paths['paths'] if path['_path']]
+        paths['paths'].extend({'_path': name, 'path_type': 'hardlink'}
+                              for name in self.new_names)
+        for path in paths['paths']:
+            if path['_path'] in self.contents:
+                data = self.contents[path['_path']]
+                path['sha256'] = hashlib.sha256(data).hexdigest()
+                path['size_in_bytes'] = len(data)
+        return paths
+
+
+# size of the blocks the contents of members are copied in
+_chunk_size = 1024 * 1024
+
+
+def convert_package(file_path, targets, force):
+    """Read the source package once, from front to back, and hand every member over to
+    each target package. Returns the converted packages.
 
     Positional arguments:
     file_path (str) -- the file path to the source package's tar file
-    output_dir (str) -- the file path to where to output the converted tar file
-    platform (str) -- the platform to convert to: 'linux-64', 'linux-32', or 'osx-64'
-    dependencies (List[str]) -- the dependencies passed from the command line
-    verbose (bool) -- show output of items that are updated
+    targets (List[TargetPackage]) -- the packages to write
+    force (bool) -- force conversion of packages that contain C extensions
     """
-    retrieve_python_version(file_path)
-    temp_dir = extract_temporary_directory(file_path)
-
-    prefixes = set()
-
-    for entry in os.listdir(temp_dir):
-        directory = os.path.join(temp_dir, entry)
-        if os.path.isdir(directory) and 'Lib' in directory:
-            update_lib_contents(directory, temp_dir, 'unix', file_path)
-
-        if os.path.isdir(directory) and 'Scripts' in directory:
-            for script in os.listdir(directory):
-                if not is_binary_file(directory, script) and not script.startswith('.'):
-                    rename_executable(directory, script, 'unix')
-                    remove_executable(directory, script)
-
-                    prefixes.add('/opt/anaconda1anaconda2anaconda3 text bin/{}\n'
-                        .format(retrieve_executable_name(script)))
-
-            new_bin_path = os.path.join(temp_dir, 'bin')
-            os.renames(directory, new_bin_path)
-
-    update_index_file(temp_dir, platform, dependencies, verbose)
-    update_prefix_file(temp_dir, prefixes)
-    update_paths_file(temp_dir, target_platform='unix')
-    update_files_file(temp_dir, verbose)
-
-    create_target_archive(file_path, temp_dir, platform, output_dir)
-
-    shutil.rmtree(temp_dir)
+    try:
+        with tarfile.open(file_path, 'r|*') as source:
+            for member in source:
+                if member.isdir():
+                    continue
+
+                if not force and c_extension_imports([member.name]):
+                    raise SystemExit('WARNING: Package {} contains C extensions; skipping '
+                                     'conversion. Use -f to force conversion.'
+                                     .format(os.path.basename(file_path)))
+
+                if not member.isreg():
+                    for target in targets:
+                        target.add_member(member)
+                    continue
+
+                member_file = source.extractfile(member)
+                chunk = b''
+                if member.name.startswith('info/'):
+                    chunk = member_file.read()
+                elif is_script(member.name):
+                    chunk = member_file.read(1024)
+                    if not is_binary_data(chunk):
+                        chunk += member_file.read()
+                if member.name.startswith('info/') or (is_script(member.name) and
+                                                       len(chunk) == member.size and
+                                                       not is_binary_data(chunk)):
+                    for target in targets:
+                        target.add(member, chunk)
+                    continue
+
+                receivers = [target for target in targets if target.add_member(member)]
+                chunk = chunk or member_file.read(_chunk_size)
+                while chunk:
+                    for target in receivers:
+                        target.add_chunk(chunk)
+                    chunk = member_file.read(_chunk_size)
+    except BaseException:
+        for target in targets:
+            target.abort()
+        raise
+
+    destinations = []
+    for index, target in enumerate(targets):
+        try:
+            destinations.append(target.finish())
+        except BaseException:
+            for target in targets[index:]:
+                target.abort()
+            raise
+    return destinations
 
 
 def conda_convert(file_path, output_dir=".", show_imports=False, platforms=None, force=False,
                   dependencies=None, verbose=False, quiet=False, dry_run=False):
     """Convert a conda package between different platforms and architectures.
 
+    The source package is read once, as a stream: its members are renamed or
+    rewritten on their way into the package of each target platform, and all
+    target packages are written at the same time. Nothing is extracted to disk.
+
     Positional arguments:
     file_path (str) -- the file path to the source package's tar file
     output_dir (str) -- the file path to where to output the converted tar file
@@ -697,39 +666,178 @@ def conda_convert(file_path, output_dir=".", show_imports=False, platforms=None,
     if not show_imports and len(platforms) == 0:
         sys.exit('Error: --platform option required for conda package conversion.')
 
-    if len(retrieve_c_extensions(file_path)) > 0 and not force:
-        sys.exit('WARNING: Package {} contains C extensions; skipping conversion. '
-                 'Use -f to force conversion.' .format(os.path.basename(file_path)))
-
-    conversion_platform, source_platform, architecture = retrieve_package_platform(file_path)
+    index = read_index(file_path)
+    conversion_platform, source_platform, architecture = package_platform(index)
     source_platform_architecture = '{}-{}' .format(source_platform, architecture)
 
     if 'all' in platforms:
         platforms = ['osx-64', 'linux-32', 'linux-64', 'win-32', 'win-64']
 
-    for platform in platforms:
+    targets = []
+    try:
+        for platform in platforms:
 
-        if platform == source_platform_architecture:
-            print("Source platform '{}' and target platform '{}' are identical. "
-                  "Skipping conversion." .format(source_platform_architecture, platform))
-            continue
+            if platform == source_platform_architecture:
+                print("Source platform '{}' and target platform '{}' are identical. "
+                      "Skipping conversion." .format(source_platform_architecture, platform))
+                continue
+
+            if not quiet:
+                print('Converting {} from {} to {}' .format(
+                        os.path.basename(file_path), source_platform_architecture, platform))
+
+            targets.append(TargetPackage(file_path, index, platform, conversion_platform,
+                                         dependencies, verbose, output_dir))
+    except BaseException:
+        for target in targets:
+            target.abort()
+        raise
+
+    if not targets:
+        return []
+    return convert_package(file_path, targets, force)
 
-        if not quiet:
-            print('Converting {} from {} to {}' .format(
-                    os.path.basename(file_path), source_platform_architecture, platform))
 
-        if platform.startswith(('osx', 'linux')) and conversion_platform == 'unix':
-            convert_between_unix_platforms(file_path, output_dir, platform,
-                                           dependencies, verbose)
+def find_packages(paths):
+    """Expand directories and glob patterns to the package files they hold.
 
-        elif platform.startswith('win') and conversion_platform == 'unix':
-            convert_from_unix_to_windows(file_path, output_dir, platform,
-                                         dependencies, verbose)
+    Positional arguments:
+    paths (List[str]) -- package files, directories of package files, or glob patterns
+    """
+    packages = []
+    for path in paths:
+        if os.path.isdir(path):
+            packages.extend(sorted(glob.glob(os.path.join(path, '*.tar.bz2'))))
+        elif glob.has_magic(path):
+            packages.extend(sorted(glob.glob(path)))
+        else:
+            packages.append(path)
+    return [os.path.abspath(package) for package in packages]
+
+
+# what a batch conversion records in output_dir about each source package
+conversion_record = '.conda_convert.json'
+
+
+def load_conversion_records(output_dir):
+    """Read what earlier batch conversions into output_dir recorded.
+
+    Positional arguments:
+    output_dir (str) -- the file path to where the converted tar files are written
+    """
+    try:
+        with open(os.path.join(output_dir, conversion_record)) as record_file:
+            return json.load(record_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def is_up_to_date(record, key, platforms, output_dir):
+    """Whether an earlier conversion of the same source with the same options still covers
+    every requested platform and its outputs are all still there.
+
+    Positional arguments:
+    record (dict) -- what was recorded about the source package, if anything
+    key (dict) -- the sha256 of the source package and the options of this conversion
+    platforms (List[str]) -- the platforms to convert to
+    output_dir (str) -- the file path to where the converted tar files are written
+    """
+    return (bool(record) and record['key'] == key and
+            set(platforms) <= set(record['platforms']) and
+            all(os.path.isfile(os.path.join(output_dir, output))
+                for output in record['outputs']))
+
+
+def _convert_one(args):
+    """conda_convert in a worker process. Returns the source package, the converted
+    packages and why the conversion failed, if it did. Packages that conda_convert
+    refuses to convert (C extensions without force) are not failures; they just have
+    no outputs."""
+    file_path, output_dir, platforms, force, dependencies, verbose, quiet = args
+    try:
+        return file_path, conda_convert(file_path, output_dir=output_dir, platforms=platforms,
+                                        force=force, dependencies=dependencies,
+                                        verbose=verbose, quiet=quiet), None
+    except SystemExit as e:
+        print(e, file=sys.stderr)
+        return file_path, [], None
+    except Exception as e:
+        return file_path, [], '{}: {}' .format(type(e).__name__, e)
+
+
+def conda_convert_batch(paths, output_dir=".", platforms=None, force=False, dependencies=None,
+                        verbose=False, quiet=False, processes=None, dry_run=False):
+    """Convert many conda packages, for example a whole channel subdirectory.
+
+    Packages whose converted outputs are up to date with the source package (by its
+    sha256) and the options given are skipped. The others are converted on a pool of
+    processes, and each output subdirectory is indexed once at the end. Returns the
+    source packages that could not be converted, with the reason.
+
+    Positional arguments:
+    paths (List[str]) -- package files, directories of package files, or glob patterns
+    output_dir (str) -- the file path to where to output the converted tar files
+    platforms (List[str]) -- the platforms to convert to: 'win-64', 'win-32', 'linux-64',
+        'linux-32', 'osx-64', or 'all'
+    force (bool) -- force conversion of packages that contain C extensions
+    dependencies (List[str]) -- the new dependencies to add to each source package's
+        existing dependencies
+    verbose (bool) -- show output of items that are updated
+    quiet (bool) -- hide all output except warnings and errors
+    processes (int) -- how many packages to convert at the same time; all cpus by default
+    dry_run (bool) -- only show which packages would be converted; nothing is written
+    """
+    from conda_build import checksums
+    from conda_build.index import update_index
 
-        elif platform.startswith(('osx', 'linux')) and conversion_platform == 'win':
-            convert_from_windows_to_unix(file_path, output_dir, platform,
-                                         dependencies, verbose)
+    if not platforms:
+        sys.exit('Error: --platform option required for conda package conversion.')
+    if 'all' in platforms:
+        platforms = ['osx-64', 'linux-32', 'linux-64', 'win-32', 'win-64']
 
-        elif platform.startswith('win') and conversion_platform == 'win':
-            convert_between_windows_architechtures(file_path, output_dir, platform,
-                                                   dependencies, verbose)
+    output_dir = os.path.abspath(output_dir)
+    records = load_conversion_records(output_dir)
+    keys = {}
+    jobs = []
+    for file_path in find_packages(paths):
+        keys[file_path] = {'sha256': checksums.file_hashes(file_path, ('sha256', ))['sha256'],
+                           'dependencies': sorted(dependencies or []),
+                           'force': bool(force)}
+        if is_up_to_date(records.get(file_path), keys[file_path], platforms, output_dir):
+            if not quiet:
+                print('{} is up to date' .format(os.path.basename(file_path)))
+            continue
+        jobs.append((file_path, output_dir, platforms, force, dependencies, verbose, quiet))
+
+    if dry_run:
+        for job in jobs:
+            print('Would convert {} to {}' .format(os.path.basename(job[0]),
+                                                   ', '.join(platforms)))
+        return {}
+
+    failed = {}
+    subdirs = set()
+    if jobs:
+        pool = multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(jobs)))
+        try:
+            for file_path, outputs, error in pool.imap_unordered(_convert_one, jobs):
+                if error:
+                    print('Could not convert {}: {}' .format(file_path, error), file=sys.stderr)
+                    failed[file_path] = error
+                    continue
+                records[file_path] = {'key': keys[file_path], 'platforms': platforms,
+                                      'outputs': [os.path.relpath(output, output_dir)
+                                                  for output in outputs]}
+                subdirs.update(os.path.dirname(output) for output in outputs)
+        finally:
+            pool.close()
+            pool.join()
+            if not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+            with open(os.path.join(output_dir, conversion_record), 'w') as record_file:
+                json.dump(records, record_file, indent=2, sort_keys=True)
+
+    for subdir in sorted(subdirs):
+        update_index(subdir, verbose=verbose)
+
+    return failed
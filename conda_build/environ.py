@@ -22,7 +22,7 @@ from .conda_interface import package_cache, TemporaryDirectory
 from .conda_interface import pkgs_dirs, root_dir, symlink_conda
 
 from conda_build import utils
-from conda_build.exceptions import DependencyNeedsBuildingError
+from conda_build.exceptions import DependencyNeedsBuildingError, OfflineRenderError
 from conda_build.features import feature_list
 from conda_build.index import get_build_index
 from conda_build.os_utils import external
@@ -66,7 +66,6 @@ def get_lua_include_dir(config):
     return join(config.host_prefix, "include")
 
 
-@memoized
 def verify_git_repo(git_exe, git_dir, git_url, git_commits_since_tag, debug=False,
                     expected_rev='HEAD'):
     env = os.environ.copy()
@@ -151,7 +150,6 @@ def verify_git_repo(git_exe, git_dir, git_url, git_commits_since_tag, debug=Fals
     return OK
 
 
-@memoized
 def get_git_info(git_exe, repo, debug):
     """
     Given a repo to a git repo, return a dictionary of:
@@ -215,6 +213,46 @@ def get_git_info(git_exe, repo, debug):
     return d
 
 
+# values derived from the work dir's checkout, and executables found on PATH.  Source vars are keyed
+#    by the state of the repository on disk, so they follow checkouts, commits and new tags.  Both
+#    are cleared when source is provided or an environment is created.
+cached_source_vars = {}
+cached_executables = {}
+
+
+def reset_cached_vars():
+    cached_source_vars.clear()
+    cached_executables.clear()
+
+
+def _find_executable(executable, prefix):
+    key = (executable, prefix, os.environ.get('PATH'))
+    if key not in cached_executables:
+        cached_executables[key] = external.find_executable(executable, prefix)
+    return cached_executables[key]
+
+
+def vcs_state(vcs_dir):
+    """Something that changes whenever HEAD, branches or tags of the repository change"""
+    state = []
+    paths = [join(vcs_dir, name) for name in ('HEAD', 'packed-refs', join('refs', 'tags'),
+                                              'dirstate', join('store', '00changelog.i'))]
+    head = join(vcs_dir, 'HEAD')
+    if os.path.isfile(head):
+        with open(head) as f:
+            head_ref = f.read().strip()
+        state.append(head_ref)
+        if head_ref.startswith('ref:'):
+            paths.append(join(vcs_dir, head_ref[4:].strip()))
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        state.append((path, st.st_mtime, st.st_size))
+    return tuple(state)
+
+
 def get_hg_build_info(repo):
     env = os.environ.copy()
     env['HG_DIR'] = repo
@@ -377,7 +415,7 @@ def meta_vars(meta, config):
         # On Windows, subprocess env can't handle unicode.
         git_dir = git_dir.encode(sys.getfilesystemencoding() or 'utf-8')
 
-    git_exe = external.find_executable('git', config.build_prefix)
+    git_exe = _find_executable('git', config.build_prefix)
     if git_exe and os.path.exists(git_dir):
         # We set all 'source' metavars using the FIRST source entry in meta.yaml.
         git_url = meta.get_value('source/0/git_url')
@@ -388,21 +426,30 @@ def meta_vars(meta, config):
             # If git_url is a relative path instead of a url, convert it to an abspath
             git_url = normpath(join(meta.path, git_url))
 
-        _x = False
-
-        if git_url:
-            _x = verify_git_repo(git_exe,
-                                 git_dir,
-                                 git_url,
-                                 config.git_commits_since_tag,
-                                 config.debug,
-                                 meta.get_value('source/0/git_rev', 'HEAD'))
-
-        if _x or meta.get_value('source/0/path'):
-            d.update(get_git_info(git_exe, git_dir, config.debug))
-
-    elif external.find_executable('hg', config.build_prefix) and os.path.exists(hg_dir):
-        d.update(get_hg_build_info(hg_dir))
+        git_rev = meta.get_value('source/0/git_rev', 'HEAD')
+        has_path = bool(meta.get_value('source/0/path'))
+        key = ('git', git_dir, vcs_state(git_dir), git_exe, git_url, git_rev, has_path,
+               config.git_commits_since_tag, config.debug)
+        if key not in cached_source_vars:
+            _x = False
+
+            if git_url:
+                _x = verify_git_repo(git_exe,
+                                     git_dir,
+                                     git_url,
+                                     config.git_commits_since_tag,
+                                     config.debug,
+                                     git_rev)
+
+            cached_source_vars[key] = (get_git_info(git_exe, git_dir, config.debug)
+                                       if _x or has_path else {})
+        d.update(cached_source_vars[key])
+
+    elif _find_executable('hg', config.build_prefix) and os.path.exists(hg_dir):
+        key = ('hg', hg_dir, vcs_state(hg_dir))
+        if key not in cached_source_vars:
+            cached_source_vars[key] = get_hg_build_info(hg_dir)
+        d.update(cached_source_vars[key])
 
     # use `get_value` to prevent early exit while name is still unresolved during rendering
     d['PKG_NAME'] = meta.get_value('package/name')
@@ -857,6 +904,9 @@ def create_env(prefix, specs_or_actions, env, config, subdir, clear_cache=True,
                         log.error("Failed to create env, max retries exceeded.")
                         raise
 
+    # executables and packages in the environment may have changed
+    reset_cached_vars()
+
     if not is_conda:
         # Symlinking conda is critical here to make sure that activate scripts are not
         #    accidentally included in packages.
@@ -909,6 +959,9 @@ def clean_pkg_cache(dist, config):
 
 
 def get_pinned_deps(m, section):
+    if m.config.offline_render:
+        raise OfflineRenderError("pin_depends: strict needs the solver for the {} env of {}"
+                                 .format(section, m.name()))
     with TemporaryDirectory(prefix='_') as tmpdir:
         actions = get_install_actions(tmpdir,
                                     tuple(m.ms_depends(section)), section,
@@ -87,3 +87,8 @@ class DependencyNeedsBuildingError(CondaBuildException):
 
 class RecipeError(CondaBuildException):
     pass
+
+
+class OfflineRenderError(CondaBuildException):
+    """Raised when offline rendering would need channel data or the solver to continue"""
+    pass
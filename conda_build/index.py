@@ -17,9 +17,10 @@ from os.path import isfile, join, getmtime, basename, getsize
 
 from jinja2 import Environment, PackageLoader
 
+from conda_build.checksums import hash_files, md5_file
 from conda_build.utils import file_info, get_lock, try_acquire_locks
 from conda_build import utils, conda_interface
-from .conda_interface import PY3, md5_file, url_path, CondaHTTPError, get_index, human_bytes
+from .conda_interface import PY3, url_path, CondaHTTPError, get_index, human_bytes
 
 local_index_timestamp = 0
 cached_index = None
@@ -116,6 +117,17 @@ def update_index(dir_path, force=False, check_md5=False, remove=True, lock=None,
                 index = {}
 
         files = set(fn for fn in os.listdir(dir_path) if fn.endswith('.tar.bz2'))
+        # packages that need hashing, hashed several at a time.  file_info and the md5 check
+        #    below then find their digests already computed.
+        if check_md5:
+            # read every package again: the point of check_md5 is to catch changes that the
+            #    size and mtime (and so the checksum cache) miss.  The fresh digests replace
+            #    the cached ones, for md5_file and file_info below.
+            hash_files([join(dir_path, fn) for fn in files], ('md5', 'sha256'), cached=False)
+        else:
+            hash_files([join(dir_path, fn) for fn in files
+                        if fn not in index or index[fn]['mtime'] != getmtime(join(dir_path, fn))],
+                       ('md5', 'sha256'))
         for fn in files:
             path = join(dir_path, fn)
             if fn in index:
@@ -15,31 +15,24 @@ import re
 import sys
 import tempfile
 
-from .conda_interface import (iteritems, specs_from_args, is_linked, linked_data, linked,
-                              get_index, which_prefix)
+from .conda_interface import iteritems, specs_from_args, linked_data, get_index
 from .conda_interface import display_actions, install_actions
 
 
 from conda_build.os_utils.ldd import get_linkages, get_package_obj_files, get_untracked_obj_files
 from conda_build.os_utils.macho import get_rpaths, human_filetype
+from conda_build import utils
 from conda_build.utils import (groupby, getter, comma_join, rm_rf, package_has_file, get_logger,
-                               ensure_list)
+                               ensure_list, conda_meta_index)
 
 
 def which_package(path):
     """
     given the path (of a (presumably) conda installed file) iterate over
     the conda packages the file came from.  Usually the iteration yields
-    only one package.
+    only one package.  Kept for callers of this module; see utils.which_package.
     """
-    path = abspath(path)
-    prefix = which_prefix(path)
-    if prefix is None:
-        raise RuntimeError("could not determine conda prefix from: %s" % path)
-    for dist in linked(prefix):
-        meta = is_linked(prefix, dist)
-        if any(abspath(join(prefix, f)) == path for f in meta['files']):
-            yield dist
+    return utils.which_package(path)
 
 
 def print_object_info(info, key):
@@ -194,7 +187,8 @@ def _underlined_text(text):
 
 
 def inspect_linkages(packages, prefix=sys.prefix, untracked=False,
-                     all_packages=False, show_files=False, groupby="package", sysroot=""):
+                     all_packages=False, show_files=False, groupby="package", sysroot="",
+                     linkage_method='pyldd'):
     pkgmap = {}
 
     installed = _installed(prefix)
@@ -208,6 +202,7 @@ def inspect_linkages(packages, prefix=sys.prefix, untracked=False,
     if untracked:
         packages.append(untracked_package)
 
+    pkg_obj_files = {}
     for pkg in ensure_list(packages):
         if pkg == untracked_package:
             dist = untracked_package
@@ -220,10 +215,18 @@ def inspect_linkages(packages, prefix=sys.prefix, untracked=False,
             sys.exit("Error: conda inspect linkages is only implemented in Linux and OS X")
 
         if dist == untracked_package:
-            obj_files = get_untracked_obj_files(prefix)
+            pkg_obj_files[pkg] = get_untracked_obj_files(prefix)
         else:
-            obj_files = get_package_obj_files(dist, prefix)
-        linkages = get_linkages(obj_files, prefix, sysroot)
+            pkg_obj_files[pkg] = get_package_obj_files(dist, prefix)
+
+    # all files of all packages in one go, so they are analysed in parallel
+    all_linkages = get_linkages(sorted(set(f for obj_files in pkg_obj_files.values()
+                                           for f in obj_files)),
+                                prefix, sysroot, method=linkage_method)
+    # which package each file came from, looked up once for all of them
+    owners = conda_meta_index(prefix)[0]
+    for pkg in ensure_list(packages):
+        linkages = {f: all_linkages[f] for f in pkg_obj_files[pkg]}
         depmap = defaultdict(list)
         pkgmap[pkg] = depmap
         depmap['not found'] = []
@@ -233,7 +236,7 @@ def inspect_linkages(packages, prefix=sys.prefix, untracked=False,
                 path = replace_path(binary, path, prefix) if path not in {'',
                                                                             'not found'} else path
                 if path.startswith(prefix):
-                    deps = list(which_package(path))
+                    deps = list(owners.get(abspath(path), ()))
                     if len(deps) > 1:
                         deps_str = [str(dep) for dep in deps]
                         get_logger(__name__).warn("Warning: %s comes from multiple "
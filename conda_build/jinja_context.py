@@ -1,5 +1,6 @@
 from __future__ import absolute_import, division, print_function
 
+import copy
 from functools import partial
 import json
 import os
@@ -7,8 +8,8 @@ import re
 
 import jinja2
 
-from .conda_interface import PY3
-from .environ import get_dict as get_environ
+from .conda_interface import PY3, md5_file
+from .environ import get_dict as get_environ, vcs_state
 from .utils import (get_installed_packages, apply_pin_expressions, get_logger, HashableDict,
                     string_types)
 from .render import get_env_dependencies
@@ -78,15 +79,46 @@ class FilteredLoader(jinja2.BaseLoader):
                              variants_in_place=bool(self.config.variant)), filename, uptodate)
 
 
+# results of load_setup_py_data, keyed by the call and the interpreter that ran setup.py.  Each
+#    entry holds the state of every file that setup.py read, and is only used while those files
+#    (and the work dir's git checkout, for versioneer and friends) are unchanged.
+cached_setup_py_data = {}
+
+
+def _file_states(paths):
+    states = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            states.append((path, st.st_mtime, st.st_size))
+        except OSError:
+            states.append((path, None, None))
+    return tuple(states)
+
+
 def load_setup_py_data(config, setup_file='setup.py', from_recipe_dir=False, recipe_dir=None,
                        permit_undefined_jinja=True):
     _setuptools_data = None
+    read_files = []
+    build_python = config.build_python if os.path.isfile(config.build_python) else None
+    if from_recipe_dir and recipe_dir:
+        setup_path = os.path.abspath(os.path.join(recipe_dir, setup_file))
+    else:
+        setup_path = os.path.join(config.work_dir, setup_file)
+    key = (setup_path, md5_file(setup_path) if os.path.isfile(setup_path) else None,
+           build_python, config.work_dir, from_recipe_dir, recipe_dir, permit_undefined_jinja)
+    git_state = vcs_state(os.path.join(config.work_dir, '.git'))
+    if key in cached_setup_py_data:
+        cached_read_files, states, _setuptools_data = cached_setup_py_data[key]
+        if states == (git_state, _file_states(cached_read_files)):
+            return copy.deepcopy(_setuptools_data)
+
     # we must copy the script into the work folder to avoid incompatible pyc files
     origin_setup_script = os.path.join(os.path.dirname(__file__), '_load_setup_py_data.py')
     dest_setup_script = os.path.join(config.work_dir, '_load_setup_py_data.py')
     copy_into(origin_setup_script, dest_setup_script)
-    if os.path.isfile(config.build_python):
-        args = [config.build_python, dest_setup_script, config.work_dir, setup_file]
+    if build_python:
+        args = [build_python, dest_setup_script, config.work_dir, setup_file]
         if from_recipe_dir:
             assert recipe_dir, 'recipe_dir must be set if from_recipe_dir is True'
             args.append('--from-recipe-dir')
@@ -94,22 +126,33 @@ def load_setup_py_data(config, setup_file='setup.py', from_recipe_dir=False, rec
         if permit_undefined_jinja:
             args.append('--permit-undefined-jinja')
         check_call_env(args, env=get_environ(config))
-        # this is a file that the subprocess will have written
+        # these are files that the subprocess will have written
         with open(os.path.join(config.work_dir, 'conda_build_loaded_setup_py.json')) as f:
             _setuptools_data = json.load(f)
+        read_files_json = os.path.join(config.work_dir, 'conda_build_loaded_setup_py_files.json')
+        with open(read_files_json) as f:
+            read_files = json.load(f)
+        rm_rf(read_files_json)
     else:
         try:
             _setuptools_data = _load_setup_py_data.load_setup_py_data(setup_file,
                                                     from_recipe_dir=from_recipe_dir,
                                                     recipe_dir=recipe_dir,
                                                     work_dir=config.work_dir,
-                                                    permit_undefined_jinja=permit_undefined_jinja)
+                                                    permit_undefined_jinja=permit_undefined_jinja,
+                                                    read_files=read_files)
         except (TypeError, OSError):
             # setup.py file doesn't yet exist.  Will get picked up in future parsings
-            pass
+            key = None
     # cleanup: we must leave the source tree empty unless the source code is already present
     rm_rf(os.path.join(config.work_dir, '_load_setup_py_data.py'))
-    return _setuptools_data if _setuptools_data else {}
+    _setuptools_data = _setuptools_data if _setuptools_data else {}
+    if key:
+        # setup.py itself is covered by the key
+        read_files = sorted(set(read_files) - {dest_setup_script, setup_path})
+        cached_setup_py_data[key] = (read_files, (git_state, _file_states(read_files)),
+                                     _setuptools_data)
+    return copy.deepcopy(_setuptools_data)
 
 
 def load_setuptools(config, setup_file='setup.py', from_recipe_dir=False, recipe_dir=None,
@@ -422,9 +465,12 @@ def context_processor(initial_metadata, recipe_dir, config, permit_undefined_jin
     initial_metadata: Augment the context with values from this MetaData object.
                       Used to bootstrap metadata contents via multiple parsing passes.
     """
-    ctx = get_environ(config=config, m=initial_metadata, for_env=False)
+    env_vars = get_environ(config=config, m=initial_metadata)
     environ = dict(os.environ)
-    environ.update(get_environ(config=config, m=initial_metadata))
+    environ.update(env_vars)
+    # same as get_environ(..., for_env=False): variant values win over everything else
+    ctx = dict(env_vars)
+    ctx.update(config.variant)
 
     ctx.update(
         load_setup_py_data=partial(load_setup_py_data, config=config, recipe_dir=recipe_dir,
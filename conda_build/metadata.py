@@ -24,7 +24,8 @@ from conda_build import exceptions, utils, variants
 from conda_build.features import feature_list
 from conda_build.config import Config, get_or_merge_config
 from conda_build.utils import (ensure_list, find_recipe, expand_globs, get_installed_packages,
-                               HashableDict, trim_empty_keys, filter_files, insert_variant_versions)
+                               HashableDict, trim_empty_keys, filter_files, insert_variant_versions,
+                               CopyOnWriteDict)
 from conda_build.license_family import ensure_valid_license_family
 
 try:
@@ -433,6 +434,7 @@ FIELDS = {
               'pin_depends', 'include_recipe',  # pin_depends is experimental still
               'preferred_env', 'preferred_env_executable_paths', 'run_exports',
               'ignore_run_exports', 'requires_features', 'provides_features',
+              'missing_dso_whitelist', 'error_overlinking',
               },
     'requirements': {'build', 'host', 'run', 'conflicts', 'run_constrained'},
     'app': {'entry', 'icon', 'summary', 'type', 'cli_opts',
@@ -701,6 +703,18 @@ class MetaData(object):
         self.parse_again(permit_undefined_jinja=True, allow_no_other_outputs=True)
         self.config.disable_pip = self.disable_pip
 
+    @property
+    def meta(self):
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        # sections are shared with copies of this object until they are looked up.  See copy().
+        #    Other mapping types (e.g. defaultdicts handed to fromdict) are kept as they are.
+        if type(value) is dict:
+            value = CopyOnWriteDict(value)
+        self._meta = value
+
     @property
     def is_cross(self):
         return bool(self.get_value('requirements/host'))
@@ -1122,11 +1136,16 @@ class MetaData(object):
         hash_ = 'h{0}'.format(hash_.hexdigest())[:self.config.hash_length + 1]
         return hash_
 
-    def build_id(self):
+    @property
+    def build_string_is_manual(self):
+        """True if the recipe sets build/string itself, without h{{ PKG_HASH }} in it"""
         manual_build_string = re.search("\s*string:", self.extract_package_and_build_text())
+        return bool(manual_build_string and not re.findall('h\{\{\s*PKG_HASH\s*\}\}',
+                                                           manual_build_string.string))
+
+    def build_id(self):
         # default; build/string not set
-        if not manual_build_string or re.findall('h\{\{\s*PKG_HASH\s*\}\}',
-                                                 manual_build_string.string):
+        if not self.build_string_is_manual:
             out = build_string_from_metadata(self)
             if self.config.filename_hashing and self.final:
                 if not re.findall('h[0-9a-f]{%s}' % self.config.hash_length, out):
@@ -1514,7 +1533,10 @@ class MetaData(object):
     def copy(self):
         new = copy.copy(self)
         new.config = self.config.copy()
-        new.meta = copy.deepcopy(self.meta)
+        # copies are made for every variant and output, and are often re-parsed right away.
+        #    Sections are only deep-copied when one of the copies looks them up.
+        new.meta = (self.meta.share() if isinstance(self.meta, CopyOnWriteDict) else
+                    copy.deepcopy(self.meta))
         return new
 
     @property
@@ -1,17 +1,22 @@
 from __future__ import absolute_import, division, print_function
 
+import json
+import os
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import sqlite3
 import sys
 import re
 import subprocess
-from os.path import join, basename
+from os.path import join, basename, dirname, isfile, normpath
 
 from conda_build.conda_interface import memoized
-from conda_build.conda_interface import untracked
 from conda_build.conda_interface import linked_data
 
-from conda_build import post
+from conda_build import checksums, post
+from conda_build.utils import get_logger, untracked_files
 from conda_build.os_utils.macho import otool
-from conda_build.os_utils.pyldd import inspect_linkages
+from conda_build.os_utils.pyldd import elf_get_rpath, inspect_linkages, system_library_dirs
 
 LDD_RE = re.compile(r'\s*(.*?)\s*=>\s*(.*?)\s*\(.*\)')
 LDD_NOT_FOUND_RE = re.compile(r'\s*(.*?)\s*=>\s*not found')
@@ -41,38 +46,156 @@ def ldd(path):
     return res
 
 
-@memoized
-def get_linkages(obj_files, prefix, sysroot):
-    res = {}
+def _system_linkages(path):
+    """Linkages as reported by ldd (linux) or otool -L (mac)."""
+    if sys.platform.startswith('linux'):
+        return ldd(path)
+    elif sys.platform.startswith('darwin'):
+        links = otool(path)
+        return [(basename(l['name']), l['name']) for l in links]
+    raise RuntimeError("No ldd or otool on %s" % sys.platform)
 
-    for f in obj_files:
-        path = join(prefix, f)
+
+def _pyldd_linkages(path, sysroot):
+    return [(basename(lp), lp) for lp in sorted(inspect_linkages(path, sysroot=sysroot))]
+
+
+def _linkages_of(path, sysroot, method):
+    if method == 'pyldd':
+        return _pyldd_linkages(path, sysroot)
+    try:
         # ldd quite often fails on foreign architectures.
-        ldd_failed = False
+        res = _system_linkages(path)
+    except Exception:
+        return _pyldd_linkages(path, sysroot)
+    if method == 'verify':
+        res_py = _pyldd_linkages(path, sysroot)
+        if set(res) != set(res_py):
+            log = get_logger(__name__)
+            log.warn("pyldd disagrees with ldd/otool for %s.  ldd/otool gives %s, pyldd "
+                     "gives %s.  This will not cause any problems for this build, but please "
+                     "file a bug at https://github.com/conda/conda-build and (if possible) "
+                     "attach the file.", path, sorted(set(res) - set(res_py)),
+                     sorted(set(res_py) - set(res)))
+    return res
+
+
+def _linkage_db():
+    """The linkage results of earlier runs live next to the remembered checksums."""
+    try:
+        db = sqlite3.connect(checksums.checksum_db_path, timeout=30)
+        db.execute('CREATE TABLE IF NOT EXISTS linkages (sha256 TEXT, path TEXT, '
+                   'sysroot TEXT, method TEXT, linkages TEXT, '
+                   'PRIMARY KEY (sha256, path, sysroot, method))')
+        return db
+    except sqlite3.Error:
+        return None
+
+
+def _stat_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime]
+
+
+def _watched_paths(path, linkages, sysroot):
+    """The files and folders that the linkages of path were resolved from: the libraries
+    themselves (their own needs count too), the folders they are in, and the other folders
+    a library of that name could be found in first (rpaths, LD_LIBRARY_PATH, the system
+    library folders).  A library added to or removed from a folder changes its mtime."""
+    libraries = set(lp for _, lp in linkages if lp not in ('', 'not found'))
+    folders = set(dirname(lp) for lp in libraries)
+    folders.add(dirname(path))
+    folders.update(sysroot + folder for folder in system_library_dirs(sysroot))
+    folders.update(os.environ.get('LD_LIBRARY_PATH', '').split(os.pathsep))
+    try:
+        rpath = elf_get_rpath(path)
+    except Exception:
+        rpath = None
+    for folder in (rpath or '').split(':'):
+        for origin in ('$ORIGIN', '${ORIGIN}'):
+            folder = folder.replace(origin, dirname(path))
+        folders.add(folder)
+    return sorted(normpath(p) for p in (libraries | folders) if p)
+
+
+def _load_linkages(keys):
+    """{key: linkages} for the keys a previous run stored.  Results that refer to a library
+    that is gone, or couldn't find one that might exist now, are not used, and neither are
+    those whose watched paths (see _watched_paths) have changed since."""
+    found = {}
+    db = _linkage_db()
+    if not db:
+        return found
+    try:
+        for key in keys:
+            row = db.execute('SELECT linkages FROM linkages WHERE sha256 = ? AND path = ? '
+                             'AND sysroot = ? AND method = ?', key).fetchone()
+            if row:
+                stored = json.loads(row[0])
+                if not hasattr(stored, 'keys'):
+                    # stored by a version that did not watch anything
+                    continue
+                linkages = [tuple(link) for link in stored['linkages']]
+                if (all(lp not in ('', 'not found') and isfile(lp) for _, lp in linkages) and
+                        all(_stat_signature(watched) == signature
+                            for watched, signature in stored['watched'])):
+                    found[key] = linkages
+    except sqlite3.Error:
+        pass
+    finally:
+        db.close()
+    return found
+
+
+def _store_linkages(results):
+    """Store {key: linkages}, with the signatures of their watched paths."""
+    db = _linkage_db()
+    if not db:
+        return
+    rows = []
+    for key, linkages in results.items():
+        _, path, sysroot, _ = key
+        watched = [(p, _stat_signature(p)) for p in _watched_paths(path, linkages, sysroot)]
+        rows.append(key + (json.dumps({'linkages': linkages, 'watched': watched}), ))
+    try:
+        with db:
+            db.executemany('INSERT OR REPLACE INTO linkages VALUES (?, ?, ?, ?, ?)', rows)
+    except sqlite3.Error:
+        pass
+    finally:
+        db.close()
+
+
+def get_linkages(obj_files, prefix, sysroot, method='pyldd', threads=None):
+    """{file: [(library name, resolved path)]} for the obj_files (relative to prefix).
+
+    method is 'pyldd' (parse the files ourselves), 'ldd' (ldd or otool -L, falling back to
+    pyldd where they fail) or 'verify' (ldd/otool, warning about differences from pyldd).
+    Files are analysed on `threads` threads (default: one per cpu), and results are kept
+    across runs, keyed by the contents of each file, for as long as the libraries and
+    folders they were resolved from don't change."""
+    paths = {f: join(prefix, f) for f in obj_files}
+    hashes = checksums.hash_files(paths.values(), ('sha256', ), threads=threads or cpu_count())
+    keys = {f: (hashes[path]['sha256'], path, sysroot, method) for f, path in paths.items()}
+    stored = _load_linkages(set(keys.values()))
+
+    todo = [f for f in obj_files if keys[f] not in stored]
+    if len(todo) > 1:
+        pool = ThreadPool(min(threads or cpu_count(), len(todo)))
         try:
-            if sys.platform.startswith('linux'):
-                res[f] = ldd(path)
-            elif sys.platform.startswith('darwin'):
-                links = otool(path)
-                res[f] = [(basename(l['name']), l['name']) for l in links]
-        except:
-            ldd_failed = True
+            computed = pool.map(lambda f: _linkages_of(paths[f], sysroot, method), todo)
         finally:
-            res_py = inspect_linkages(path, sysroot=sysroot)
-            res_py = [(basename(lp), lp) for lp in res_py]
-            # print("set(res_py) {}".format(set(res_py)))
-            if ldd_failed:
-                res[f] = res_py
-            # else:
-            #   print("set(res[f]) = {}".format(set(res[f])))
-            #   if set(res[f]) != set(res_py):
-            #       print("WARNING: pyldd disagrees with ldd/otool. This will not cause any")
-            #       print("WARNING: problems for this build, but please file a bug at:")
-            #       print("WARNING: https://github.com/conda/conda-build")
-            #       print("WARNING: and (if possible) attach file {}".format(path))
-            #       print("WARNING: ldd/tool gives {}, pyldd gives {}"
-            #             .format(set(res[f]), set(res_py)))
-
+            pool.close()
+            pool.join()
+    else:
+        computed = [_linkages_of(paths[f], sysroot, method) for f in todo]
+    _store_linkages({keys[f]: linkages for f, linkages in zip(todo, computed)})
+
+    res = {f: stored[keys[f]] for f in obj_files if keys[f] in stored}
+    res.update(zip(todo, computed))
     return res
 
 
@@ -90,10 +213,9 @@ def get_package_obj_files(dist, prefix):
     return res
 
 
-@memoized
 def get_untracked_obj_files(prefix):
     res = []
-    files = untracked(prefix)
+    files = untracked_files(prefix)
     for f in files:
         path = join(prefix, f)
         if post.is_obj(path):
@@ -1,6 +1,7 @@
 from __future__ import print_function
 import argparse
 import glob
+import mmap
 import os
 import re
 import struct
@@ -156,12 +157,90 @@ class fileview(object):
         return bytes
 
 
+class mappedfile(object):
+    """
+    A read-only, memory-mapped file with the seek/tell/read interface of a file object.
+    Reading only copies the bytes asked for, and _unpack decodes straight from the map.
+    """
+
+    def __init__(self, fileobj):
+        self.name = fileobj.name
+        size = os.fstat(fileobj.fileno()).st_size
+        # an empty file can't be mapped
+        self.data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._size = size
+        self._pos = 0
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._size
+        self._pos = offset
+
+    def read(self, size=maxint):
+        data = self.data[self._pos:min(self._pos + size, self._size)]
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        if self._size:
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# struct.Struct objects by format, so each format is only compiled once
+_structs = {}
+
+
+def _unpack(file, fmt):
+    """
+    struct.unpack(fmt) what's at the current position of file, and move past it.  On a
+    mappedfile, or a fileview of one, nothing is read or copied.
+    """
+    st = _structs.get(fmt)
+    if st is None:
+        st = _structs[fmt] = struct.Struct(fmt)
+    base, start = file, 0
+    if isinstance(file, fileview):
+        base, start = file._fileobj, file._start
+    if isinstance(base, mappedfile):
+        pos = file.tell()
+        file.seek(pos + st.size)
+        return st.unpack_from(base.data, start + pos)
+    return st.unpack(file.read(st.size))
+
+
+def _read_string(file, offset):
+    """The NUL terminated string at offset in file, decoded."""
+    if isinstance(file, mappedfile):
+        end = file.data.find(b'\0', offset)
+        data = file.data[offset:end if end >= 0 else file._size]
+    else:
+        file.seek(offset)
+        data = b''
+        while b'\0' not in data:
+            chunk = file.read(256)
+            if not chunk:
+                break
+            data += chunk
+    return data.split(b'\0', 1)[0].decode('utf-8')
+
+
 def read_data(file, endian, num=1):
     """
     Read a given number of 32-bits unsigned integers from the given file
     with the given endianness.
     """
-    res = struct.unpack(endian + 'L' * num, file.read(num * 4))
+    res = _unpack(file, endian + 'L' * num)
     if len(res) == 1:
         return res[0]
     return res
@@ -421,8 +500,6 @@ E_MACHINE_X86_64 = 0x3e
 E_MACHINE_AARCH64 = 0xb7
 E_MACHINE_RISC_V = 0xf3
 
-# It'd be quicker to use struct.calcsize here and a single
-# struct.unpack but it would be ugly and harder to maintain.
 PT_NULL = 0
 PT_LOAD = 1
 PT_DYNAMIC = 2
@@ -505,38 +582,23 @@ DT_HIPROC = 0x7fffffff
 
 class elfheader(object):
     def __init__(self, file):
-        self.hdr, = struct.unpack(BIG_ENDIAN + 'L', file.read(4))
+        self.hdr, = _unpack(file, BIG_ENDIAN + 'L')
         self.dt_needed = []
         self.dt_rpath = []
         if self.hdr != ELF_HDR:
             return
-        bitness, = struct.unpack(LITTLE_ENDIAN + 'B', file.read(1))
+        bitness, endian, self.version, self.osabi, self.abiver = _unpack(file, '5B7x')
         bitness = 32 if bitness == 1 else 64
         sz_ptr = int(bitness / 8)
         ptr_type = 'Q' if sz_ptr == 8 else 'L'
         self.bitness = bitness
         self.sz_ptr = sz_ptr
         self.ptr_type = ptr_type
-        endian, = struct.unpack(LITTLE_ENDIAN + 'B', file.read(1))
         endian = LITTLE_ENDIAN if endian == 1 else BIG_ENDIAN
         self.endian = endian
-        self.version, = struct.unpack(endian + 'B', file.read(1))
-        self.osabi, = struct.unpack(endian + 'B', file.read(1))
-        self.abiver, = struct.unpack(endian + 'B', file.read(1))
-        struct.unpack(endian + 'B' * 7, file.read(7))
-        self.type, = struct.unpack(endian + 'H', file.read(2))
-        self.machine, = struct.unpack(endian + 'H', file.read(2))
-        self.version, = struct.unpack(endian + 'L', file.read(4))
-        self.entry, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.phoff, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.shoff, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.flags, = struct.unpack(endian + 'L', file.read(4))
-        self.ehsize, = struct.unpack(endian + 'H', file.read(2))
-        self.phentsize, = struct.unpack(endian + 'H', file.read(2))
-        self.phnum, = struct.unpack(endian + 'H', file.read(2))
-        self.shentsize, = struct.unpack(endian + 'H', file.read(2))
-        self.shnum, = struct.unpack(endian + 'H', file.read(2))
-        self.shstrndx, = struct.unpack(endian + 'H', file.read(2))
+        (self.type, self.machine, self.version, self.entry, self.phoff, self.shoff,
+         self.flags, self.ehsize, self.phentsize, self.phnum, self.shentsize, self.shnum,
+         self.shstrndx) = _unpack(file, endian + 'HHL' + ptr_type * 3 + 'L6H')
         loc = file.tell()
         if loc != self.ehsize:
             log.warning('file.tell()={} != ehsize={}'.format(loc, self.ehsize))
@@ -554,20 +616,9 @@ class elfheader(object):
 class elfsection(object):
     def __init__(self, eh, file):
         ptr_type = eh.ptr_type
-        sz_ptr = eh.sz_ptr
-        endian = eh.endian
-        # It'd be quicker to use struct.calcsize here and a single
-        # struct.unpack but it would be ugly and harder to maintain.
-        self.sh_name, = struct.unpack(endian + 'L', file.read(4))
-        self.sh_type, = struct.unpack(endian + 'L', file.read(4))
-        self.sh_flags, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.sh_addr, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.sh_offset, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.sh_size, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.sh_link, = struct.unpack(endian + 'L', file.read(4))
-        self.sh_info, = struct.unpack(endian + 'L', file.read(4))
-        self.sh_addralign, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.sh_entsize, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
+        (self.sh_name, self.sh_type, self.sh_flags, self.sh_addr, self.sh_offset,
+         self.sh_size, self.sh_link, self.sh_info, self.sh_addralign,
+         self.sh_entsize) = _unpack(file, eh.endian + 'LL' + ptr_type * 4 + 'LL' + ptr_type * 2)
         # Lower priority == post processed earlier so that those
         # with higher priority can assume already initialized.
         if self.sh_type == SHT_STRTAB:
@@ -575,14 +626,14 @@ class elfsection(object):
         else:
             self.priority = 1
 
+    def string(self, file, offset):
+        'The string at offset in this string table'
+        return _read_string(file, self.sh_offset + offset)
+
     def postprocess(self, elffile, file):
         ptr_type = elffile.ehdr.ptr_type
-        sz_ptr = elffile.ehdr.sz_ptr
         endian = elffile.ehdr.endian
-        if self.sh_type == SHT_STRTAB:
-            file.seek(self.sh_offset)
-            self.table = file.read(self.sh_size).decode()
-        elif self.sh_type == SHT_DYNAMIC:
+        if self.sh_type == SHT_DYNAMIC:
             #
             # Required reading 1:
             # http://blog.qt.io/blog/2011/10/28/rpath-and-runpath/
@@ -632,36 +683,31 @@ class elfsection(object):
             dt_runpath = []
             for m in range(int(self.sh_size / self.sh_entsize)):
                 file.seek(self.sh_offset + (m * self.sh_entsize))
-                d_tag, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-                d_val_ptr, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
+                d_tag, d_val_ptr = _unpack(file, endian + ptr_type * 2)
                 if d_tag == DT_NEEDED:
                     dt_needed.append(d_val_ptr)
                 elif d_tag == DT_RPATH:
                     dt_rpath.append(d_val_ptr)
-                elif d_tag == DT_RPATH:
+                elif d_tag == DT_RUNPATH:
                     dt_runpath.append(d_val_ptr)
                 elif d_tag == DT_STRTAB:
                     dt_strtab_ptr = d_val_ptr
             if dt_strtab_ptr:
                 strsec, offset = elffile.find_section_and_offset(dt_strtab_ptr)
                 if strsec and strsec.sh_type == SHT_STRTAB:
+                    # only the strings that are used are read, never the whole table
                     for n in dt_needed:
-                        end = n + strsec.table[n:].index('\0')
-                        elffile.dt_needed.append(strsec.table[n:end])
+                        elffile.dt_needed.append(strsec.string(file, n))
                     for r in dt_rpath:
-                        end = r + strsec.table[r:].index('\0')
-                        path = strsec.table[r:end]
+                        path = strsec.string(file, r)
                         rpaths = [path for path in path.split(':') if path]
                         elffile.dt_rpath.extend([path if not path.endswith('/')
                                                  else path.rstrip('/')
                                                  for path in rpaths])
                     for r in dt_runpath:
-                        end = r + strsec.table[r:].index('\0')
-                        path = strsec.table[r:end]
+                        path = strsec.string(file, r)
                         rpaths = [path for path in path.split(':') if path]
-                        elffile.dt_runpath.extend([rp if rp.endswith(os.sep)
-                                                   else rp + os.sep
-                                                   for rp in rpaths])
+                        elffile.dt_runpath.extend([rp.rstrip('/') or rp for rp in rpaths])
             # runpath always takes precedence.
             if len(elffile.dt_runpath):
                 elffile.dt_rpath = []
@@ -669,20 +715,14 @@ class elfsection(object):
 
 class programheader(object):
     def __init__(self, eh, file):
-        ptr_type = eh.ptr_type
-        sz_ptr = eh.sz_ptr
         endian = eh.endian
-        self.p_type, = struct.unpack(endian + 'L', file.read(4))
+        # p_flags moved up in the 64 bit layout, for alignment
         if eh.bitness == 64:
-            self.p_flags, = struct.unpack(endian + 'L', file.read(4))
-        self.p_offset, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.p_vaddr, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.p_paddr, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.p_filesz, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        self.p_memsz, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
-        if eh.bitness == 32:
-            self.p_flags, = struct.unpack(endian + 'L', file.read(4))
-        self.p_align, = struct.unpack(endian + ptr_type, file.read(sz_ptr))
+            (self.p_type, self.p_flags, self.p_offset, self.p_vaddr, self.p_paddr,
+             self.p_filesz, self.p_memsz, self.p_align) = _unpack(file, endian + 'LL6Q')
+        else:
+            (self.p_type, self.p_offset, self.p_vaddr, self.p_paddr, self.p_filesz,
+             self.p_memsz, self.p_flags, self.p_align) = _unpack(file, endian + '8L')
 
     def postprocess(self, elffile, file):
         if self.p_type == PT_INTERP:
@@ -703,6 +743,7 @@ class elffile(object):
         self.selfdir = os.path.dirname(file.name)
 
         for n in range(self.ehdr.phnum):
+            file.seek(self.ehdr.phoff + (n * self.ehdr.phentsize))
             self.programheaders.append(programheader(self.ehdr, file))
         for n in range(self.ehdr.shnum):
             file.seek(self.ehdr.shoff + (n * self.ehdr.shentsize))
@@ -720,13 +761,17 @@ class elffile(object):
         # TODO :: when run through QEMU also, so in that case,
         # TODO :: we must run os.path.join(sysroot,self.program_interpreter)
         # TODO :: Interesting stuff: https://www.cs.virginia.edu/~dww4s/articles/ld_linux.html
+        # The system folders are searched last, after DT_RUNPATH if there is one.
+        if self.dt_runpath:
+            rpaths, runpaths = self.dt_rpath, self.dt_runpath + initial_rpaths_transitive
+        else:
+            rpaths, runpaths = self.dt_rpath + initial_rpaths_transitive, self.dt_runpath
         self.rpaths_transitive = [rpath.replace('$ORIGIN', '$SELFDIR')
                                        .replace('$LIB', '/usr/lib')
-                                  for rpath in (self.dt_rpath +
-                                                initial_rpaths_transitive)]
+                                  for rpath in rpaths]
         self.rpaths_nontransitive = [rpath.replace('$ORIGIN', '$SELFDIR')
                                           .replace('$LIB', '/usr/lib')
-                                     for rpath in self.dt_runpath]
+                                     for rpath in runpaths]
         # This is implied. Making it explicit allows sharing the
         # same _get_resolved_location() function with macho-o
         self.shared_libraries = [(needed, '$RPATH/' + needed)
@@ -780,6 +825,160 @@ class inscrutablefile(object):
         return None
 
 
+SHT_GNU_verdef = 0x6ffffffd
+SHT_GNU_verneed = 0x6ffffffe
+
+# dynamic entries whose value is an offset into the dynamic string table
+DT_AUXILIARY = 0x7ffffffd
+DT_FILTER = 0x7fffffff
+DT_STRING_TAGS = (DT_NEEDED, DT_SONAME, DT_RPATH, DT_RUNPATH, DT_AUXILIARY, DT_FILTER)
+
+
+class elfdynamic(object):
+    '''
+    Just the dynamic section of an ELF file, and the string table it uses.  Unlike elffile
+    this reads as little as possible, and it can rewrite DT_RPATH / DT_RUNPATH in place.
+    `valid` is False for files without section headers or a dynamic section.
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.ehdr = elfheader(file)
+        self.sections = []
+        self.entries = []
+        self.valid = False
+        if self.ehdr.hdr != ELF_HDR:
+            return
+        for n in range(self.ehdr.shnum):
+            file.seek(self.ehdr.shoff + (n * self.ehdr.shentsize))
+            self.sections.append(elfsection(self.ehdr, file))
+        dynamic = [es for es in self.sections if es.sh_type == SHT_DYNAMIC]
+        if not dynamic or not dynamic[0].sh_entsize or \
+                dynamic[0].sh_link >= len(self.sections):
+            return
+        self.dynamic = dynamic[0]
+        self.strtab_index = self.dynamic.sh_link
+        self.strtab = self.sections[self.strtab_index]
+        entry = self.ehdr.endian + self.ehdr.ptr_type * 2
+        file.seek(self.dynamic.sh_offset)
+        data = file.read(self.dynamic.sh_size)
+        for m in range(int(self.dynamic.sh_size / self.dynamic.sh_entsize)):
+            offset = m * self.dynamic.sh_entsize
+            d_tag, d_val = struct.unpack_from(entry, data, offset)
+            if d_tag == DT_NULL:
+                break
+            # (position of the entry in the file, tag, value)
+            self.entries.append((self.dynamic.sh_offset + offset, d_tag, d_val))
+        self.valid = True
+
+    def string(self, offset):
+        return self.strtab.string(self.file, offset)
+
+    def rpath_entry(self):
+        'The (position, tag, value) of the DT_RUNPATH or DT_RPATH entry, or None'
+        for tag in (DT_RUNPATH, DT_RPATH):
+            for entry in self.entries:
+                if entry[1] == tag:
+                    return entry
+        return None
+
+    def get_rpath(self):
+        entry = self.rpath_entry()
+        return self.string(entry[2]) if entry else ''
+
+    def _string_references(self):
+        'Every offset into the dynamic string table that something in the file refers to'
+        endian = self.ehdr.endian
+        refs = set(d_val for _, d_tag, d_val in self.entries if d_tag in DT_STRING_TAGS)
+        for es in self.sections:
+            if es.sh_link != self.strtab_index or es.sh_type == SHT_DYNAMIC:
+                continue
+            self.file.seek(es.sh_offset)
+            data = self.file.read(es.sh_size)
+            if es.sh_type in (SHT_DYNSYM, SHT_SYMTAB) and es.sh_entsize:
+                # st_name is the first field of both Elf32_Sym and Elf64_Sym
+                for n in range(int(es.sh_size / es.sh_entsize)):
+                    refs.add(struct.unpack_from(endian + 'L', data, n * es.sh_entsize)[0])
+            elif es.sh_type == SHT_GNU_verneed:
+                pos = 0
+                for _ in range(es.sh_info):
+                    _, cnt, file_name, aux, next_ = struct.unpack_from(endian + 'HHLLL', data,
+                                                                       pos)
+                    refs.add(file_name)
+                    apos = pos + aux
+                    for _ in range(cnt):
+                        _, _, _, name, anext = struct.unpack_from(endian + 'LHHLL', data, apos)
+                        refs.add(name)
+                        apos += anext
+                    if not next_:
+                        break
+                    pos += next_
+            elif es.sh_type == SHT_GNU_verdef:
+                pos = 0
+                for _ in range(es.sh_info):
+                    _, _, _, cnt, _, aux, next_ = struct.unpack_from(endian + 'HHHHLLL', data,
+                                                                     pos)
+                    apos = pos + aux
+                    for _ in range(cnt):
+                        name, anext = struct.unpack_from(endian + 'LL', data, apos)
+                        refs.add(name)
+                        apos += anext
+                    if not next_:
+                        break
+                    pos += next_
+        return refs
+
+    def set_rpath(self, rpath):
+        '''
+        Make rpath the DT_RPATH of the file (like patchelf --force-rpath) by overwriting
+        the existing DT_RPATH or DT_RUNPATH string.  This only works if the new value is no
+        longer than the old one, and if the linker did not share the old string's bytes with
+        another string.  Returns False, without changing anything, when it does not work.
+        '''
+        entry = self.rpath_entry()
+        if not entry:
+            return False
+        position, d_tag, offset = entry
+        self.file.seek(self.strtab.sh_offset)
+        strings = self.file.read(self.strtab.sh_size)
+        end = strings.find(b'\0', offset)
+        if end < 0:
+            return False
+        old = strings[offset:end]
+        new = rpath.encode('utf-8')
+        if len(new) > len(old):
+            return False
+        # The linker merges strings with shared tails, so a string that starts before the
+        #    rpath can run into it.  Any reference from the start of the string the rpath is
+        #    part of up to its NUL is one that a rewrite would change.
+        start = strings.rfind(b'\0', 0, offset) + 1
+        if any(start <= ref <= end and ref != offset for ref in self._string_references()):
+            return False
+        self.file.seek(self.strtab.sh_offset + offset)
+        self.file.write(new + b'\0' * (len(old) - len(new)))
+        if d_tag != DT_RPATH:
+            self.file.seek(position)
+            self.file.write(struct.pack(self.ehdr.endian + self.ehdr.ptr_type, DT_RPATH))
+        return True
+
+
+def elf_get_rpath(filename):
+    '''
+    The DT_RUNPATH or DT_RPATH of an ELF file ('' if it has neither), or None if the file
+    can not be read this way (not ELF, no section headers).
+    '''
+    with open(filename, 'rb') as f:
+        with mappedfile(f) as mf:
+            dyn = elfdynamic(mf)
+            return dyn.get_rpath() if dyn.valid else None
+
+
+def elf_set_rpath(filename, rpath):
+    'Rewrite the rpath of an ELF file in place, see elfdynamic.set_rpath.'
+    with open(filename, 'r+b') as f:
+        dyn = elfdynamic(f)
+        return dyn.valid and dyn.set_rpath(rpath)
+
+
 def codefile(file, arch='any', initial_rpaths_transitive=[]):
     magic, = struct.unpack(BIG_ENDIAN + 'L', file.read(4))
     file.seek(0)
@@ -821,8 +1020,45 @@ def is_codefile(filename, skip_symlinks=True):
     return True
 
 
-# TODO :: Consider memoizing instead of repeatedly scanning
-# TODO :: libc.so/libSystem.dylib when inspect_linkages(recurse=True)
+# ld.so.conf folders by sysroot
+_ld_so_conf_dirs = {}
+
+
+def _read_ld_so_conf(conf, sysroot):
+    dirs = []
+    try:
+        with open(os.path.join(sysroot, conf.lstrip('/')) if sysroot else conf) as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return dirs
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('include '):
+            pattern = line.split(None, 1)[1]
+            if not pattern.startswith('/'):
+                pattern = os.path.join(os.path.dirname(conf), pattern)
+            matches = glob.glob(os.path.join(sysroot, pattern.lstrip('/')) if sysroot
+                                else pattern)
+            for match in sorted(matches):
+                dirs.extend(_read_ld_so_conf('/' + os.path.relpath(match, sysroot or '/'),
+                                             sysroot))
+        elif line.startswith('/'):
+            dirs.append(line.rstrip('/'))
+    return dirs
+
+
+def system_library_dirs(sysroot=''):
+    '''
+    The folders the dynamic linker searches after the rpaths: those in /etc/ld.so.conf
+    (multiarch folders like /usr/lib/x86_64-linux-gnu live there) and /lib, /usr/lib.
+    '''
+    if sysroot not in _ld_so_conf_dirs:
+        dirs = _read_ld_so_conf('/etc/ld.so.conf', sysroot)
+        _ld_so_conf_dirs[sysroot] = [d for i, d in enumerate(dirs) if d not in dirs[:i] and
+                                     d not in ('/lib', '/usr/lib')]
+    return ['/lib', '/usr/lib'] + _ld_so_conf_dirs[sysroot]
+
+
 def _inspect_linkages_this(filename, sysroot='', arch='native'):
     while sysroot.endswith('/') or sysroot.endswith('\\'):
         sysroot = sysroot[:-1]
@@ -830,11 +1066,11 @@ def _inspect_linkages_this(filename, sysroot='', arch='native'):
         _, _, _, _, arch = os.uname()
     if not os.path.exists(filename):
         return [], []
-    with open(filename, 'rb') as f:
+    with open(filename, 'rb') as f, mappedfile(f) as mf:
         # TODO :: Problems here:
         # TODO :: 1. macOS can modify RPATH for children in each .so
         # TODO :: 2. Linux can identify the program interpreter which can change the initial RPATHs
-        cf = codefile(f, arch, ['/lib', '/usr/lib'])
+        cf = codefile(mf, arch, system_library_dirs(sysroot))
         dirname = os.path.dirname(filename)
         results = cf.get_resolved_shared_libraries(dirname, dirname, sysroot)
         if not results:
@@ -843,22 +1079,113 @@ def _inspect_linkages_this(filename, sysroot='', arch='native'):
         return orig_names, resolved_names
 
 
+# The linkage graph, shared by every inspection in this process.  Keys identify the exact
+# file that was parsed, so a rebuilt library is parsed again: (realpath, inode, mtime,
+# sysroot, arch, folder the file was reached through - $ORIGIN expands to that).
+# _needed_libraries maps them to the [(orig name, resolved name)] pairs of the file's own
+# needs, _direct_linkages to (orig names, resolved names) of those and _transitive_linkages
+# to the same for everything reachable from it.
+_needed_libraries = {}
+_direct_linkages = {}
+_transitive_linkages = {}
+
+
+def _linkage_key(filename, sysroot, arch):
+    try:
+        realpath = os.path.realpath(filename)
+        st = os.stat(realpath)
+    except OSError:
+        return (filename, None, None, sysroot, arch, None)
+    return (realpath, st.st_ino, st.st_mtime, sysroot, arch, os.path.dirname(filename))
+
+
+def needed_libraries(filename, sysroot='', arch='native'):
+    '''
+    [(name as recorded in filename, resolved name)] for each library filename needs itself.
+    Names that could not be resolved are returned as they are, so check they exist.
+    '''
+    key = _linkage_key(filename, sysroot, arch)
+    needed = _needed_libraries.get(key)
+    if needed is None:
+        orig, resolved = _inspect_linkages_this(filename, sysroot=sysroot, arch=arch)
+        needed = _needed_libraries[key] = list(zip(orig, resolved))
+    return needed
+
+
+def _direct_linkages_of(filename, sysroot, arch):
+    key = _linkage_key(filename, sysroot, arch)
+    direct = _direct_linkages.get(key)
+    if direct is None:
+        needed = needed_libraries(filename, sysroot, arch)
+        direct = _direct_linkages[key] = (frozenset(orig for orig, _ in needed),
+                                          frozenset(resolved for _, resolved in needed))
+    return key, direct
+
+
+def _transitive_linkages_of(filename, sysroot, arch):
+    '''
+    (orig names, resolved names) of everything filename links to, directly or not.  Each
+    file is parsed once per process, and each closure is computed once: the graph is walked
+    depth first, finding strongly connected components (Tarjan) so that libraries that need
+    each other share one closure, and every component's closure is built from the already
+    finished closures of what it links to.
+    '''
+    key, _ = _direct_linkages_of(filename, sysroot, arch)
+    if key in _transitive_linkages:
+        return _transitive_linkages[key]
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+
+    def visit(node):
+        key, (orig, resolved) = _direct_linkages_of(node, sysroot, arch)
+        index[node] = lowlink[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        for dep in resolved:
+            if _linkage_key(dep, sysroot, arch) in _transitive_linkages:
+                continue
+            if dep not in index:
+                visit(dep)
+                lowlink[node] = min(lowlink[node], lowlink[dep])
+            elif dep in on_stack:
+                lowlink[node] = min(lowlink[node], index[dep])
+        if lowlink[node] != index[node]:
+            return
+        component = []
+        while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            component.append(member)
+            if member == node:
+                break
+        all_orig, all_resolved = set(), set()
+        for member in component:
+            _, (orig, resolved) = _direct_linkages_of(member, sysroot, arch)
+            all_orig.update(orig)
+            all_resolved.update(resolved)
+            for dep in resolved:
+                if dep not in component:
+                    dep_orig, dep_resolved = _transitive_linkages[_linkage_key(dep, sysroot,
+                                                                               arch)]
+                    all_orig.update(dep_orig)
+                    all_resolved.update(dep_resolved)
+        closure = (frozenset(all_orig), frozenset(all_resolved))
+        for member in component:
+            _transitive_linkages[_linkage_key(member, sysroot, arch)] = closure
+
+    visit(filename)
+    return _transitive_linkages[key]
+
+
 # TODO :: Consider returning a tree structure or a dict when recurse is True?
 def inspect_linkages(filename, resolve_filenames=True, recurse=True, sysroot='', arch='native'):
-    todo = set([filename])
-    done = set()
-    results = set()
-    while todo != done:
-        filename = next(iter(todo - done))
-        these_orig, these_resolved = _inspect_linkages_this(filename, sysroot=sysroot, arch=arch)
-        if resolve_filenames:
-            results.update(these_resolved)
-        else:
-            results.update(these_orig)
-        if recurse:
-            todo.update(these_resolved)
-        done.add(filename)
-    return results
+    if recurse:
+        orig, resolved = _transitive_linkages_of(filename, sysroot, arch)
+    else:
+        _, (orig, resolved) = _direct_linkages_of(filename, sysroot, arch)
+    return set(resolved if resolve_filenames else orig)
 
 
 def inspect_linkages_otool(filename, arch='native'):
@@ -5,26 +5,38 @@ import fnmatch
 from functools import partial
 from glob import glob
 import io
+import json
 import locale
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import re
 import os
 import stat
-from subprocess import call, check_output
+from subprocess import call, check_output, PIPE, Popen
 import sys
+import threading
 try:
     from os import readlink
 except ImportError:
     readlink = False
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from conda_build.os_utils import external
 from .conda_interface import lchmod
+from .conda_interface import linked_data
 from .conda_interface import walk_prefix
-from .conda_interface import md5_file
 from .conda_interface import PY3
 from .conda_interface import TemporaryDirectory
 
-from conda_build import utils
-from conda_build.os_utils.pyldd import is_codefile
+from conda_build import checksums, utils
+from conda_build.os_utils.pyldd import (elf_get_rpath, elf_set_rpath, is_codefile,
+                                        needed_libraries)
 
 if sys.platform == 'darwin':
     from conda_build.os_utils import macho
@@ -157,15 +169,18 @@ def remove_easy_install_pth(files, prefix, config, preserve_egg_dir=False):
     utils.rm_rf(os.path.join(sp_dir, 'easy-install.pth'))
 
 
-def rm_py_along_so(prefix):
-    """remove .py (.pyc) files alongside .so or .pyd files"""
-    for root, _, files in os.walk(prefix):
-        for fn in files:
-            if fn.endswith(('.so', '.pyd')):
-                name, _ = os.path.splitext(fn)
-                for ext in '.py', '.pyc', '.pyo':
-                    if name + ext in files:
-                        os.unlink(os.path.join(root, name + ext))
+def rm_py_along_so(prefix, files=None):
+    """remove .py (.pyc) files alongside .so or .pyd files.  If files (relative to prefix) is
+    given, only the extensions among them are looked at; otherwise the whole prefix."""
+    if files is None:
+        files = [os.path.relpath(os.path.join(root, fn), prefix)
+                 for root, _, fns in os.walk(prefix) for fn in fns]
+    for f in files:
+        if f.endswith(('.so', '.pyd')):
+            name, _ = os.path.splitext(os.path.join(prefix, f))
+            for ext in '.py', '.pyc', '.pyo':
+                if os.path.isfile(name + ext):
+                    os.unlink(name + ext)
 
 
 def rm_pyo(files, prefix):
@@ -190,9 +205,65 @@ def rm_pyc(files, prefix):
             os.unlink(os.path.join(prefix, fn))
 
 
-def compile_missing_pyc(files, cwd, python_exe, skip_compile_pyc=()):
+# Run by the target python to byte-compile the files listed on stdin, one per line.  Must
+#    work on every python we build for, 2.7 included.  Prints a json list of [file, error]
+#    for the files that failed.
+_compile_pyc_driver = '''
+import json
+import multiprocessing
+import py_compile
+import sys
+
+
+def compile_one(fn):
+    try:
+        py_compile.compile(fn, doraise=True)
+    except py_compile.PyCompileError as e:
+        return fn, e.msg
+    except Exception as e:
+        return fn, "%s: %s" % (type(e).__name__, e)
+    return fn, None
+
+
+if __name__ == "__main__":
+    stdin = getattr(sys.stdin, "buffer", sys.stdin)
+    files = [fn for fn in stdin.read().decode("utf-8").splitlines() if fn]
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(files)))
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.map(compile_one, files, max(1, len(files) // (jobs * 4)))
+        pool.close()
+        pool.join()
+    else:
+        results = [compile_one(fn) for fn in files]
+    sys.stdout.write(json.dumps([[fn, error] for fn, error in results if error]))
+'''
+
+
+def _compile_pyc(compile_files, cwd, python_exe, jobs=None):
+    """Byte-compile compile_files (relative to cwd) with a single run of python_exe, using
+    up to jobs processes (default: one per cpu).  Returns {file: error} for the failures,
+    or None when python_exe itself failed, in which case nothing is known per file."""
+    with TemporaryDirectory() as tmpdir:
+        driver = os.path.join(tmpdir, 'compile_pyc.py')
+        with open(driver, 'w') as f:
+            f.write(_compile_pyc_driver)
+        args = [python_exe, '-Wi', driver]
+        if jobs:
+            args.append(str(jobs))
+        proc = Popen(args, cwd=cwd, stdin=PIPE, stdout=PIPE)
+        out, _ = proc.communicate('\n'.join(compile_files).encode('utf-8'))
+    if proc.returncode:
+        return None
+    return dict(json.loads(out.decode('utf-8') or '[]'))
+
+
+def compile_missing_pyc(files, cwd, python_exe, skip_compile_pyc=(), jobs=None):
+    """Compile the .py files among files that have no .pyc yet.  Returns the files that
+    failed to compile."""
     if not os.path.isfile(python_exe):
-        return
+        return []
     compile_files = []
     skip_compile_pyc_n = [os.path.normpath(skip) for skip in skip_compile_pyc]
     skipped_files = set()
@@ -218,8 +289,15 @@ def compile_missing_pyc(files, cwd, python_exe, skip_compile_pyc=()):
             print('compiling .pyc files... failed as no python interpreter was found')
         else:
             print('compiling .pyc files...')
-            for f in compile_files:
-                call([python_exe, '-Wi', '-m', 'py_compile', f], cwd=cwd)
+            failed = _compile_pyc(compile_files, cwd, python_exe, jobs=jobs)
+            if failed is None:
+                # like a failed compile of a single file, this does not fail the build
+                print('compiling .pyc files with %s failed' % python_exe, file=sys.stderr)
+                return sorted(compile_files)
+            for f in sorted(failed):
+                print('Error compiling %s:\n%s' % (f, failed[f].rstrip()), file=sys.stderr)
+            return sorted(failed)
+    return []
 
 
 def post_process(files, prefix, config, preserve_egg_dir=False, noarch=False, skip_compile_pyc=()):
@@ -232,13 +310,52 @@ def post_process(files, prefix, config, preserve_egg_dir=False, noarch=False, sk
         compile_missing_pyc(files, cwd=prefix, python_exe=python_exe,
                             skip_compile_pyc=skip_compile_pyc)
     remove_easy_install_pth(files, prefix, config, preserve_egg_dir=preserve_egg_dir)
-    rm_py_along_so(prefix)
+    rm_py_along_so(prefix, files)
+
+
+# prefix -> (set of files relative to prefix, {basename: [files]}), so that relocating many
+#    binaries walks the prefix once instead of once per load command
+_lib_indexes = {}
+_lib_indexes_lock = threading.Lock()
+
+
+def _lib_index(prefix, refresh=False):
+    with _lib_indexes_lock:
+        if refresh or prefix not in _lib_indexes:
+            files = utils.prefix_files(prefix)
+            file_names = defaultdict(list)
+            for f in files:
+                file_names[os.path.basename(f)].append(f)
+            _lib_indexes[prefix] = (files, file_names)
+        return _lib_indexes[prefix]
+
+
+def reset_lib_indexes():
+    """Forget every library index.  Builds in one process reuse the same prefix paths, so
+    each build starts without the indexes of the ones before it."""
+    with _lib_indexes_lock:
+        _lib_indexes.clear()
+
+
+def update_lib_index(prefix, files):
+    """Add files (relative to prefix) that appeared since the library index of prefix was
+    built.  Nothing to do if there is no index yet; the first lookup walks the prefix."""
+    with _lib_indexes_lock:
+        if prefix not in _lib_indexes:
+            return
+        indexed, file_names = _lib_indexes[prefix]
+        for f in files:
+            if f not in indexed:
+                indexed.add(f)
+                file_names[os.path.basename(f)].append(f)
 
 
 def find_lib(link, prefix, path=None):
-    files = utils.prefix_files(prefix)
+    files, file_names = _lib_index(prefix)
     if link.startswith(prefix):
         link = os.path.normpath(link[len(prefix) + 1:])
+        if link not in files:
+            files, file_names = _lib_index(prefix, refresh=True)
         if link not in files:
             sys.exit("Error: Could not find %s" % link)
         return link
@@ -250,27 +367,31 @@ def find_lib(link, prefix, path=None):
         return
     if '/' not in link or link.startswith('@executable_path/'):
         link = os.path.basename(link)
-        file_names = defaultdict(list)
-        for f in files:
-            file_names[os.path.basename(f)].append(f)
-        if link not in file_names:
+        candidates = file_names.get(link, [])
+        # the index may predate files added or removed since; look again before giving up
+        if not candidates or not all(os.path.lexists(os.path.join(prefix, f))
+                                     for f in candidates):
+            files, file_names = _lib_index(prefix, refresh=True)
+            candidates = file_names.get(link, [])
+        if not candidates:
             sys.exit("Error: Could not find %s" % link)
-        if len(file_names[link]) > 1:
+        if len(candidates) > 1:
             if path and os.path.basename(path) == link:
                 # The link is for the file itself, just use it
                 return path
             # Allow for the possibility of the same library appearing in
-            # multiple places.
+            # multiple places.  The digests are remembered by checksums, so each
+            # copy is only read once however many binaries link to it.
             md5s = set()
-            for f in file_names[link]:
-                md5s.add(md5_file(os.path.join(prefix, f)))
+            for f in candidates:
+                md5s.add(checksums.md5_file(os.path.join(prefix, f)))
             if len(md5s) > 1:
-                sys.exit("Error: Found multiple instances of %s: %s" % (link, file_names[link]))
+                sys.exit("Error: Found multiple instances of %s: %s" % (link, candidates))
             else:
-                file_names[link].sort()
+                candidates = sorted(candidates)
                 print("Found multiple instances of %s (%s).  "
-                    "Choosing the first one." % (link, file_names[link]))
-        return file_names[link][0]
+                    "Choosing the first one." % (link, candidates))
+        return candidates[0]
     print("Don't know how to find %s, skipping" % link)
 
 
@@ -356,12 +477,16 @@ def mk_relative_linux(f, prefix, rpaths=('lib',)):
     elf = os.path.join(prefix, f)
     origin = os.path.dirname(elf)
 
-    patchelf = external.find_executable('patchelf', prefix)
-    try:
-        existing = check_output([patchelf, '--print-rpath', elf]).decode('utf-8').splitlines()[0]
-    except:
-        print('patchelf: --print-rpath failed for %s\n' % (elf))
-        return
+    existing = elf_get_rpath(elf)
+    if existing is None:
+        # no section headers to find the dynamic section with; patchelf knows other ways
+        patchelf = external.find_executable('patchelf', prefix)
+        try:
+            existing = check_output([patchelf, '--print-rpath', elf]).decode('utf-8')
+            existing = existing.splitlines()[0]
+        except:
+            print('patchelf: --print-rpath failed for %s\n' % (elf))
+            return
     existing = existing.split(os.pathsep)
     new = []
     for old in existing:
@@ -392,7 +517,10 @@ def mk_relative_linux(f, prefix, rpaths=('lib',)):
             new.append(rpath)
     rpath = ':'.join(new)
     print('patchelf: file: %s\n    setting rpath to: %s' % (elf, rpath))
-    call([patchelf, '--force-rpath', '--set-rpath', rpath, elf])
+    # the new rpath usually fits where the old one was; patchelf is only needed to grow it
+    if not elf_set_rpath(elf, rpath):
+        patchelf = external.find_executable('patchelf', prefix)
+        call([patchelf, '--force-rpath', '--set-rpath', rpath, elf])
 
 
 def assert_relative_osx(path, prefix):
@@ -412,16 +540,62 @@ def mk_relative(m, f, prefix):
         mk_relative_osx(path, prefix=prefix)
 
 
-def fix_permissions(files, prefix):
+def _thread_map(func, items):
+    """map func over items on a thread pool with one thread per cpu."""
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+    pool = ThreadPool(min(cpu_count(), len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def lstat_files(files, prefix):
+    """lstat every file in files (relative to prefix), reading each folder only once.
+    Returns {file: stat result}; files that don't exist are left out."""
+    by_folder = defaultdict(dict)
+    for f in files:
+        folder, fn = os.path.split(f)
+        by_folder[folder][fn] = f
+    stats = {}
+    for folder, names in by_folder.items():
+        path = os.path.join(prefix, folder)
+        try:
+            if scandir:
+                for entry in scandir(path):
+                    if entry.name in names:
+                        stats[names[entry.name]] = entry.stat(follow_symlinks=False)
+            else:
+                for fn, f in names.items():
+                    if os.path.lexists(os.path.join(path, fn)):
+                        stats[f] = os.lstat(os.path.join(path, fn))
+        except OSError:
+            pass
+    return stats
+
+
+def fix_permissions(files, prefix, stats=None):
     print("Fixing permissions")
-    for root, dirs, _ in os.walk(prefix):
-        for dn in dirs:
-            lchmod(os.path.join(root, dn), 0o775)
+    if stats is None:
+        stats = lstat_files(files, prefix)
+    # only the folders that hold new files, up to the prefix; the rest isn't packaged
+    folders = set()
+    for f in files:
+        folder = os.path.dirname(f)
+        while folder and folder not in folders:
+            folders.add(folder)
+            folder = os.path.dirname(folder)
+    for folder in folders:
+        lchmod(os.path.join(prefix, folder), 0o775)
 
     for f in files:
         path = os.path.join(prefix, f)
-        st = os.lstat(path)
-        old_mode = stat.S_IMODE(st.st_mode)
+        if f not in stats:
+            continue
+        old_mode = stat.S_IMODE(stats[f].st_mode)
         new_mode = old_mode
         # broadcast execute
         if old_mode & stat.S_IXUSR:
@@ -438,10 +612,12 @@ def fix_permissions(files, prefix):
 
 def post_build(m, files, prefix, build_python, croot):
     print('number of files:', len(files))
-    fix_permissions(files, prefix)
+    update_lib_index(prefix, files)
+    stats = lstat_files(files, prefix)
+    fix_permissions(files, prefix, stats)
 
-    for f in files:
-        make_hardlink_copy(f, prefix)
+    _thread_map(lambda f: make_hardlink_copy(f, prefix),
+                [f for f in files if f in stats and stats[f].st_nlink > 1])
 
     if sys.platform == 'win32':
         return
@@ -451,15 +627,19 @@ def post_build(m, files, prefix, build_python, croot):
         print("Skipping binary relocation logic")
     osx_is_app = bool(m.get_value('build/osx_is_app', False)) and sys.platform == 'darwin'
 
-    check_symlinks(files, prefix, croot)
+    check_symlinks([f for f in files if f in stats and stat.S_ISLNK(stats[f].st_mode)],
+                   prefix, croot)
 
-    for f in files:
+    def process(f):
         if f.startswith('bin/'):
             fix_shebang(f, prefix=prefix, build_python=build_python, osx_is_app=osx_is_app)
         if binary_relocation is True or (isinstance(binary_relocation, list) and
                                          f in binary_relocation):
             mk_relative(m, f, prefix)
 
+    # every file is fixed up on its own, so they can all be done at once
+    _thread_map(process, files)
+
 
 def check_symlinks(files, prefix, croot):
     if readlink is False:
@@ -506,17 +686,126 @@ def make_hardlink_copy(path, prefix):
     Symlinks are OK, and unaffected here."""
     if not os.path.isabs(path):
         path = os.path.normpath(os.path.join(prefix, path))
-    fn = os.path.basename(path)
-    if os.lstat(path).st_nlink > 1:
-        with TemporaryDirectory() as dest:
-            # copy file to new name
-            utils.copy_into(path, dest)
-            # remove old file
-            utils.rm_rf(path)
-            # rename copy to original filename
-            #   It is essential here to use copying (as opposed to os.rename), so that
-            #        crossing volume boundaries works
-            utils.copy_into(os.path.join(dest, fn), path)
+    # the copy is made in the same folder, so renaming it over the original works
+    utils.break_hardlink(path)
+
+
+# libraries any binary may link to without its package depending on something that ships
+#    them; build/missing_dso_whitelist adds to these.  Matched against the name the binary
+#    records, its basename and where it resolved to.
+_system_libraries = {
+    'linux': ('libc.so*', 'libm.so*', 'libdl.so*', 'libpthread.so*', 'librt.so*',
+              'libutil.so*', 'libcrypt.so*', 'libresolv.so*', 'libnsl.so*', 'ld-linux*.so*',
+              'ld64.so*', 'linux-vdso.so*'),
+    'darwin': ('/usr/lib/libSystem.B.dylib', '/usr/lib/libc++*.dylib', '/usr/lib/libobjc*.dylib',
+               '/System/Library/Frameworks/*'),
+}
+
+_shared_library_re = re.compile(r'\.so(\.|$)|\.dylib$')
+
+
+def _package_name(dist, records):
+    return records[dist]['name'] if dist in records else str(dist)
+
+
+def library_providers(prefix, records=None):
+    """{library file name: set of package names} for the packages linked into prefix, from
+    the conda-meta index of prefix.  records is linked_data(prefix), if it was read already."""
+    if records is None:
+        records = linked_data(prefix)
+    providers = defaultdict(set)
+    for path, dists in utils.conda_meta_index(prefix)[0].items():
+        fn = os.path.basename(path)
+        if _shared_library_re.search(fn):
+            providers[fn].update(_package_name(dist, records) for dist in dists)
+    return providers
+
+
+def _linkage_source(needed, resolved, prefix, own_files, owners, records, providers, allowed):
+    """Where the library a binary needs comes from: 'self', 'system', a package name, or None
+    if nothing provides it.  records is linked_data(prefix)."""
+    if any(fnmatch.fnmatch(name, pattern) for pattern in allowed
+           for name in (needed, os.path.basename(needed), resolved)):
+        return 'system'
+    if os.path.exists(resolved):
+        if not resolved.startswith(prefix + os.path.sep):
+            return 'system'
+        if os.path.relpath(resolved, prefix) in own_files:
+            return 'self'
+        dists = (owners.get(os.path.abspath(resolved)) or
+                 owners.get(os.path.realpath(resolved)))
+        if dists:
+            return ', '.join(sorted(_package_name(dist, records) for dist in dists))
+    # not found where the binary looks for it (yet): match it by name
+    fn = os.path.basename(needed)
+    if any(os.path.basename(f) == fn for f in own_files):
+        return 'self'
+    if fn in providers:
+        return ', '.join(sorted(providers[fn]))
+    return None
+
+
+def check_overlinking(m, files, prefix):
+    """
+    Check every new ELF / Mach-O file links only to libraries from the package itself, from
+    its run requirements or from the system.  Each binary is parsed once (with pyldd) and
+    looked up in the conda-meta index of prefix.  The findings are printed, written to
+    info/linkages.json and, with build/error_overlinking, make the build fail.
+    """
+    if utils.on_win:
+        return {}
+    own_files = set(files)
+    binaries = [f for f in sorted(own_files) if is_codefile(os.path.join(prefix, f))]
+    if not binaries:
+        return {}
+    owners = utils.conda_meta_index(prefix)[0]
+    records = linked_data(prefix)
+    providers = library_providers(prefix, records)
+    platform = 'darwin' if sys.platform == 'darwin' else 'linux'
+    allowed = (_system_libraries[platform] +
+               tuple(utils.ensure_list(m.get_value('build/missing_dso_whitelist', []))))
+    run_deps = set(ms.name for ms in m.ms_depends('run'))
+
+    needed = _thread_map(lambda f: needed_libraries(os.path.join(prefix, f)), binaries)
+    report = {'files': {}, 'overlinking': [], 'missing': []}
+    linked_packages = set()
+    for f, libraries in zip(binaries, needed):
+        report['files'][f] = linkages = {}
+        for lib, resolved in libraries:
+            source = _linkage_source(lib, resolved, prefix, own_files, owners, records,
+                                     providers, allowed)
+            linkages[lib] = source
+            if source is None:
+                report['missing'].append((f, lib))
+            elif source not in ('self', 'system'):
+                packages = set(source.split(', '))
+                linked_packages.update(packages)
+                if not packages & run_deps:
+                    report['overlinking'].append((f, lib, source))
+    # run requirements that ship libraries, but that nothing here links to
+    report['overdepending'] = sorted(
+        dep for dep in run_deps - linked_packages
+        if any(dep in names for names in providers.values()))
+
+    for f in binaries:
+        print("Linkage of %s:" % f)
+        for lib, source in sorted(report['files'][f].items()):
+            print("    %s (%s)" % (lib, source or 'not found'))
+    for f, lib, source in report['overlinking']:
+        print("Overlinking: %s needs %s from %s, which is not a run requirement" %
+              (f, lib, source), file=sys.stderr)
+    for f, lib in report['missing']:
+        print("Missing: %s needs %s, which nothing provides" % (f, lib), file=sys.stderr)
+    for dep in report['overdepending']:
+        print("Overdepending: run requirement %s ships libraries, but none of them are "
+              "linked to" % dep)
+
+    with open(os.path.join(m.config.info_dir, 'linkages.json'), 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    if (report['overlinking'] or report['missing']) and m.get_value('build/error_overlinking'):
+        sys.exit("Error: binaries link to libraries that are neither in the package, "
+                 "its run requirements nor the system (see above)")
+    return report
 
 
 def get_build_metadata(m):
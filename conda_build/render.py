@@ -6,7 +6,7 @@
 
 from __future__ import absolute_import, division, print_function
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from locale import getpreferredencoding
 import os
 from os.path import isdir, isfile, abspath
@@ -24,14 +24,15 @@ from .conda_interface import (PY3, UnsatisfiableError, ProgressiveFetchExtract,
                               TemporaryDirectory)
 from .conda_interface import execute_actions
 from .conda_interface import pkgs_dirs
-from .conda_interface import conda_43
+from .conda_interface import conda_43, Dist, MatchSpec
 
 from conda_build import exceptions, utils, environ
 from conda_build.metadata import MetaData
 import conda_build.source as source
 from conda_build.variants import (get_package_variants, dict_of_lists_to_list_of_dicts,
                                   conform_variants_to_value, list_of_dicts_to_dict_of_lists)
-from conda_build.exceptions import DependencyNeedsBuildingError
+from conda_build.exceptions import DependencyNeedsBuildingError, OfflineRenderError
+from conda_build.features import feature_list
 from conda_build.index import get_build_index
 # from conda_build.jinja_context import pin_subpackage_against_outputs
 
@@ -55,6 +56,69 @@ def actions_to_pins(actions):
     return specs
 
 
+# stands in for the Dist objects conda puts in LINK actions, for environments read from a lockfile
+LockedDist = namedtuple('LockedDist', ('name', 'dist_name'))
+
+_pins_lockfile_cache = {}
+
+
+def load_pins_lockfile(path):
+    """Load a pins lockfile: solved build/host environments to use instead of running the solver.
+
+    The file is yaml, holding either one mapping or a list of them (one per distinct solve, e.g.
+    one per python version):
+
+        - build:
+            - python 3.6.3 h0ef2715_3
+          host:
+            - zlib 1.2.11 ha838bed_2
+          run_exports:
+            zlib:
+              weak:
+                - zlib >=1.2.11,<1.3.0a0
+
+    Records are "name version build" strings, the same form used for finalized pins.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    key = (path, os.path.getmtime(path))
+    if key not in _pins_lockfile_cache:
+        with open(path) as f:
+            locked = yaml.safe_load(f) or []
+        if isinstance(locked, dict):
+            locked = [locked]
+        _pins_lockfile_cache[key] = locked
+    return _pins_lockfile_cache[key]
+
+
+def _record_matches(spec, record):
+    name, version, build = record.split()
+    match_dict = {'name': name, 'version': version, 'build': build, 'build_number': 0}
+    if conda_43:
+        match_dict = Dist(name=name, dist_name='-'.join((name, version, build)), version=version,
+                          build_string=build, build_number=0, channel=None)
+    return MatchSpec(utils.ensure_valid_spec(spec)).match(match_dict)
+
+
+def get_locked_env(m, env, dependencies):
+    """Return the first environment recorded for env in m.config.pins_lockfile that satisfies all
+    of dependencies, as a list of "name version build" records.  None if no entry matches."""
+    for locked in load_pins_lockfile(m.config.pins_lockfile):
+        records = [strip_channel(record) for record in locked.get(env) or []]
+        if all(any(_record_matches(spec, record) for record in records)
+               for spec in dependencies):
+            return records
+    return None
+
+
+def get_locked_run_exports(m):
+    """run_exports recorded in m.config.pins_lockfile, keyed by package name"""
+    run_exports = {}
+    if m.config.pins_lockfile:
+        for locked in load_pins_lockfile(m.config.pins_lockfile):
+            run_exports.update(locked.get('run_exports') or {})
+    return run_exports
+
+
 def get_env_dependencies(m, env, variant, exclude_pattern=None,
                          permit_unsatisfiable_variants=False):
     dash_or_under = re.compile("[-_]")
@@ -98,6 +162,19 @@ def get_env_dependencies(m, env, variant, exclude_pattern=None,
                             for _ in range(10))
     dependencies = set(dependencies)
     unsat = None
+    locked = (get_locked_env(m, env, dependencies) if m.config.pins_lockfile and
+              dependencies else None)
+    if locked is not None:
+        actions = {'LINK': [LockedDist(record.split()[0], '-'.join(record.split()))
+                            for record in locked]}
+        return locked + subpackages + pass_through_deps, actions, unsat
+    if not dependencies and not any(value for _, value in feature_list):
+        # nothing to install; no need to load the index or run the solver
+        return subpackages + pass_through_deps, {}, unsat
+    if m.config.offline_render:
+        raise OfflineRenderError("{} env of {} needs the solver for: {}".format(
+            env, m.name(), ', '.join(sorted(dependencies))))
+
     with TemporaryDirectory(prefix="_", suffix=random_string) as tmpdir:
         try:
             actions = environ.get_install_actions(tmpdir, tuple(dependencies), env,
@@ -177,6 +254,10 @@ def get_upstream_pins(m, actions, env):
     explicit_specs = [req.split(' ')[0] for req in raw_specs]
     linked_packages = actions.get('LINK', [])
     linked_packages = [pkg for pkg in linked_packages if pkg.name in explicit_specs]
+    if not linked_packages:
+        return {}
+    locked = any(isinstance(pkg, LockedDist) for pkg in linked_packages)
+    locked_run_exports = get_locked_run_exports(m) if locked else {}
 
     # edit the plan to download all necessary packages
     for key in ('LINK', 'EXTRACT', 'UNLINK'):
@@ -185,13 +266,15 @@ def get_upstream_pins(m, actions, env):
     # this should be just downloading packages.  We don't need to extract them -
     #    we read contents directly
 
-    index, index_ts = get_build_index(getattr(m.config, '{}_subdir'.format(env)),
-                                      bldpkgs_dir=m.config.bldpkgs_dir,
-                                      output_folder=m.config.output_folder,
-                                      channel_urls=m.config.channel_urls,
-                                      debug=m.config.debug, verbose=m.config.verbose,
-                                      locking=m.config.locking, timeout=m.config.timeout)
-    if 'FETCH' in actions or 'EXTRACT' in actions:
+    index = None
+    if not (locked or m.config.offline_render):
+        index, index_ts = get_build_index(getattr(m.config, '{}_subdir'.format(env)),
+                                          bldpkgs_dir=m.config.bldpkgs_dir,
+                                          output_folder=m.config.output_folder,
+                                          channel_urls=m.config.channel_urls,
+                                          debug=m.config.debug, verbose=m.config.verbose,
+                                          locking=m.config.locking, timeout=m.config.timeout)
+    if index is not None and ('FETCH' in actions or 'EXTRACT' in actions):
         # this is to force the download
         execute_actions(actions, index, verbose=m.config.debug)
     ignore_list = utils.ensure_list(m.get_value('build/ignore_run_exports'))
@@ -199,6 +282,11 @@ def get_upstream_pins(m, actions, env):
     _pkgs_dirs = pkgs_dirs + list(m.config.bldpkgs_dirs)
     additional_specs = {}
     for pkg in linked_packages:
+        if pkg.name in locked_run_exports:
+            specs = locked_run_exports[pkg.name] or {}
+            additional_specs = utils.merge_dicts_of_lists(additional_specs,
+                                                          _filter_run_exports(specs, ignore_list))
+            continue
         pkg_loc = None
         if hasattr(pkg, 'dist_name'):
             pkg_dist = pkg.dist_name
@@ -219,6 +307,15 @@ def get_upstream_pins(m, actions, env):
         # ran through all pkgs_dirs, and did not find package or folder.  Download it.
         # TODO: this is a vile hack reaching into conda's internals. Replace with
         #    proper conda API when available.
+        if not pkg_loc and index is None:
+            # lockfile or offline render: only what is already on disk can be inspected
+            if m.config.offline_render:
+                raise OfflineRenderError("run_exports of {} are not in the pins lockfile or the "
+                                         "package cache".format(pkg_dist))
+            log = utils.get_logger(__name__)
+            log.warn("run_exports of locked package {} are not in the pins lockfile or the "
+                     "package cache; ignoring them".format(pkg_dist))
+            continue
         if not pkg_loc and conda_43:
             try:
                 # the conda 4.4 API uses a single `link_prefs` kwarg
@@ -501,7 +598,9 @@ def distribute_variants(metadata, variants, permit_unsatisfiable_variants=False,
         if 'python' in build_reqs or 'python' in host_reqs:
             conform_dict['python'] = variant['python']
 
-        pin_run_as_build = variant.get('pin_run_as_build', {})
+        # variant dicts are shared with other metadata copies (see Config.copy); don't change
+        #    them in place
+        pin_run_as_build = dict(variant.get('pin_run_as_build', {}))
         if mv.numpy_xx and 'numpy' not in pin_run_as_build:
             pin_run_as_build['numpy'] = {'min_pin': 'x.x', 'max_pin': 'x.x'}
 
@@ -612,13 +711,14 @@ def render_recipe(recipe_path, config, no_download_source=False, variants=None,
             m.config.variant = m.config.variants[0]
         rendered_metadata = [(m, False, False), ]
     else:
-        index, index_ts = get_build_index(m.config.build_subdir,
-                                          bldpkgs_dir=m.config.bldpkgs_dir,
-                                          output_folder=m.config.output_folder,
-                                          channel_urls=m.config.channel_urls,
-                                          omit_defaults=m.config.override_channels,
-                                          debug=m.config.debug, verbose=m.config.verbose,
-                                          locking=m.config.locking, timeout=m.config.timeout)
+        if not m.config.offline_render:
+            index, index_ts = get_build_index(m.config.build_subdir,
+                                              bldpkgs_dir=m.config.bldpkgs_dir,
+                                              output_folder=m.config.output_folder,
+                                              channel_urls=m.config.channel_urls,
+                                              omit_defaults=m.config.override_channels,
+                                              debug=m.config.debug, verbose=m.config.verbose,
+                                              locking=m.config.locking, timeout=m.config.timeout)
         # when building, we don't want to fully expand all outputs into metadata, only expand
         #    whatever variants we have.
         variants = (dict_of_lists_to_list_of_dicts(variants) if variants else
@@ -633,6 +733,105 @@ def render_recipe(recipe_path, config, no_download_source=False, variants=None,
     return rendered_metadata
 
 
+def render_offline(recipe_path, config, variants=None, no_download_source=False):
+    """Render a recipe for its output paths without loading channel data or running the solver.
+
+    Outputs whose filenames carry no dependency hash are named straight from the recipe.  Hashed
+    filenames need solved build/host environments, which are taken from config.pins_lockfile.
+    Anything that still needs the solver is reported, and the recipe is rendered normally."""
+    from conda_build.api import render
+    config = config.copy()
+    config.offline_render = True
+    try:
+        metadata_tuples = render(recipe_path, config=config, variants=variants,
+                                 no_download_source=no_download_source, finalize=False,
+                                 bypass_env_check=True)
+        if any(m.config.filename_hashing and not m.build_string_is_manual
+               for (m, _, _) in metadata_tuples):
+            metadata_tuples = render(recipe_path, config=config, variants=variants,
+                                     no_download_source=no_download_source, finalize=True)
+    except OfflineRenderError as e:
+        log = utils.get_logger(__name__)
+        log.warn("Offline render of {} is not possible ({}).  Falling back to solving "
+                 "environments.".format(recipe_path, e))
+        config.offline_render = False
+        metadata_tuples = render(recipe_path, config=config, variants=variants,
+                                 no_download_source=no_download_source, finalize=True)
+    return metadata_tuples
+
+
+# arguments shared by every recipe in a batch render.  Set in the parent before the worker pool is
+#    created (or by the pool initializer, where workers are spawned rather than forked).
+_batch_render_kwargs = {}
+
+
+def _init_batch_render_worker(render_kwargs):
+    _batch_render_kwargs.clear()
+    _batch_render_kwargs.update(render_kwargs)
+
+
+def _render_recipe_to_dict(recipe_path):
+    """Render one recipe of a batch.  Returns a JSON-serializable summary of its outputs.
+
+    Errors are reported in the summary rather than raised, so that one broken recipe does not
+    take down the rest of the batch."""
+    from conda_build.api import render
+    result = {'recipe': recipe_path, 'outputs': [], 'error': None}
+    kwargs = _batch_render_kwargs.copy()
+    config = kwargs.pop('config')
+    try:
+        metadata_tuples = render(recipe_path, config=config, **kwargs)
+        for (m, _, _) in metadata_tuples:
+            result['outputs'].append({'name': m.name(),
+                                      'version': m.version(),
+                                      'build': m.build_id(),
+                                      'subdir': 'noarch' if (m.noarch or m.noarch_python)
+                                                else m.config.host_subdir,
+                                      'path': bldpkg_path(m),
+                                      'skip': bool(m.skip())})
+    except (Exception, SystemExit) as e:
+        result['error'] = '{}: {}'.format(e.__class__.__name__, e)
+    return result
+
+
+def render_recipes(recipe_paths, config, variants=None, permit_unsatisfiable_variants=True,
+                   finalize=True, bypass_env_check=False, processes=None):
+    """Render many recipes, yielding a summary dictionary for each as soon as it is done.
+
+    The build index and the variant config files that all recipes share are loaded once, in this
+    process, before rendering starts.  Worker processes are forked from here, so they start out
+    with that index snapshot rather than each fetching their own.  With processes=1, recipes are
+    rendered serially in this process."""
+    from multiprocessing import Pool
+    from conda_build.variants import find_config_files, parse_config_file
+
+    render_kwargs = dict(config=config, variants=variants,
+                         permit_unsatisfiable_variants=permit_unsatisfiable_variants,
+                         finalize=finalize, bypass_env_check=bypass_env_check,
+                         no_download_source=config.no_download_source)
+
+    get_build_index(config.build_subdir, bldpkgs_dir=config.bldpkgs_dir,
+                    output_folder=config.output_folder, channel_urls=config.channel_urls,
+                    omit_defaults=config.override_channels, debug=config.debug,
+                    verbose=config.verbose, locking=config.locking, timeout=config.timeout)
+    for config_file in find_config_files(None, utils.ensure_list(config.variant_config_files),
+                                         ignore_system_config=config.ignore_system_variants):
+        parse_config_file(config_file, config)
+
+    _init_batch_render_worker(render_kwargs)
+    if processes == 1 or len(recipe_paths) < 2:
+        for recipe_path in recipe_paths:
+            yield _render_recipe_to_dict(recipe_path)
+    else:
+        pool = Pool(processes, initializer=_init_batch_render_worker, initargs=(render_kwargs, ))
+        try:
+            for result in pool.imap_unordered(_render_recipe_to_dict, recipe_paths):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+
 # Keep this out of the function below so it can be imported by other modules.
 FIELDS = ["package", "source", "build", "requirements", "test", "app", "outputs", "about", "extra"]
 
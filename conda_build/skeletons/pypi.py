@@ -34,9 +34,10 @@ from conda_build.conda_interface import spec_from_line
 from conda_build.conda_interface import input, configparser, StringIO, string_types, PY3
 from conda_build.conda_interface import download
 from conda_build.conda_interface import normalized_version
-from conda_build.conda_interface import human_bytes, hashsum_file
+from conda_build.conda_interface import human_bytes
 from conda_build.conda_interface import default_python
 
+from conda_build.checksums import hashsum_file
 from conda_build.utils import tar_xf, unzip, rm_rf, check_call_env, ensure_list
 from conda_build.source import apply_patch
 from conda_build.environ import create_env
@@ -1,23 +1,33 @@
 from __future__ import absolute_import, division, print_function
 
+from collections import OrderedDict
+import hashlib
 import io
+import json
 import locale
+from multiprocessing.pool import ThreadPool
 import os
 from os.path import join, isdir, isfile, abspath, basename, exists, normpath, expanduser
 import re
 import shutil
 from subprocess import CalledProcessError
 import sys
+import threading
 import time
 
+import filelock
+import requests
+
 from .conda_interface import download, TemporaryDirectory
-from .conda_interface import hashsum_file
+from .conda_interface import human_bytes
 
+from conda_build.checksums import file_hashes, hashsum_file, record_hashes
+from conda_build.environ import reset_cached_vars
 from conda_build.os_utils import external
-from conda_build.conda_interface import url_path, CondaHTTPError
+from conda_build.conda_interface import url_path, CondaHTTPError, CondaSession
 from conda_build.utils import (tar_xf, unzip, safe_print_unicode, copy_into, on_win, ensure_list,
                                check_output_env, check_call_env, convert_path_for_cygwin_or_msys2,
-                               get_logger, rm_rf, LoggingContext)
+                               get_logger, get_lock, rm_rf, LoggingContext)
 
 
 if on_win:
@@ -36,82 +46,440 @@ def append_hash_to_fn(fn, hash_value):
     return ext_re.sub(r"\1_{}\2".format(hash_value[:10]), fn)
 
 
-def download_to_cache(cache_folder, recipe_path, source_dict):
-    ''' Download a source to the local cache. '''
-    print('Source cache directory is: %s' % cache_folder)
-    if not isdir(cache_folder):
-        os.makedirs(cache_folder)
+# size of the blocks streamed to disk (and into the hash) while downloading
+_download_chunk_size = 256 * 1024
+# how many times an interrupted transfer is resumed before a mirror is given up on
+_download_retries = 3
 
-    unhashed_fn = fn = source_dict['fn'] if 'fn' in source_dict else basename(source_dict['url'])
-    hash_added = False
+
+def _cache_fn(source_dict):
+    """Return (unhashed_fn, fn, hash_type) for a url source.  hash_type is None when the
+    recipe did not provide a hash."""
+    unhashed_fn = fn = source_dict['fn'] if 'fn' in source_dict else basename(
+        ensure_list(source_dict['url'])[0])
     for hash_type in ('md5', 'sha1', 'sha256'):
         if hash_type in source_dict:
-            fn = append_hash_to_fn(fn, source_dict[hash_type])
-            hash_added = True
-            break
+            return unhashed_fn, append_hash_to_fn(fn, source_dict[hash_type]), hash_type
+    return unhashed_fn, fn, None
+
+
+def _source_urls(source_dict, recipe_path):
+    urls = []
+    for url in ensure_list(source_dict['url']):
+        if "://" not in url:
+            if url.startswith('~'):
+                url = expanduser(url)
+            if not os.path.isabs(url):
+                url = os.path.normpath(os.path.join(recipe_path, url))
+            url = url_path(url)
+        else:
+            if url.startswith('file:///~'):
+                url = 'file:///' + expanduser(url[8:]).replace('\\', '/')
+        urls.append(url)
+    return urls
+
+
+def _partial_path(path, url):
+    """Each mirror gets its own partial file, so that a resumed transfer only ever continues
+    bytes that came from the same server."""
+    url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()[:10]
+    return '{0}.{1}.partial'.format(path, url_hash)
+
+
+def _fetch_url(url, partial_path, hash_types, cancelled, timeout=90):
+    """Download url into partial_path, continuing from whatever an earlier attempt left there.
+
+    The hashes are computed while streaming, so the finished file never has to be read again.
+    Returns a dict of hex digests of the complete file, or None if the download was
+    cancelled."""
+    if not url.startswith(('http://', 'https://')):
+        # file://, ftp:// and friends: no ranges to resume from.  Let conda handle them.
+        rm_rf(partial_path)
+        with LoggingContext():
+            download(url, partial_path)
+        return file_hashes(partial_path, hash_types)
+
+    hashers = {hash_type: hashlib.new(hash_type) for hash_type in hash_types}
+    offset = 0
+    if isfile(partial_path):
+        with open(partial_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_download_chunk_size), b''):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                offset += len(chunk)
+
+    headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+    # conda's session applies the condarc proxy_servers, ssl_verify and channel credentials.
+    #    One per transfer, because sessions are not safe to share between threads.
+    response = CondaSession().get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        if offset and response.status_code == 416:
+            # nothing left to send: the partial file is already complete
+            return {hash_type: hasher.hexdigest() for hash_type, hasher in hashers.items()}
+        response.raise_for_status()
+        mode = 'ab'
+        if offset and response.status_code != 206:
+            # server ignored the range request; start over
+            hashers = {hash_type: hashlib.new(hash_type) for hash_type in hash_types}
+            mode = 'wb'
+        with open(partial_path, mode) as f:
+            for chunk in response.iter_content(_download_chunk_size):
+                if cancelled.is_set():
+                    return None
+                f.write(chunk)
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+    finally:
+        response.close()
+    return {hash_type: hasher.hexdigest() for hash_type, hasher in hashers.items()}
+
+
+def _download_from_mirrors(urls, path, hash_type, expected_hash=None, timeout=90, threads=4):
+    """Race all mirror urls for one file.  The first mirror to deliver a file with the right
+    hash wins; the others are cancelled.  Returns a dict with the hash_type and sha256 hex
+    digests of the downloaded file."""
+    hash_types = {hash_type, 'sha256'}
+    cancelled = threading.Event()
+    winner_lock = threading.Lock()
+    winner = []
+    errors = []
+
+    def fetch(url):
+        partial_path = _partial_path(path, url)
+        print("Downloading %s" % url)
+        for _ in range(_download_retries):
+            resumed = isfile(partial_path)
+            try:
+                digests = _fetch_url(url, partial_path, hash_types, cancelled, timeout)
+            except (requests.exceptions.RequestException, CondaHTTPError, RuntimeError,
+                    IOError, OSError) as e:
+                # keep the partial file: the next attempt picks up where this one stopped
+                error = e
+                continue
+            if digests is None:
+                return
+            if expected_hash and digests[hash_type] != expected_hash:
+                rm_rf(partial_path)
+                error = RuntimeError("%s mismatch: '%s' != '%s'" %
+                                     (hash_type.upper(), digests[hash_type], expected_hash))
+                if resumed:
+                    # the stale partial file may have been the culprit; try once from scratch
+                    continue
+                break
+            with winner_lock:
+                if not winner:
+                    winner.append((partial_path, digests))
+                    cancelled.set()
+            return
+        print("Error: %s" % str(error).strip(), file=sys.stderr)
+        errors.append(error)
+
+    if len(urls) == 1 or threads < 2:
+        for url in urls:
+            fetch(url)
+            if winner:
+                break
     else:
+        pool = ThreadPool(min(threads, len(urls)))
+        try:
+            pool.map(fetch, urls)
+        finally:
+            pool.close()
+            pool.join()
+
+    if not winner:
+        for error in errors:
+            if 'mismatch' in str(error):
+                raise error
+        raise RuntimeError("Could not download %s" % ', '.join(urls))
+    partial_path, digests = winner[0]
+    os.rename(partial_path, path)
+    # so that later uses of the cached file don't have to read it again
+    record_hashes(path, digests)
+    for url in urls:
+        rm_rf(_partial_path(path, url))
+    print("Success")
+    return digests
+
+
+def _parse_size(value):
+    """Turn a size like 20000000, '500M' or '20 GB' into a number of bytes."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$', value, re.IGNORECASE)
+    if not match:
+        raise ValueError("Could not understand size %r.  Use a number of bytes, optionally "
+                         "followed by K, M, G or T." % value)
+    power = ' kmgt'.index(match.group(2).lower() or ' ')
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def _store_dir(cache_folder):
+    """Content-addressed store within the source cache.  Files are named by their sha256;
+    the recipe-facing file names in the cache folder are hardlinks to them."""
+    return join(cache_folder, 'sha256')
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except (AttributeError, OSError):
+        # no hardlinks on this platform or filesystem
+        shutil.copy2(src, dst)
+
+
+def _add_to_store(cache_folder, path, sha256, alias_path, timeout=90):
+    """Put the file at path into the store, and make alias_path a name for it.  Content that
+    is already stored (under another name, or from a source without a hash) is kept once."""
+    store = _store_dir(cache_folder)
+    blob = join(store, sha256)
+    with get_lock(store, timeout=timeout):
+        if not isdir(store):
+            os.makedirs(store)
+        if not isfile(blob):
+            _link_or_copy(path, blob)
+        if isfile(alias_path) and os.stat(alias_path).st_ino != os.stat(blob).st_ino:
+            rm_rf(alias_path)
+        if not isfile(alias_path):
+            _link_or_copy(blob, alias_path)
+        if path != alias_path:
+            rm_rf(path)
+
+
+def _cache_entries(cache_folder):
+    """Group the files of a source cache by inode: one [size, last_used, paths] entry for
+    each distinct piece of content, with every name it is known under."""
+    entries = {}
+    for folder in (cache_folder, _store_dir(cache_folder)):
+        if not isdir(folder):
+            continue
+        for fn in os.listdir(folder):
+            path = join(folder, fn)
+            if fn.endswith(('.partial', '.lock')) or not isfile(path):
+                continue
+            st = os.stat(path)
+            # st_ino is 0 where the platform can't tell us; those files stand alone
+            key = (st.st_dev, st.st_ino) if st.st_ino else path
+            entry = entries.setdefault(key, [st.st_size, max(st.st_atime, st.st_mtime), []])
+            entry[2].append(path)
+    return list(entries.values())
+
+
+def _prepared_entries(prepared_cache):
+    """[size, last_used, [entry folder]] for each prepared source, like _cache_entries.  The
+    size comes from the manifest the entry was sealed with."""
+    entries = []
+    if not prepared_cache or not isdir(prepared_cache):
+        return entries
+    for fn in os.listdir(prepared_cache):
+        entry = join(prepared_cache, fn)
+        if fn.endswith('.lock') or not isdir(entry):
+            continue
+        try:
+            with open(join(entry, 'manifest.json')) as f:
+                size = sum(stat[0] for stat in json.load(f).values())
+        except (IOError, OSError, ValueError):
+            # not sealed (yet)
+            size = 0
+        entries.append([size, os.path.getmtime(entry), [entry]])
+    return entries
+
+
+def _entry_lock_paths(cache_folder, paths, extract_cache):
+    """The lock files that builds using a cache entry hold: those download_to_cache and unpack
+    take for each name in the cache folder, _extracted_tree takes for its extraction and
+    _restore_prepared_source takes for a prepared source.  Store files have none of their
+    own."""
+    store = _store_dir(cache_folder)
+    lock_paths = []
+    for path in paths:
+        if os.path.dirname(path) == store:
+            continue
+        lock_paths.append(path + '.lock')
+        if extract_cache and not isdir(path):
+            lock_paths.append(join(extract_cache, basename(path)) + '.lock')
+    return lock_paths
+
+
+def evict_source_cache(cache_folder, max_size, keep=(), timeout=90, extract_cache=None,
+                       prepared_cache=None):
+    """Remove the least recently used sources until the cache holds at most max_size bytes.
+    Files in keep are never removed.  Cached extractions of removed sources in extract_cache
+    are removed along with them.  Prepared sources in prepared_cache count towards max_size,
+    and are removed in the same least recently used order.  Entries that a build holds the
+    lock of (see _entry_lock_paths) are in use, and stay.  Returns the number of bytes
+    freed."""
+    keep = {normpath(path) for path in keep}
+    freed = 0
+    with get_lock(_store_dir(cache_folder), timeout=timeout):
+        entries = sorted(_cache_entries(cache_folder) + _prepared_entries(prepared_cache),
+                         key=lambda entry: entry[1])
+        total = sum(entry[0] for entry in entries)
+        for size, _, paths in entries:
+            if total <= max_size:
+                break
+            if keep.intersection(normpath(path) for path in paths):
+                continue
+            locks = []
+            try:
+                for lock_path in _entry_lock_paths(cache_folder, paths, extract_cache):
+                    lock = filelock.FileLock(lock_path, timeout=0)
+                    lock.acquire()
+                    locks.append(lock)
+                if isdir(paths[0]):
+                    rm_rf(paths[0])
+                else:
+                    for path in paths:
+                        os.remove(path)
+                    if extract_cache:
+                        for path in paths:
+                            rm_rf(join(extract_cache, basename(path)))
+            except filelock.Timeout:
+                continue
+            except OSError:
+                # in use by another build (windows); it will go on a later pass
+                continue
+            finally:
+                for lock in locks:
+                    lock.release()
+            total -= size
+            freed += size
+    return freed
+
+
+def clean_source_cache(config):
+    """Trim the source cache, prepared (patched) sources included, down to
+    config.src_cache_max_size, or empty it if no limit is configured.  Partial downloads that
+    have not been touched for a day and extracted sources whose archive is gone are removed
+    too."""
+    # these create the folders, so a cache that was never used is just empty
+    cache_folder = config.src_cache
+    extracted_cache = config.extracted_cache
+    prepared_cache = config.prepared_cache
+    max_size = _parse_size(config.src_cache_max_size) or 0
+    freed = evict_source_cache(cache_folder, max_size, timeout=config.timeout,
+                               extract_cache=extracted_cache, prepared_cache=prepared_cache)
+    for fn in os.listdir(cache_folder):
+        path = join(cache_folder, fn)
+        if fn.endswith('.partial') and time.time() - os.path.getmtime(path) > 24 * 60 * 60:
+            freed += os.path.getsize(path)
+            rm_rf(path)
+    # extractions of sources that were removed some other way
+    for fn in os.listdir(extracted_cache):
+        if not fn.endswith('.lock') and not isfile(join(cache_folder, fn)):
+            rm_rf(join(extracted_cache, fn))
+    print("Removed %s from source cache %s" % (human_bytes(freed), cache_folder))
+    return freed
+
+
+def download_to_cache(cache_folder, recipe_path, source_dict, timeout=90, threads=4,
+                      max_size=None, extract_cache=None, prepared_cache=None):
+    ''' Download a source to the local cache.  If max_size is given, the least recently used
+    sources (and prepared sources, see evict_source_cache) are evicted to keep the cache below
+    that many bytes. '''
+    print('Source cache directory is: %s' % cache_folder)
+    try:
+        os.makedirs(cache_folder)
+    except OSError:
+        # other threads may be populating the same cache
+        if not isdir(cache_folder):
+            raise
+
+    unhashed_fn, fn, hash_type = _cache_fn(source_dict)
+    if not hash_type:
         log = get_logger(__name__)
         log.warn("No hash (md5, sha1, sha256) provided.  Source download forced.  "
                  "Add hash to recipe to use source cache.")
     path = join(cache_folder, fn)
-    if isfile(path):
-        print('Found source in cache: %s' % fn)
-    else:
-        print('Downloading source to cache: %s' % fn)
-        if not isinstance(source_dict['url'], list):
-            source_dict['url'] = [source_dict['url']]
-
-        for url in source_dict['url']:
-            if "://" not in url:
-                if url.startswith('~'):
-                    url = expanduser(url)
-                if not os.path.isabs(url):
-                    url = os.path.normpath(os.path.join(recipe_path, url))
-                url = url_path(url)
-            else:
-                if url.startswith('file:///~'):
-                    url = 'file:///' + expanduser(url[8:]).replace('\\', '/')
-            try:
-                print("Downloading %s" % url)
-                with LoggingContext():
-                    download(url, path)
-            except CondaHTTPError as e:
-                print("Error: %s" % str(e).strip(), file=sys.stderr)
-                rm_rf(path)
-            except RuntimeError as e:
-                print("Error: %s" % str(e).strip(), file=sys.stderr)
-                rm_rf(path)
+    digests = None
+    # one download per file, whether the competition is another thread or another process
+    with filelock.FileLock(path + '.lock'):
+        if isfile(path):
+            print('Found source in cache: %s' % fn)
+            if hash_type and os.stat(path).st_nlink > 1:
+                hashed = hashsum_file(path, hash_type)
             else:
-                print("Success")
-                break
-        else:  # no break
-            rm_rf(path)
-            raise RuntimeError("Could not download %s" % url)
-
-    hashed = None
-    for tp in ('md5', 'sha1', 'sha256'):
-        if tp in source_dict:
-            expected_hash = source_dict[tp]
-            hashed = hashsum_file(path, tp)
-            if expected_hash != hashed:
+                # cached before there was a store; move it in
+                digests = file_hashes(path, {hash_type or 'sha256', 'sha256'})
+                hashed = digests[hash_type or 'sha256']
+            if hash_type and hashed != source_dict[hash_type]:
                 rm_rf(path)
                 raise RuntimeError("%s mismatch: '%s' != '%s'" %
-                           (tp.upper(), hashed, expected_hash))
-            break
-
-    # this is really a fallback.  If people don't provide the hash, we still need to prevent
-    #    collisions in our source cache, but the end user will get no benefirt from the cache.
-    if not hash_added:
-        if not hashed:
-            hashed = hashsum_file(path, 'sha256')
-        dest_path = append_hash_to_fn(path, hashed)
-        if not os.path.isfile(dest_path):
-            os.rename(path, dest_path)
-        path = dest_path
+                           (hash_type.upper(), hashed, source_dict[hash_type]))
+        else:
+            print('Downloading source to cache: %s' % fn)
+            digests = _download_from_mirrors(_source_urls(source_dict, recipe_path), path,
+                                             hash_type or 'sha256', source_dict.get(hash_type),
+                                             timeout=timeout, threads=threads)
+
+        if digests:
+            # this is really a fallback.  If people don't provide the hash, we still need to
+            #    prevent collisions in our source cache, but the end user will get no benefirt
+            #    from the cache.
+            alias_path = path if hash_type else append_hash_to_fn(path, digests['sha256'])
+            _add_to_store(cache_folder, path, digests['sha256'], alias_path, timeout=timeout)
+            path = alias_path
+        # last use time of the stored content, for LRU eviction
+        os.utime(path, None)
+
+    max_size = _parse_size(max_size)
+    if digests and max_size is not None:
+        evict_source_cache(cache_folder, max_size, keep=[path], timeout=timeout,
+                           extract_cache=extract_cache, prepared_cache=prepared_cache)
 
     return path, unhashed_fn
 
 
+def download_sources(metadata):
+    """Fetch all url sources of a recipe into the source cache at the same time.
+
+    Returns a dict mapping the index of each url source in the source section to the
+    (path, unhashed_fn) pair from download_to_cache."""
+    meta = metadata.get_section('source')
+    dicts = [meta] if hasattr(meta, 'keys') else meta
+    config = metadata.config
+    jobs = [(i, source_dict) for i, source_dict in enumerate(dicts)
+            if any(k in source_dict for k in ('fn', 'url'))]
+
+    def fetch(job):
+        i, source_dict = job
+        return i, download_to_cache(config.src_cache, metadata.path, source_dict,
+                                    timeout=config.timeout, threads=config.download_threads,
+                                    max_size=config.src_cache_max_size,
+                                    extract_cache=config.extracted_cache,
+                                    prepared_cache=config.prepared_cache)
+
+    if len(jobs) < 2 or config.download_threads < 2:
+        return dict(fetch(job) for job in jobs)
+    pool = ThreadPool(min(config.download_threads, len(jobs)))
+    try:
+        return dict(pool.map(fetch, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def download_sources_in_background(metadata_list):
+    """Fill the source cache for recipes that will be built later, while earlier ones build.
+
+    Failures are only logged; the build of the affected recipe downloads again and reports
+    the error properly."""
+    metadata_list = [m.copy() for m in metadata_list]
+
+    def fetch_all():
+        log = get_logger(__name__)
+        for metadata in metadata_list:
+            try:
+                download_sources(metadata)
+            except Exception as e:
+                log.debug("Prefetching source for %s failed: %s", metadata.path, e)
+
+    thread = threading.Thread(target=fetch_all)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
 def hoist_single_extracted_folder(nested_folder):
     """Moves all files/folders one level up.
 
@@ -128,43 +496,232 @@ def hoist_single_extracted_folder(nested_folder):
     rm_rf(nested_folder)
 
 
+def _extract_archive(src_path, unhashed_fn, dest, timeout=90, locking=True):
+    """Extract (or copy) a downloaded source into dest, hoisting a single top-level folder."""
+    unhashed_dest = os.path.join(dest, unhashed_fn)
+    if src_path.lower().endswith(('.tar.gz', '.tar.bz2', '.tgz', '.tar.xz',
+            '.tar', 'tar.z')):
+        tar_xf(src_path, dest)
+    elif src_path.lower().endswith('.zip'):
+        unzip(src_path, dest)
+    elif src_path.lower().endswith('.whl'):
+        # copy wheel itself *and* unpack it
+        # This allows test_files or about.license_file to locate files in the wheel,
+        # as well as `pip install name-version.whl` as install command
+        unzip(src_path, dest)
+        copy_into(src_path, unhashed_dest, timeout, locking=locking)
+    else:
+        # In this case, the build script will need to deal with unpacking the source
+        print("Warning: Unrecognized source format. Source file will be copied to the SRC_DIR")
+        copy_into(src_path, unhashed_dest, timeout, locking=locking)
+    flist = os.listdir(dest)
+    folder = os.path.join(dest, flist[0])
+    if len(flist) == 1 and os.path.isdir(folder):
+        hoist_single_extracted_folder(folder)
+
+
+def _tree_manifest(tree):
+    """Size and modification time of every file in a cached tree.  A file that was written
+    through a hardlink in some work dir no longer matches."""
+    manifest = {}
+    for root, _, files in os.walk(tree):
+        for fn in files:
+            path = join(root, fn)
+            if not os.path.islink(path):
+                st = os.stat(path)
+                manifest[os.path.relpath(path, tree)] = [st.st_size, st.st_mtime, st.st_mode]
+    return manifest
+
+
+def _cached_tree_intact(entry):
+    """Whether the tree of a cache entry is complete and unchanged since it was sealed."""
+    manifest_path = join(entry, 'manifest.json')
+    if not isfile(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        return json.load(f) == _tree_manifest(join(entry, 'tree'))
+
+
+def _seal_cached_tree(entry):
+    with open(join(entry, 'manifest.json'), 'w') as f:
+        json.dump(_tree_manifest(join(entry, 'tree')), f)
+
+
+def _extracted_tree(src_path, unhashed_fn, extract_cache, timeout=90, locking=True):
+    """Return the folder holding the extracted contents of src_path, extracting it only if
+    no intact copy is cached yet."""
+    # the file name in the source cache carries the name and hash of the archive
+    entry = join(extract_cache, basename(src_path))
+    tree = join(entry, 'tree')
+    # no timeout: extracting a big archive can take longer than any sensible one
+    with filelock.FileLock(entry + '.lock'):
+        if _cached_tree_intact(entry):
+            return tree
+        if isdir(entry):
+            log = get_logger(__name__)
+            log.warn("Cached extraction of %s was modified; extracting again.", basename(src_path))
+        rm_rf(entry)
+        os.makedirs(tree)
+        _extract_archive(src_path, unhashed_fn, tree, timeout=timeout, locking=locking)
+        _seal_cached_tree(entry)
+    return tree
+
+
+# FICLONE from linux/fs.h: share the data blocks of another file, copy-on-write
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """Copy-on-write clone of src at dst, on filesystems that support it (btrfs, xfs).
+    Returns False, leaving nothing behind, where they don't."""
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            except (IOError, OSError):
+                cloned = False
+            else:
+                cloned = True
+    if cloned:
+        shutil.copystat(src, dst)
+    else:
+        os.remove(dst)
+    return cloned
+
+
+def materialize_tree(tree, dest):
+    """Populate dest with the contents of tree, with reflinks where the filesystem can make
+    them, and plain copies where it can't.
+
+    Never hardlinks: build scripts change source files in place (sed -i, configure), and
+    that must not reach the cache, or other builds filling their work dirs from it."""
+    can_reflink = True
+    for root, dirs, files in os.walk(tree):
+        dest_root = join(dest, os.path.relpath(root, tree))
+        if not isdir(dest_root):
+            os.makedirs(dest_root)
+        for fn in dirs + files:
+            src = join(root, fn)
+            dst = join(dest_root, fn)
+            if os.path.islink(src):
+                rm_rf(dst)
+                os.symlink(os.readlink(src), dst)
+            elif fn in dirs:
+                if not isdir(dst):
+                    rm_rf(dst)
+            else:
+                rm_rf(dst)
+                if can_reflink:
+                    can_reflink = _reflink(src, dst)
+                    if can_reflink:
+                        continue
+                shutil.copy2(src, dst)
+
+
 def unpack(source_dict, src_dir, cache_folder, recipe_path, croot, verbose=False,
-           timeout=90, locking=True):
-    ''' Uncompress a downloaded source. '''
-    src_path, unhashed_fn = download_to_cache(cache_folder, recipe_path, source_dict)
+           timeout=90, locking=True, downloaded=None, extract_cache=None):
+    ''' Uncompress a downloaded source.  downloaded is the (path, unhashed_fn) result of
+    download_to_cache, if the source has already been fetched.  With extract_cache, each
+    archive is extracted once and src_dir is populated from there. '''
+    src_path, unhashed_fn = downloaded or download_to_cache(cache_folder, recipe_path,
+                                                            source_dict, timeout=timeout)
 
     if not isdir(src_dir):
         os.makedirs(src_dir)
     if verbose:
         print("Extracting download")
-    with TemporaryDirectory(dir=croot) as tmpdir:
-        unhashed_dest = os.path.join(tmpdir, unhashed_fn)
-        if src_path.lower().endswith(('.tar.gz', '.tar.bz2', '.tgz', '.tar.xz',
-                '.tar', 'tar.z')):
-            tar_xf(src_path, tmpdir)
-        elif src_path.lower().endswith('.zip'):
-            unzip(src_path, tmpdir)
-        elif src_path.lower().endswith('.whl'):
-            # copy wheel itself *and* unpack it
-            # This allows test_files or about.license_file to locate files in the wheel,
-            # as well as `pip install name-version.whl` as install command
-            unzip(src_path, tmpdir)
-            copy_into(src_path, unhashed_dest, timeout, locking=locking)
+    # evict_source_cache leaves sources alone while their lock is held
+    with filelock.FileLock(src_path + '.lock'):
+        if not isfile(src_path):
+            # evicted between the download and now
+            src_path = None
+        elif extract_cache:
+            materialize_tree(_extracted_tree(src_path, unhashed_fn, extract_cache,
+                                             timeout=timeout, locking=locking), src_dir)
         else:
-            # In this case, the build script will need to deal with unpacking the source
-            print("Warning: Unrecognized source format. Source file will be copied to the SRC_DIR")
-            copy_into(src_path, unhashed_dest, timeout, locking=locking)
-        flist = os.listdir(tmpdir)
-        folder = os.path.join(tmpdir, flist[0])
-        if len(flist) == 1 and os.path.isdir(folder):
-            hoist_single_extracted_folder(folder)
-        flist = os.listdir(tmpdir)
-        for f in flist:
-            shutil.move(os.path.join(tmpdir, f), os.path.join(src_dir, f))
+            with TemporaryDirectory(dir=croot) as tmpdir:
+                _extract_archive(src_path, unhashed_fn, tmpdir, timeout=timeout,
+                                 locking=locking)
+                flist = os.listdir(tmpdir)
+                for f in flist:
+                    shutil.move(os.path.join(tmpdir, f), os.path.join(src_dir, f))
+    if not src_path and downloaded:
+        unpack(source_dict, src_dir, cache_folder, recipe_path, croot, verbose=verbose,
+               timeout=timeout, locking=locking, extract_cache=extract_cache)
+    elif not src_path:
+        raise RuntimeError("Source %s was removed from the cache before it could be unpacked"
+                           % unhashed_fn)
+
+
+def _git_has_commits(git, repo_dir, revs):
+    """Whether all of revs resolve to commits in the repository at repo_dir."""
+    with open(os.devnull, 'w') as devnull:
+        for rev in revs:
+            try:
+                check_output_env([git, 'rev-parse', '--verify', '--quiet', rev + '^{commit}'],
+                                 cwd=repo_dir, stderr=devnull)
+            except CalledProcessError:
+                return False
+    return True
+
+
+def _git_mirror_is_fresh(git, mirror_dir, revs, max_age):
+    """A mirror needs no fetch if it already has every commit asked for by its full sha, or if
+    it was fetched less than max_age minutes ago and all of revs resolve in it."""
+    if revs and all(re.match('^[0-9a-f]{40}$', rev) for rev in revs):
+        return _git_has_commits(git, mirror_dir, revs)
+    stamp = join(mirror_dir, 'conda_build_last_fetch')
+    return bool(max_age and isfile(stamp) and
+                time.time() - os.path.getmtime(stamp) < max_age * 60 and
+                _git_has_commits(git, mirror_dir, revs))
+
+
+def _git_stamp_fetch(mirror_dir):
+    with open(join(mirror_dir, 'conda_build_last_fetch'), 'w') as f:
+        f.write(time.ctime())
+
+
+def _git_fetch_missing_blobs(git, mirror_dir, revs, stdout=None, stderr=None):
+    """Partial (--filter=blob:none) mirrors only have the blobs that were asked for.  Clones
+    made from a mirror can't fetch what it lacks, so get the blobs of revs in one go."""
+    try:
+        promisor = check_output_env([git, 'config', '--get', 'remote.origin.promisor'],
+                                    cwd=mirror_dir, stderr=stderr)
+    except CalledProcessError:
+        return
+    if promisor.decode('utf-8').strip() != 'true':
+        return
+    # --no-walk: only the trees of these commits, not their history
+    listing = check_output_env([git, 'rev-list', '--objects', '--no-walk', '--missing=print'] +
+                               list(revs), cwd=mirror_dir, stderr=stderr).decode('utf-8')
+    missing = [line[1:].strip() for line in listing.splitlines() if line.startswith('?')]
+    # in batches, to stay below command line length limits
+    for start in range(0, len(missing), 1000):
+        check_call_env([git, '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', '--no-tags',
+                        '--filter=blob:none', 'origin'] + missing[start:start + 1000],
+                       cwd=mirror_dir, stdout=stdout, stderr=stderr)
+
+
+def _git_gitlink_revs(git, checkout_dir, submod_name):
+    """The commit a checkout records for one of its submodules, as a one-item list."""
+    try:
+        path = check_output_env([git, 'config', '--file', '.gitmodules', '--get',
+                                 'submodule.%s.path' % submod_name], cwd=checkout_dir)
+        entry = check_output_env([git, 'ls-tree', 'HEAD', path.decode('utf-8').strip()],
+                                 cwd=checkout_dir)
+    except CalledProcessError:
+        return []
+    fields = entry.decode('utf-8').split()
+    return [fields[2]] if len(fields) > 2 and fields[1] == 'commit' else []
 
 
 def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_cache, git_ref=None,
-                                  git_depth=-1, is_top_level=True, verbose=True):
+                                  git_depth=-1, is_top_level=True, verbose=True,
+                                  mirror_max_age=0, partial_clone=False, jobs=4,
+                                  needed_revs=()):
     """ Mirror (and checkout) a Git repository recursively.
 
         It's not possible to use `git submodule` on a bare
@@ -178,6 +735,14 @@ def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_ca
         that case conda-build could be tricked into writing
         to the root of the drive and overwriting the system
         folders unless steps are taken to prevent that.
+
+        Mirrors that were fetched less than mirror_max_age
+        minutes ago, or that already hold the exact commits
+        needed, are not fetched again.  With partial_clone,
+        new mirrors are made with --filter=blob:none.
+        Relatively specified submodules are mirrored `jobs`
+        at a time.  needed_revs are the commits of a
+        submodule mirror that the superproject refers to.
     """
 
     if verbose:
@@ -196,11 +761,20 @@ def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_ca
     git_mirror_dir = convert_path_for_cygwin_or_msys2(git, mirror_dir)
     git_checkout_dir = convert_path_for_cygwin_or_msys2(git, checkout_dir)
 
+    # only for new mirrors: fetching with --depth would make an existing (maybe full) mirror
+    #    shallow for every recipe that shares it
+    depth_args = ['--depth', str(git_depth)] if git_depth > 0 else []
+    wanted_revs = ([git_ref or 'HEAD'] if is_top_level else list(needed_revs)) or ['HEAD']
+
     if not isdir(os.path.dirname(mirror_dir)):
         os.makedirs(os.path.dirname(mirror_dir))
     if isdir(mirror_dir):
-        if git_ref != 'HEAD':
+        if _git_mirror_is_fresh(git, mirror_dir, wanted_revs, mirror_max_age):
+            if verbose:
+                print('Mirror %s is recent enough; not fetching' % mirror_dir)
+        elif git_ref != 'HEAD':
             check_call_env([git, 'fetch'], cwd=mirror_dir, stdout=stdout, stderr=stderr)
+            _git_stamp_fetch(mirror_dir)
         else:
             # Unlike 'git clone', fetch doesn't automatically update the cache's HEAD,
             # So here we explicitly store the remote HEAD in the cache's local refs/heads,
@@ -212,10 +786,11 @@ def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_ca
                        cwd=mirror_dir, stdout=stdout, stderr=stderr)
             check_call_env([git, 'symbolic-ref', 'HEAD', 'refs/heads/_conda_cache_origin_head'],
                        cwd=mirror_dir, stdout=stdout, stderr=stderr)
+            _git_stamp_fetch(mirror_dir)
     else:
-        args = [git, 'clone', '--mirror']
-        if git_depth > 0:
-            args += ['--depth', str(git_depth)]
+        args = [git, 'clone', '--mirror'] + depth_args
+        if partial_clone:
+            args += ['--filter=blob:none']
         try:
             check_call_env(args + [git_url, git_mirror_dir], stdout=stdout, stderr=stderr)
         except CalledProcessError:
@@ -229,6 +804,9 @@ def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_ca
                 git_url = normpath(git_url)
             check_call_env(args + [git_url, git_mirror_dir], stdout=stdout, stderr=stderr)
         assert isdir(mirror_dir)
+        _git_stamp_fetch(mirror_dir)
+    _git_fetch_missing_blobs(git, mirror_dir, ['HEAD'] + wanted_revs, stdout=stdout,
+                             stderr=stderr)
 
     # Now clone from mirror_dir into checkout_dir.
     check_call_env([git, 'clone', git_mirror_dir, git_checkout_dir], stdout=stdout, stderr=stderr)
@@ -253,6 +831,9 @@ def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_ca
         submodules = submodules.decode('utf-8').splitlines()
     except CalledProcessError:
         submodules = []
+    # mirror dir -> (url, commits the superproject needs from it).  Two submodules can share a
+    #    mirror; it must only be worked on by one thread.
+    submod_mirrors = OrderedDict()
     for submodule in submodules:
         matches = git_submod_re.match(submodule)
         if matches and matches.group(2)[0] == '.':
@@ -264,23 +845,43 @@ def git_mirror_checkout_recursive(git, mirror_dir, checkout_dir, git_url, git_ca
             if verbose:
                 print('Relative submodule %s found: url is %s, submod_mirror_dir is %s' % (
                       submod_name, submod_url, submod_mirror_dir))
-            with TemporaryDirectory() as temp_checkout_dir:
-                git_mirror_checkout_recursive(git, submod_mirror_dir, temp_checkout_dir, submod_url,
-                                              git_cache=git_cache, git_ref=git_ref,
-                                              git_depth=git_depth, is_top_level=False,
-                                              verbose=verbose)
+            _, revs = submod_mirrors.setdefault(submod_mirror_dir, (submod_url, []))
+            revs.extend(_git_gitlink_revs(git, checkout_dir, submod_name))
+
+    def mirror_submodule(item):
+        submod_mirror_dir, (submod_url, revs) = item
+        with TemporaryDirectory() as temp_checkout_dir:
+            git_mirror_checkout_recursive(git, submod_mirror_dir, temp_checkout_dir, submod_url,
+                                          git_cache=git_cache, git_ref=git_ref,
+                                          git_depth=git_depth, is_top_level=False,
+                                          verbose=verbose, mirror_max_age=mirror_max_age,
+                                          partial_clone=partial_clone, jobs=jobs,
+                                          needed_revs=revs)
+
+    if jobs > 1 and len(submod_mirrors) > 1:
+        pool = ThreadPool(min(jobs, len(submod_mirrors)))
+        try:
+            pool.map(mirror_submodule, submod_mirrors.items())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for item in submod_mirrors.items():
+            mirror_submodule(item)
 
     if is_top_level:
         # Now that all relative-URL-specified submodules are locally mirrored to
         # relatively the same place we can go ahead and checkout the submodules.
-        check_call_env([git, 'submodule', 'update', '--init',
-                    '--recursive'], cwd=checkout_dir, stdout=stdout, stderr=stderr)
+        check_call_env([git, '-c', 'submodule.fetchJobs=%d' % jobs, 'submodule', 'update',
+                        '--init', '--recursive'],
+                       cwd=checkout_dir, stdout=stdout, stderr=stderr)
         git_info(checkout_dir, verbose=verbose)
     if not verbose:
         FNULL.close()
 
 
-def git_source(source_dict, git_cache, src_dir, recipe_path=None, verbose=True):
+def git_source(source_dict, git_cache, src_dir, recipe_path=None, verbose=True,
+               mirror_max_age=0, partial_clone=False, jobs=4):
     ''' Download a source from a Git repo (or submodule, recursively) '''
     if not isdir(git_cache):
         os.makedirs(git_cache)
@@ -308,7 +909,8 @@ def git_source(source_dict, git_cache, src_dir, recipe_path=None, verbose=True):
     mirror_dir = join(git_cache, git_dn)
     git_mirror_checkout_recursive(
         git, mirror_dir, src_dir, git_url, git_cache=git_cache, git_ref=git_ref,
-        git_depth=git_depth, is_top_level=True, verbose=verbose)
+        git_depth=git_depth, is_top_level=True, verbose=verbose,
+        mirror_max_age=mirror_max_age, partial_clone=partial_clone, jobs=jobs)
     return git
 
 
@@ -595,6 +1197,57 @@ def apply_patch(src_dir, path, config, git=None):
                 raise
 
 
+def _prepared_source_key(recipe_path, dicts):
+    """Identify the fully prepared (downloaded, unpacked and patched) work dir for a source
+    section.  Returns None when that can't be pinned down: sources from git, hg, svn or a
+    local path can change without the recipe changing, and so can urls without a hash."""
+    # patching on windows goes through line ending conversions that unix never does
+    parts = ['crlf' if on_win else 'lf']
+    for source_dict in dicts:
+        if any(k in source_dict for k in ('fn', 'url')):
+            unhashed_fn, _, hash_type = _cache_fn(source_dict)
+            if not hash_type:
+                return None
+            part = [unhashed_fn, hash_type, source_dict[hash_type]]
+        elif any(k in source_dict for k in ('git_url', 'hg_url', 'svn_url', 'path')):
+            return None
+        else:
+            part = []
+        part.append(source_dict.get('folder') or '')
+        for patch in ensure_list(source_dict.get('patches', [])):
+            patch_path = join(recipe_path, patch)
+            if not isfile(patch_path):
+                return None
+            part.append(hashsum_file(patch_path, 'sha256'))
+        parts.append(part)
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def _restore_prepared_source(prepared_cache, key, work_dir):
+    """Fill work_dir from the prepared source cache.  Returns False on a miss."""
+    entry = join(prepared_cache, key)
+    with filelock.FileLock(entry + '.lock'):
+        if not _cached_tree_intact(entry):
+            rm_rf(entry)
+            return False
+        materialize_tree(join(entry, 'tree'), work_dir)
+        # last use, for evict_source_cache
+        os.utime(entry, None)
+    return True
+
+
+def _store_prepared_source(prepared_cache, key, work_dir):
+    """Keep a copy of the freshly patched work_dir.  The build then runs in work_dir, so the
+    cache entry must not share any file with it (see materialize_tree)."""
+    entry = join(prepared_cache, key)
+    with filelock.FileLock(entry + '.lock'):
+        if _cached_tree_intact(entry):
+            return
+        rm_rf(entry)
+        materialize_tree(work_dir, join(entry, 'tree'))
+        _seal_cached_tree(entry)
+
+
 def provide(metadata):
     """
     given a recipe_dir:
@@ -612,18 +1265,35 @@ def provide(metadata):
     else:
         dicts = meta
 
+    key = None
+    if metadata.config.cache_prepared_sources:
+        key = _prepared_source_key(metadata.path, dicts)
+    if key and _restore_prepared_source(metadata.config.prepared_cache, key,
+                                        metadata.config.work_dir):
+        print("Using downloaded, unpacked and patched source from cache")
+        reset_cached_vars()
+        return metadata.config.work_dir
+
     try:
-        for source_dict in dicts:
+        # fetch all url sources at once; unpacking and patching stays in recipe order
+        downloads = download_sources(metadata)
+        for i, source_dict in enumerate(dicts):
             folder = source_dict.get('folder')
             src_dir = (os.path.join(metadata.config.work_dir, folder) if folder else
                     metadata.config.work_dir)
             if any(k in source_dict for k in ('fn', 'url')):
                 unpack(source_dict, src_dir, metadata.config.src_cache, recipe_path=metadata.path,
                     croot=metadata.config.croot, verbose=metadata.config.verbose,
-                    timeout=metadata.config.timeout, locking=metadata.config.locking)
+                    timeout=metadata.config.timeout, locking=metadata.config.locking,
+                    downloaded=downloads.get(i),
+                    extract_cache=(metadata.config.extracted_cache
+                                   if metadata.config.cache_extracted_sources else None))
             elif 'git_url' in source_dict:
                 git = git_source(source_dict, metadata.config.git_cache, src_dir, metadata.path,
-                                verbose=metadata.config.verbose)
+                                verbose=metadata.config.verbose,
+                                mirror_max_age=metadata.config.git_mirror_max_age,
+                                partial_clone=metadata.config.git_partial_clone,
+                                jobs=metadata.config.download_threads)
             # build to make sure we have a work directory with source in it. We
             #    want to make sure that whatever version that is does not
             #    interfere with the test we run next.
@@ -653,5 +1323,17 @@ def provide(metadata):
     except CalledProcessError:
         os.rename(metadata.config.work_dir, metadata.config.work_dir + '_failed_provide')
         raise
-
+    finally:
+        # the work dir changed; anything derived from its checkout has to be looked up again
+        reset_cached_vars()
+
+    if key:
+        config = metadata.config
+        _store_prepared_source(config.prepared_cache, key, config.work_dir)
+        max_size = _parse_size(config.src_cache_max_size)
+        if max_size is not None:
+            evict_source_cache(config.src_cache, max_size,
+                               keep=[join(config.prepared_cache, key)], timeout=config.timeout,
+                               extract_cache=config.extracted_cache,
+                               prepared_cache=config.prepared_cache)
     return metadata.config.work_dir
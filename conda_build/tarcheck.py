@@ -1,11 +1,15 @@
 from __future__ import absolute_import, division, print_function
 
 import json
+import os
 from os.path import basename
 import tarfile
 
 from conda_build.utils import codec
 
+# the info/ files the checks look into
+info_members = ('info/files', 'info/index.json', 'info/has_prefix')
+
 
 def dist_fn(fn):
     if fn.endswith('.tar'):
@@ -16,11 +20,34 @@ def dist_fn(fn):
         raise Exception('did not expect filename: %r' % fn)
 
 
-class TarCheck(object):
-    def __init__(self, path, config):
-        self.t = tarfile.open(path)
-        self.paths = set(m.path for m in self.t.getmembers())
-        self.dist = dist_fn(basename(path))
+def read_archive(path, wanted=info_members, paths=True):
+    """
+    Read the package at path once, front to back.  Returns the paths of its members that are
+    neither in info/ nor directories (None if paths is False) and {name: contents} of the
+    wanted members.  Without paths, reading stops as soon as all wanted members were seen.
+    """
+    member_paths = [] if paths else None
+    contents = {}
+    with tarfile.open(path, 'r|*') as t:
+        for m in t:
+            if m.path in wanted:
+                contents[m.path] = t.extractfile(m).read()
+                if not paths and len(contents) == len(wanted):
+                    break
+            elif paths and not (m.path.startswith('info/') or m.isdir()):
+                member_paths.append(m.path)
+    return member_paths, contents
+
+
+class PackageCheck(object):
+    """
+    The checks of a package, given the paths of its members (not in info/, not directories)
+    and the contents of its info/ files.  Nothing needs to be read back from an archive.
+    """
+    def __init__(self, dist, paths, info, config):
+        self.paths = paths
+        self.info = info
+        self.dist = dist
         self.name, self.version, self.build = self.dist.split('::', 1)[-1].rsplit('-', 2)
         self.config = config
 
@@ -28,17 +55,16 @@ class TarCheck(object):
         return self
 
     def __exit__(self, e_type, e_value, traceback):
-        self.t.close()
+        pass
 
     def info_files(self):
         lista = [p.strip().decode('utf-8') for p in
-                 self.t.extractfile('info/files').readlines()]
+                 self.info['info/files'].splitlines()]
         seta = set(lista)
         if len(lista) != len(seta):
             raise Exception('info/files: duplicates')
 
-        listb = [m.path for m in self.t.getmembers()
-                 if not (m.path.startswith('info/') or m.isdir())]
+        listb = self.paths
         setb = set(listb)
         if len(listb) != len(setb):
             raise Exception('info_files: duplicate members')
@@ -53,7 +79,7 @@ class TarCheck(object):
         raise Exception('info/files')
 
     def index_json(self):
-        info = json.loads(self.t.extractfile('info/index.json').read().decode('utf-8'))
+        info = json.loads(self.info['info/index.json'].decode('utf-8'))
         for varname in 'name', 'version':
             if info[varname] != getattr(self, varname):
                 raise Exception('%s: %r != %r' % (varname, info[varname],
@@ -62,8 +88,8 @@ class TarCheck(object):
 
     def prefix_length(self):
         prefix_length = None
-        if 'info/has_prefix' in self.t.getnames():
-            prefix_files = self.t.extractfile('info/has_prefix').readlines()
+        if 'info/has_prefix' in self.info:
+            prefix_files = self.info['info/has_prefix'].splitlines()
             for line in prefix_files:
                 try:
                     prefix, file_type, _ = line.split()
@@ -78,24 +104,51 @@ class TarCheck(object):
         return prefix_length
 
     def correct_subdir(self):
-        info = json.loads(self.t.extractfile('info/index.json').read().decode('utf-8'))
+        info = json.loads(self.info['info/index.json'].decode('utf-8'))
         assert info['subdir'] in [self.config.host_subdir, 'noarch', self.config.target_subdir], \
             ("Inconsistent subdir in package - index.json expecting {0},"
              " got {1}".format(self.config.host_subdir, info['subdir']))
 
 
-def check_all(path, config):
-    x = TarCheck(path, config)
+class TarCheck(PackageCheck):
+    """The checks of a finished package, which is read once to run them."""
+    def __init__(self, path, config, wanted=info_members, paths=True):
+        paths, info = read_archive(path, wanted, paths)
+        super(TarCheck, self).__init__(dist_fn(basename(path)), paths, info, config)
+
+
+def _check(x):
     x.info_files()
     x.index_json()
     x.correct_subdir()
-    x.t.close()
+
+
+def check_all(path, config):
+    _check(TarCheck(path, config))
+
+
+def check_files(fn, files, prefix, config):
+    """
+    check_all for the package fn that is being written from files (relative to prefix),
+    without reading it back: the members are the files, and info/ is still in prefix.
+    """
+    paths = []
+    info = {}
+    for f in files:
+        f = f.replace(os.sep, '/')
+        if f in info_members:
+            with open(os.path.join(prefix, f), 'rb') as fi:
+                info[f] = fi.read()
+        elif not f.startswith('info/'):
+            paths.append(f)
+    _check(PackageCheck(dist_fn(fn), paths, info, config))
 
 
 def check_prefix_lengths(files, config):
     lengths = {}
     for f in files:
-        length = TarCheck(f, config).prefix_length()
+        # only info/has_prefix is needed; reading stops once it went by
+        length = TarCheck(f, config, ('info/has_prefix', ), paths=False).prefix_length()
         if length and length < config.prefix_length:
             lengths[f] = length
     return lengths
@@ -3,6 +3,7 @@ from __future__ import absolute_import, division, print_function
 import base64
 from collections import defaultdict
 import contextlib
+import copy
 import fnmatch
 from glob2 import glob
 import json
@@ -26,7 +27,7 @@ import zipfile
 
 import filelock
 
-from .conda_interface import hashsum_file, md5_file, unix_path_to_win, win_path_to_unix
+from .conda_interface import unix_path_to_win, win_path_to_unix
 from .conda_interface import PY3, iteritems
 from .conda_interface import root_dir, pkgs_dirs
 from .conda_interface import string_types, url_path, get_rc_urls
@@ -35,8 +36,10 @@ from .conda_interface import StringIO
 from .conda_interface import VersionOrder, MatchSpec
 from .conda_interface import cc_conda_build
 from .conda_interface import conda_43, Dist
+from .conda_interface import linked_data, walk_prefix, which_prefix
 # NOQA because it is not used in this file.
 from conda_build.conda_interface import rm_rf as _rm_rf # NOQA
+from conda_build import checksums
 from conda_build.os_utils import external
 
 if PY3:
@@ -290,6 +293,17 @@ def merge_tree(src, dst, symlinks=False, timeout=90, lock=None, locking=True, cl
         copytree(src, dst, symlinks=symlinks)
 
 
+def break_hardlink(path):
+    """Give path its own copy of its data, so writing to it leaves other links alone.  The
+    copy is made next to it and renamed over it, so on posix the file is never missing."""
+    if isfile(path) and not os.path.islink(path) and os.stat(path).st_nlink > 1:
+        tmp = path + '.conda_build_unlink'
+        shutil.copy2(path, tmp)
+        if on_win:
+            os.remove(path)
+        os.rename(tmp, path)
+
+
 # purpose here is that we want *one* lock per location on disk.  It can be locked or unlocked
 #    at any time, but the lock within this process should all be tied to the same tracking
 #    mechanism.
@@ -405,9 +419,10 @@ def unzip(zip_path, dir_path):
 
 
 def file_info(path):
+    digests = checksums.file_hashes(path, ('md5', 'sha256'))
     return {'size': getsize(path),
-            'md5': md5_file(path),
-            'sha256': hashsum_file(path, 'sha256'),
+            'md5': digests['md5'],
+            'sha256': digests['sha256'],
             'mtime': getmtime(path)}
 
 # Taken from toolz
@@ -824,23 +839,33 @@ class LoggingContext(object):
         # implicit return of None => don't swallow exceptions
 
 
+# keyed by conda-meta folder and its mtime, which changes whenever packages are (un)linked
+_installed_packages_cache = {}
+
+
 def get_installed_packages(path):
     '''
     Scan all json files in 'path' and return a dictionary with their contents.
-    Files are assumed to be in 'index.json' format.
+    Files are assumed to be in 'index.json' format.  The result is the caller's own copy.
     '''
-    installed = dict()
-    for filename in glob(os.path.join(path, 'conda-meta', '*.json')):
-        with open(filename) as file:
-            data = json.load(file)
-            installed[data['name']] = data
-    return installed
+    conda_meta = os.path.join(path, 'conda-meta')
+    key = (conda_meta, getmtime(conda_meta) if isdir(conda_meta) else None)
+    if key not in _installed_packages_cache:
+        installed = dict()
+        for filename in glob(os.path.join(conda_meta, '*.json')):
+            with open(filename) as file:
+                data = json.load(file)
+                installed[data['name']] = data
+        _installed_packages_cache[key] = installed
+    # callers may change the records, and must not change them for later callers
+    return copy.deepcopy(_installed_packages_cache[key])
 
 
 def _convert_lists_to_sets(_dict):
     for k, v in _dict.items():
         if hasattr(v, 'keys'):
-            _dict[k] = HashableDict(_convert_lists_to_sets(v))
+            # HashableDict converts its own copy; don't modify dicts that may be shared
+            _dict[k] = HashableDict(v)
         elif hasattr(v, '__iter__') and not isinstance(v, string_types):
             try:
                 _dict[k] = sorted(list(set(v)))
@@ -860,6 +885,114 @@ class HashableDict(dict):
         return hash(json.dumps(self, sort_keys=True))
 
 
+class CopyOnWriteDict(dict):
+    """A dict whose values may be shared with copies of it, made with share().
+
+    Shared values are deep-copied the first time they are looked up, so changes to them (at any
+    depth) never reach the other copies.  Values that are never looked up are never copied."""
+    def __init__(self, *args, **kwargs):
+        super(CopyOnWriteDict, self).__init__(*args, **kwargs)
+        self._shared = set()
+
+    def share(self):
+        """Return a copy of this dict.  Values are shared between the two until looked up."""
+        if not _dict_copies_use_getitem:
+            # dict(self) would hand out the shared values without unsharing them
+            return CopyOnWriteDict(copy.deepcopy(dict(self)))
+        new = CopyOnWriteDict(self)
+        self._shared = set(self.keys())
+        new._shared = set(self._shared)
+        return new
+
+    def _unshare(self, key):
+        if key in self._shared:
+            self._shared.discard(key)
+            dict.__setitem__(self, key, copy.deepcopy(dict.__getitem__(self, key)))
+
+    def _unshare_all(self):
+        for key in list(self._shared):
+            self._unshare(key)
+
+    def __getitem__(self, key):
+        self._unshare(key)
+        return super(CopyOnWriteDict, self).__getitem__(key)
+
+    def __iter__(self):
+        # overriding __iter__ makes dict(self), {**self} and dict.update(self) go through
+        #    keys() and __getitem__ instead of copying the raw (maybe shared) values
+        return iter(self.keys())
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        super(CopyOnWriteDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        super(CopyOnWriteDict, self).__delitem__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        self._unshare(key)
+        return super(CopyOnWriteDict, self).pop(key, *args)
+
+    def popitem(self):
+        self._unshare_all()
+        return super(CopyOnWriteDict, self).popitem()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self._shared.clear()
+        super(CopyOnWriteDict, self).clear()
+
+    def copy(self):
+        self._unshare_all()
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+
+def _unshare_all_first(name):
+    method = getattr(dict, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._unshare_all()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+# anything that hands out values has to make them private first
+for _name in ('items', 'values', 'iteritems', 'itervalues', 'viewitems', 'viewvalues'):
+    if hasattr(dict, _name):
+        setattr(CopyOnWriteDict, _name, _unshare_all_first(_name))
+
+
+def _probe_dict_copies():
+    value = []
+    probe = CopyOnWriteDict(a=value)
+    probe._shared = set(['a'])
+    return dict(probe)['a'] is not value
+
+
+# python 2 copies any dict subclass with its C fast path, which nothing can hook into.  There,
+#    share() has to deep-copy everything up front.
+_dict_copies_use_getitem = _probe_dict_copies()
+
+
 def represent_hashabledict(dumper, data):
     value = []
 
@@ -873,6 +1006,7 @@ def represent_hashabledict(dumper, data):
 
 
 yaml.add_representer(HashableDict, represent_hashabledict)
+yaml.add_representer(CopyOnWriteDict, represent_hashabledict)
 
 
 # http://stackoverflow.com/a/10743550/1170370
@@ -1165,6 +1299,66 @@ def prefix_files(prefix):
     return res
 
 
+# prefix -> (conda-meta signature, {absolute path: [dists]}, set of installed relative paths)
+_conda_meta_indexes = {}
+
+
+def _conda_meta_signature(prefix):
+    meta_dir = join(prefix, 'conda-meta')
+    try:
+        return tuple(sorted((fn, getmtime(join(meta_dir, fn))) for fn in os.listdir(meta_dir)
+                            if fn.endswith('.json')))
+    except OSError:
+        return None
+
+
+def conda_meta_index(prefix):
+    '''
+    Which packages linked into prefix brought which files.  Returns ({absolute path:
+    [dists]}, set of paths relative to prefix).  Built once per prefix, and again only
+    when something in conda-meta changed.
+    '''
+    prefix = abspath(prefix)
+    signature = _conda_meta_signature(prefix)
+    cached = _conda_meta_indexes.get(prefix)
+    if cached and cached[0] == signature:
+        return cached[1:]
+    owners = defaultdict(list)
+    installed = set()
+    for dist, meta in linked_data(prefix).items():
+        for f in meta.get('files', ()):
+            owners[abspath(join(prefix, f))].append(dist)
+            installed.add(f)
+    _conda_meta_indexes[prefix] = (signature, dict(owners), installed)
+    return _conda_meta_indexes[prefix][1:]
+
+
+def which_package(path):
+    """
+    given the path (of a (presumably) conda installed file) iterate over
+    the conda packages the file came from.  Usually the iteration yields
+    only one package.
+    """
+    path = abspath(path)
+    prefix = which_prefix(path)
+    if prefix is None:
+        raise RuntimeError("could not determine conda prefix from: %s" % path)
+    for dist in conda_meta_index(prefix)[0].get(path, ()):
+        yield dist
+
+
+def untracked_files(prefix):
+    '''
+    The files in prefix that no linked package brought, like conda's untracked but using
+    the shared conda_meta_index.
+    '''
+    installed = conda_meta_index(prefix)[1]
+    return set(path for path in walk_prefix(prefix) - installed
+               if not (path.endswith('~') or
+                       sys.platform == 'darwin' and path.endswith('.DS_Store') or
+                       path.endswith('.pyc') and path[:-1] in installed))
+
+
 def mmap_mmap(fileno, length, tagname=None, flags=0, prot=mmap_PROT_READ | mmap_PROT_WRITE,
               access=None, offset=0):
     '''
@@ -1,6 +1,7 @@
 """This file handles the parsing of feature specifications from files,
 ending up with a configuration matrix"""
 
+import copy
 from itertools import product
 import os
 import sys
@@ -37,14 +38,34 @@ SUFFIX_MAP = {'PY': 'python',
               'R': 'r_base'}
 
 
+# parsed variant config files, keyed by path, file stat and the selector namespace that was
+#    used to evaluate selectors in the file.  Rendering many recipes (or many variants of one
+#    recipe) reads the same user-wide and CLI-provided config files over and over otherwise.
+_config_file_cache = {}
+
+
+def _config_file_cache_key(path, namespace):
+    st = os.stat(path)
+    # os and environ are module/mapping objects; os.environ's contents are already in the
+    #    namespace as plain keys.
+    ns_items = tuple(sorted((k, repr(v)) for k, v in namespace.items()
+                            if k not in ('os', 'environ')))
+    return os.path.abspath(path), st.st_mtime, st.st_size, ns_items
+
+
 def parse_config_file(path, config):
     from conda_build.metadata import select_lines, ns_cfg
-    with open(path) as f:
-        contents = f.read()
-    contents = select_lines(contents, ns_cfg(config), variants_in_place=False)
-    content = yaml.load(contents, Loader=yaml.loader.BaseLoader)
-    trim_empty_keys(content)
-    return content
+    namespace = ns_cfg(config)
+    key = _config_file_cache_key(path, namespace)
+    if key not in _config_file_cache:
+        with open(path) as f:
+            contents = f.read()
+        contents = select_lines(contents, namespace, variants_in_place=False)
+        content = yaml.load(contents, Loader=yaml.loader.BaseLoader)
+        trim_empty_keys(content)
+        _config_file_cache[key] = content
+    # callers extend and update the lists and dicts in here.  Don't let them alter the cache.
+    return copy.deepcopy(_config_file_cache[key])
 
 
 def validate_variant(variant):
@@ -74,12 +95,14 @@ def find_config_files(metadata_or_path, additional_files=None, ignore_system_con
         if os.path.isfile(cwd):
             files.append(cwd)
 
-    if hasattr(metadata_or_path, 'path'):
-        recipe_config = os.path.join(metadata_or_path.path, "conda_build_config.yaml")
-    else:
-        recipe_config = os.path.join(metadata_or_path, "conda_build_config.yaml")
-    if os.path.isfile(recipe_config):
-        files.append(recipe_config)
+    # metadata_or_path may be None to find only the files that are shared by all recipes
+    if metadata_or_path is not None:
+        if hasattr(metadata_or_path, 'path'):
+            recipe_config = os.path.join(metadata_or_path.path, "conda_build_config.yaml")
+        else:
+            recipe_config = os.path.join(metadata_or_path, "conda_build_config.yaml")
+        if os.path.isfile(recipe_config):
+            files.append(recipe_config)
 
     if additional_files:
         files.extend([os.path.expanduser(additional_file) for additional_file in additional_files])
@@ -336,11 +359,14 @@ def list_of_dicts_to_dict_of_lists(list_of_dicts):
 def conform_variants_to_value(list_of_dicts, dict_of_values):
     """We want to remove some variability sometimes.  For example, when Python is used by the
     top-level recipe, we do not want a further matrix for the outputs.  This function reduces
-    the variability of the variant set."""
+    the variability of the variant set.  The input dicts are left alone - they may be shared by
+    several metadata objects."""
+    conformed = set()
     for d in list_of_dicts:
-        for k, v in dict_of_values.items():
-            d[k] = v
-    return list(set([HashableDict(d) for d in list_of_dicts]))
+        d = dict(d)
+        d.update(dict_of_values)
+        conformed.add(HashableDict(d))
+    return list(conformed)
 
 
 def get_package_variants(recipedir_or_metadata, config=None):
@@ -10,6 +10,13 @@ from conda_build.metadata import MetaData
 from conda_build.utils import check_call_env, prepend_bin_path, copy_into
 
 
+@pytest.fixture(scope='session', autouse=True)
+def private_checksum_db(tmpdir_factory):
+    """Keep the checksums of test files out of the user's checksum database."""
+    from conda_build import checksums
+    checksums.checksum_db_path = str(tmpdir_factory.mktemp('checksums').join('checksums.db'))
+
+
 @pytest.fixture(scope='function')
 def testing_workdir(tmpdir, request):
     """ Create a workdir in a safe temporary folder; cd into dir above before test, cd out after
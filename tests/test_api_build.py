@@ -974,6 +974,28 @@ def test_recursion_layers(testing_config):
     api.build(recipe, config=testing_config)
 
 
+@pytest.mark.serial
+@pytest.mark.skipif(sys.platform == 'win32', reason="parallel builds fork their workers")
+def test_recursion_packages_in_parallel(testing_config):
+    """both dependencies are found before building starts, and built at once"""
+    testing_config.build_jobs = 2
+    recipe = os.path.join(metadata_dir, '_recursive-build-two-packages')
+    outputs = api.build(recipe, config=testing_config)
+    names = [os.path.basename(output).rsplit('-', 2)[0] for output in outputs]
+    assert sorted(names[:2]) == ['_recursive-build-c', '_recursive-build-d']
+    assert names[2] == 'conda-build-test-recursive-build-two-layers'
+
+
+@pytest.mark.serial
+@pytest.mark.skipif(sys.platform == 'win32', reason="parallel builds fork their workers")
+def test_recursion_layers_in_parallel(testing_config):
+    testing_config.build_jobs = 2
+    recipe = os.path.join(metadata_dir, '_recursive-build-two-layers')
+    outputs = api.build(recipe, config=testing_config)
+    assert [os.path.basename(output).rsplit('-', 2)[0] for output in outputs] == [
+        '_recursive-build-b', '_recursive-build-a', 'conda-build-test-recursive-build-two-layers']
+
+
 @pytest.mark.skipif(sys.platform != 'win32', reason=("spaces break openssl prefix "
                                                      "replacement on *nix"))
 def test_croot_with_spaces(testing_metadata, testing_workdir):
@@ -26,6 +26,14 @@ def test_api_render():
     assert argspec.defaults == (None, None, True, True, False)
 
 
+def test_api_render_recipes():
+    argspec = getargspec(api.render_recipes)
+    assert argspec.args == ['recipe_paths', 'config', 'variants',
+                            'permit_unsatisfiable_variants', 'finalize',
+                            'bypass_env_check', 'processes']
+    assert argspec.defaults == (None, None, True, True, False, None)
+
+
 def test_api_output_yaml():
     argspec = getargspec(api.output_yaml)
     assert argspec.args == ['metadata', 'file_path']
@@ -92,8 +100,8 @@ def test_api_installable():
 def test_api_inspect_linkages():
     argspec = getargspec(api.inspect_linkages)
     assert argspec.args == ['packages', 'prefix', 'untracked', 'all_packages',
-                            'show_files', 'groupby', 'sysroot']
-    assert argspec.defaults == (sys.prefix, False, False, False, 'package', '')
+                            'show_files', 'groupby', 'sysroot', 'linkage_method']
+    assert argspec.defaults == (sys.prefix, False, False, False, 'package', '', 'pyldd')
 
 
 def test_api_inspect_objects():
@@ -1,7 +1,10 @@
 import csv
+import hashlib
+import io
 import os
 import json
 import tarfile
+import tempfile
 
 import pytest
 
@@ -300,3 +303,141 @@ def test_skip_conversion(testing_workdir, base_platform, package, capfd):
 
     assert skip_message in output
     assert not os.path.exists(package)
+
+
+def _make_package(fn, index, files):
+    """Write a package holding files ({path: bytes}) plus the info/ files describing them."""
+    paths = {'paths': [{'_path': path, 'path_type': 'hardlink',
+                        'sha256': hashlib.sha256(data).hexdigest(),
+                        'size_in_bytes': len(data)} for path, data in sorted(files.items())],
+             'paths_version': 1}
+    members = dict(files)
+    members['info/index.json'] = json.dumps(index).encode('utf-8')
+    members['info/files'] = ''.join(path + '\n' for path in sorted(files)).encode('utf-8')
+    members['info/paths.json'] = json.dumps(paths).encode('utf-8')
+    with tarfile.open(fn, 'w:bz2') as t:
+        for path, data in sorted(members.items()):
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            info.mode = 0o755 if path.startswith(('bin/', 'Scripts/')) else 0o644
+            t.addfile(info, io.BytesIO(data))
+
+
+def test_convert_streams_source_to_all_platforms(testing_workdir, mocker):
+    fn = 'pkg-1.0-py36_0.tar.bz2'
+    _make_package(fn, {'name': 'pkg', 'version': '1.0', 'build': 'py36_0', 'build_number': 0,
+                       'platform': 'linux', 'arch': 'x86_64', 'subdir': 'linux-64',
+                       'depends': ['python 3.6*']},
+                  {'lib/python3.6/site-packages/pkg/__init__.py': b'x = 1\n',
+                   'bin/pkg-tool': b'#!/opt/anaconda1anaconda2anaconda3/bin/python\nimport pkg\n',
+                   'bin/blob': b'\x00\x01\x02'})
+    mocker.patch('conda_build.convert._chunk_size', 2)
+    tar_open = mocker.spy(tarfile, 'open')
+    mkdtemp = mocker.spy(tempfile, 'mkdtemp')
+    api.convert(fn, platforms='all', quiet=True)
+    # the source package is streamed through, for its index and then for its members,
+    # and never extracted
+    assert [call[0][1:] for call in tar_open.call_args_list
+            if call[0][0] == fn] == [('r|*', ), ('r|*', )]
+    assert not mkdtemp.called
+
+    for platform in ['osx-64', 'linux-32']:
+        package = os.path.join(platform, fn)
+        assert package_has_file(package, 'lib/python3.6/site-packages/pkg/__init__.py')
+        index = json.loads(package_has_file(package, 'info/index.json').decode())
+        assert index['subdir'] == platform
+        assert_package_paths_matches_files(package)
+
+    for platform in ['win-32', 'win-64']:
+        package = os.path.join(platform, fn)
+        assert package_has_file(package, 'Lib/site-packages/pkg/__init__.py') == b'x = 1\n'
+        assert package_has_file(package, 'Scripts/pkg-tool-script.py') == b'import pkg\n'
+        assert package_has_file(package, 'Scripts/pkg-tool.exe')
+        assert package_has_file(package, 'Scripts/blob') == b'\x00\x01\x02'
+        assert (package_has_file(package, 'info/has_prefix') ==
+                b'/opt/anaconda1anaconda2anaconda3 text Scripts/pkg-tool-script.py\n')
+        assert_package_paths_matches_files(package)
+        paths = json.loads(package_has_file(package, 'info/paths.json').decode())['paths']
+        script = [path for path in paths if path['_path'] == 'Scripts/pkg-tool-script.py'][0]
+        assert script['sha256'] == hashlib.sha256(b'import pkg\n').hexdigest()
+
+    # and back
+    os.rename(os.path.join('win-64', fn), 'win.tar.bz2')
+    api.convert('win.tar.bz2', platforms=['linux-64'], output_dir='back', quiet=True)
+    package = os.path.join('back', 'linux-64', 'win.tar.bz2')
+    assert package_has_file(package, 'lib/python3.6/site-packages/pkg/__init__.py')
+    assert package_has_file(package, 'bin/pkg-tool') == (
+        b'#!/opt/anaconda1anaconda2anaconda3/bin/python\nimport pkg\n')
+    assert not package_has_file(package, 'bin/pkg-tool.exe')
+    assert_package_paths_matches_files(package)
+
+
+def test_convert_keeps_empty_files_out_of_scripts(testing_workdir):
+    fn = 'pkg-1.0-py36_0.tar.bz2'
+    _make_package(fn, {'name': 'pkg', 'version': '1.0', 'build': 'py36_0', 'build_number': 0,
+                       'platform': 'linux', 'arch': 'x86_64', 'subdir': 'linux-64',
+                       'depends': ['python 3.6*']},
+                  {'lib/python3.6/site-packages/pkg/__init__.py': b''})
+    api.convert(fn, platforms=['win-64'], quiet=True)
+    package = os.path.join('win-64', fn)
+    with tarfile.open(package) as t:
+        assert [name for name in t.getnames() if not name.startswith('info/')] == [
+            'Lib/site-packages/pkg/__init__.py']
+    assert package_has_file(package, 'info/has_prefix') == b''
+    assert_package_paths_matches_files(package)
+
+    os.rename(package, 'win.tar.bz2')
+    api.convert('win.tar.bz2', platforms=['linux-64'], output_dir='back', quiet=True)
+    package = os.path.join('back', 'linux-64', 'win.tar.bz2')
+    assert package_has_file(package, 'lib/python3.6/site-packages/pkg/__init__.py') == b''
+
+
+def test_convert_batch_skips_up_to_date_packages(testing_workdir, mocker):
+    os.makedirs('channel')
+    index = {'version': '1.0', 'build': 'py36_0', 'build_number': 0, 'platform': 'linux',
+             'arch': 'x86_64', 'subdir': 'linux-64', 'depends': []}
+    for name in ('one', 'two'):
+        index['name'] = name
+        _make_package(os.path.join('channel', name + '-1.0-py36_0.tar.bz2'), index,
+                      {'lib/python3.6/site-packages/%s.py' % name: b'x = 1\n'})
+    index['name'] = 'ext'
+    _make_package(os.path.join('channel', 'ext-1.0-py36_0.tar.bz2'), index,
+                  {'lib/python3.6/site-packages/ext.so': b'\x00'})
+    update_index = mocker.patch('conda_build.index.update_index')
+
+    assert api.convert_batch('channel', output_dir='out', platforms=['osx-64', 'win-64'],
+                             processes=2) == {}
+    for platform in ('osx-64', 'win-64'):
+        assert sorted(os.listdir(os.path.join('out', platform))) == [
+            'one-1.0-py36_0.tar.bz2', 'two-1.0-py36_0.tar.bz2']
+    assert sorted(call[0][0] for call in update_index.call_args_list) == [
+        os.path.join(testing_workdir, 'out', 'osx-64'),
+        os.path.join(testing_workdir, 'out', 'win-64')]
+
+    # nothing changed, nothing to do
+    update_index.reset_mock()
+    converted = os.path.join('out', 'osx-64', 'one-1.0-py36_0.tar.bz2')
+    mtime = os.path.getmtime(converted)
+    api.convert_batch(os.path.join('channel', '*.tar.bz2'), output_dir='out',
+                      platforms=['osx-64', 'win-64'])
+    assert not update_index.called
+    assert os.path.getmtime(converted) == mtime
+
+    # new options or a rebuilt source are converted again
+    api.convert_batch('channel', output_dir='out', platforms=['osx-64', 'win-64'],
+                      dependencies=['numpy'])
+    with tarfile.open(converted) as t:
+        assert 'numpy' in json.loads(t.extractfile('info/index.json').read().decode())['depends']
+
+
+def test_convert_batch_dry_run_writes_nothing(testing_workdir, mocker):
+    os.makedirs('channel')
+    index = {'name': 'one', 'version': '1.0', 'build': 'py36_0', 'build_number': 0,
+             'platform': 'linux', 'arch': 'x86_64', 'subdir': 'linux-64', 'depends': []}
+    _make_package(os.path.join('channel', 'one-1.0-py36_0.tar.bz2'), index,
+                  {'lib/python3.6/site-packages/one.py': b'x = 1\n'})
+    update_index = mocker.patch('conda_build.index.update_index')
+    assert api.convert_batch('channel', output_dir='out', platforms=['win-64'],
+                             dry_run=True) == {}
+    assert not os.path.exists('out')
+    assert not update_index.called
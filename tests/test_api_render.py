@@ -3,6 +3,7 @@ This module tests the test API.  These are high-level integration tests.  Lower
 should go in test_render.py
 """
 
+import json
 import os
 import re
 
@@ -149,3 +150,73 @@ def test_cross_recipe_with_only_build_section(testing_config):
     assert metadata.config.host_subdir != subdir
     assert metadata.config.build_prefix != metadata.config.host_prefix
     assert not metadata.config.build_prefix_override
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_render_recipes_batch(testing_config, processes):
+    recipes = [os.path.join(metadata_dir, name) for name in ('build_number', 'entry_points',
+                                                            'python_run')]
+    results = list(api.render_recipes(recipes, config=testing_config, processes=processes))
+    assert sorted(result['recipe'] for result in results) == sorted(recipes)
+    for result in results:
+        assert result['error'] is None, result['error']
+        # summaries must survive a trip through JSON
+        assert json.loads(json.dumps(result)) == result
+        expected = api.get_output_file_paths(result['recipe'], config=testing_config)
+        assert sorted(out['path'] for out in result['outputs']) == expected
+
+
+def test_render_recipes_batch_reports_errors(testing_config, testing_workdir):
+    results = list(api.render_recipes([os.path.join(testing_workdir, 'does_not_exist'),
+                                       os.path.join(metadata_dir, 'build_number')],
+                                      config=testing_config, processes=2))
+    errors = {result['recipe']: result['error'] for result in results}
+    assert errors[os.path.join(testing_workdir, 'does_not_exist')]
+    assert errors[os.path.join(metadata_dir, 'build_number')] is None
+
+
+def test_get_output_file_paths_offline(testing_config):
+    recipe = os.path.join(metadata_dir, 'build_number')
+    expected = api.get_output_file_paths(recipe, config=testing_config)
+    with mock.patch('conda_build.environ.get_install_actions',
+                    side_effect=AssertionError('solver used')):
+        with mock.patch('conda_build.render.get_build_index',
+                        side_effect=AssertionError('index loaded')):
+            outputs = api.get_output_file_paths(recipe, config=testing_config,
+                                                offline_render=True)
+    assert outputs == expected
+
+
+def test_get_output_file_paths_offline_lockfile(testing_metadata, testing_workdir):
+    python = testing_metadata.config.variant['python']
+    testing_metadata.meta['requirements']['build'] = ['python', 'zlib']
+    api.output_yaml(testing_metadata, 'meta.yaml')
+    with open('pins.yaml', 'w') as f:
+        f.write("build:\n"
+                "  - python {}.1 hb4f2d83_0\n"
+                "  - zlib 1.2.11 ha838bed_2\n"
+                "run_exports:\n"
+                "  python: {{}}\n"
+                "  zlib:\n"
+                "    weak:\n"
+                "      - zlib >=1.2.11,<1.3.0a0\n".format(python))
+    lockfile = os.path.join(testing_workdir, 'pins.yaml')
+
+    with mock.patch('conda_build.environ.get_install_actions',
+                    side_effect=AssertionError('solver used')):
+        outputs = api.get_output_file_paths(testing_workdir, offline_render=True,
+                                            pins_lockfile=lockfile)
+        m = api.render(testing_workdir, pins_lockfile=lockfile)[0][0]
+    assert 'zlib 1.2.11 ha838bed_2' in m.meta['requirements']['build']
+    assert 'zlib >=1.2.11,<1.3.0a0' in m.meta['requirements']['run']
+    assert outputs == [render.bldpkg_path(m)]
+
+
+def test_get_output_file_paths_offline_falls_back_to_solver(testing_config, capfd):
+    recipe = os.path.join(metadata_dir, '_pin_depends_strict')
+    expected = api.get_output_file_paths(recipe, config=testing_config)
+    capfd.readouterr()
+    outputs = api.get_output_file_paths(recipe, config=testing_config, offline_render=True)
+    output, error = capfd.readouterr()
+    assert outputs == expected
+    assert 'Falling back to solving environments' in error
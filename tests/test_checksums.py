@@ -0,0 +1,94 @@
+import hashlib
+import os
+
+import pytest
+
+from conda_build import checksums
+
+
+@pytest.fixture
+def checksum_db(testing_workdir, monkeypatch):
+    monkeypatch.setattr(checksums, 'checksum_db_path', os.path.join(testing_workdir, 'sums.db'))
+    monkeypatch.setattr(checksums, '_memory_cache', {})
+    return checksums.checksum_db_path
+
+
+def test_several_digests_in_one_read(checksum_db, mocker):
+    with open('data', 'wb') as f:
+        f.write(b'some data')
+    compute = mocker.spy(checksums, '_compute')
+    digests = checksums.file_hashes('data', ('md5', 'sha1', 'sha256'))
+    assert compute.call_count == 1
+    for hash_type in ('md5', 'sha1', 'sha256'):
+        assert digests[hash_type] == hashlib.new(hash_type, b'some data').hexdigest()
+
+
+def test_digests_survive_the_process_and_follow_changes(checksum_db, mocker, monkeypatch):
+    with open('data', 'wb') as f:
+        f.write(b'some data')
+    md5 = checksums.md5_file('data')
+
+    # a new process only has the database
+    monkeypatch.setattr(checksums, '_memory_cache', {})
+    compute = mocker.spy(checksums, '_compute')
+    assert checksums.md5_file('data') == md5
+    assert compute.call_count == 0
+
+    with open('data', 'wb') as f:
+        f.write(b'other data, other size')
+    assert checksums.md5_file('data') == hashlib.md5(b'other data, other size').hexdigest()
+    assert compute.call_count == 1
+
+
+def test_parallel_digests_of_large_files(checksum_db, monkeypatch):
+    monkeypatch.setattr(checksums, '_parallel_digest_size', 1)
+    monkeypatch.setattr(checksums, '_chunk_size', 7)
+    data = os.urandom(1000)
+    paths = []
+    for i in range(3):
+        paths.append(os.path.abspath('data%d' % i))
+        with open(paths[-1], 'wb') as f:
+            f.write(data + bytes(bytearray([i])))
+    digests = checksums.hash_files(paths, ('md5', 'sha256'))
+    for i, path in enumerate(paths):
+        content = data + bytes(bytearray([i]))
+        assert digests[path] == {'md5': hashlib.md5(content).hexdigest(),
+                                 'sha256': hashlib.sha256(content).hexdigest()}
+
+
+def test_unusable_database_still_hashes(testing_workdir, monkeypatch):
+    monkeypatch.setattr(checksums, 'checksum_db_path',
+                        os.path.join(testing_workdir, 'missing', 'dir', 'sums.db'))
+    with open('data', 'wb') as f:
+        f.write(b'some data')
+    assert checksums.hashsum_file('data', 'sha256') == hashlib.sha256(b'some data').hexdigest()
+
+
+def test_uncached_digests_read_the_file(checksum_db, mocker):
+    with open('data', 'wb') as f:
+        f.write(b'some data')
+    checksums.md5_file('data')
+    compute = mocker.spy(checksums, '_compute')
+    assert checksums.file_hashes('data', cached=False) == {
+        'md5': hashlib.md5(b'some data').hexdigest()}
+    assert compute.call_count == 1
+
+
+def test_prune_forgets_removed_files(checksum_db):
+    for fn in ('kept', 'removed'):
+        with open(fn, 'wb') as f:
+            f.write(fn.encode())
+        checksums.md5_file(fn)
+    os.remove('removed')
+    assert checksums.prune() == 1
+    assert checksums.prune() == 0
+
+
+def test_one_connection_per_thread(checksum_db, mocker):
+    open_db = mocker.spy(checksums, '_open')
+    for fn in ('one', 'two'):
+        with open(fn, 'wb') as f:
+            f.write(fn.encode())
+        checksums.md5_file(fn)
+    checksums.hash_files(['one', 'two'], ('sha256', ), threads=1)
+    assert open_db.call_count == 1
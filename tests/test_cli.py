@@ -190,6 +190,17 @@ def test_build_no_build_id(testing_workdir, testing_config):
     assert 'has_prefix_files_1' not in data
 
 
+@pytest.mark.skipif(on_win, reason="parallel builds fork their workers")
+def test_build_jobs_builds_in_parallel(mocker, testing_workdir, testing_config):
+    build_tree_parallel = mocker.patch('conda_build.build.build_tree_parallel',
+                                       return_value={})
+    args = [os.path.join(metadata_dir, "empty_sections"), '-j', '2',
+            '--croot', testing_config.croot, '--no-anaconda-upload']
+    main_build.execute(args)
+    assert build_tree_parallel.call_count == 1
+    assert build_tree_parallel.call_args[0][2] == 2
+
+
 @pytest.mark.serial
 def test_build_multiple_recipes(testing_metadata, testing_workdir, testing_config):
     """Test that building two recipes in one CLI call separates the build environment for each"""
@@ -445,6 +456,18 @@ def test_convert(testing_workdir, testing_config):
             assert not os.path.isdir(dirname)
 
 
+def test_convert_batches_only_directories_and_globs(testing_workdir, mocker):
+    convert = mocker.patch.object(api, 'convert')
+    convert_batch = mocker.patch.object(api, 'convert_batch', return_value={})
+    main_convert.execute(['-p', 'win-64', 'a.tar.bz2', 'b.tar.bz2'])
+    assert convert.call_count == 2
+    assert not convert_batch.called
+    os.makedirs('channel')
+    main_convert.execute(['-p', 'win-64', '--dry-run', 'channel'])
+    assert convert_batch.call_count == 1
+    assert convert_batch.call_args[1]['dry_run']
+
+
 @pytest.mark.serial
 def test_purge(testing_workdir, testing_metadata):
     """
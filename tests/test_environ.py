@@ -1,5 +1,6 @@
 import os
 import platform
+import subprocess
 import tempfile
 
 import pytest
@@ -59,3 +60,25 @@ def test_env_creation_with_prefix_fallback_disabled(testing_config):
         environ.create_env(testing_config.build_prefix,
                            specs_or_actions=["python", metadata.name()],
                            env='build', config=testing_config, subdir=subdir)
+
+
+def test_git_vars_are_cached_until_the_repo_changes(testing_metadata, mocker):
+    work_dir = testing_metadata.config.work_dir
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    git = ['git', '-c', 'user.name=conda-build', '-c', 'user.email=conda@conda-build.org']
+    subprocess.check_call(git + ['init'], cwd=work_dir)
+    subprocess.check_call(git + ['commit', '--allow-empty', '-m', 'first'], cwd=work_dir)
+    testing_metadata.meta['source'] = {
+        'git_url': 'https://github.com/conda/conda_build_test_recipe'}
+    mocker.patch.object(environ, 'verify_git_repo', return_value=True)
+    get_git_info = mocker.spy(environ, 'get_git_info')
+
+    first = environ.get_dict(testing_metadata.config, m=testing_metadata)
+    environ.get_dict(testing_metadata.config, m=testing_metadata)
+    assert get_git_info.call_count == 1
+
+    subprocess.check_call(git + ['commit', '--allow-empty', '-m', 'second'], cwd=work_dir)
+    second = environ.get_dict(testing_metadata.config, m=testing_metadata)
+    assert get_git_info.call_count == 2
+    assert first['GIT_FULL_HASH'] != second['GIT_FULL_HASH']
@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 
 from conda_build import jinja_context
@@ -129,3 +131,44 @@ def test_load_setup_py_data_from_setup_cfg(testing_config, tmpdir):
     assert setuptools_data['name'] == 'name_from_setup_cfg'
     assert setuptools_data['version'] == 'version_from_setup_cfg'
     assert setuptools_data['extras_require'] == {'extra': ['extra_package']}
+
+
+def test_load_setup_py_data_is_cached_until_files_read_change(testing_config, tmpdir, mocker):
+    setup_py = tmpdir.join('setup.py')
+    version_txt = tmpdir.join('version.txt')
+    setup_py.write(
+        'import os\n'
+        'from setuptools import setup\n'
+        'with open(os.path.join(os.path.dirname(__file__), "version.txt")) as f:\n'
+        '    setup(name="cached", version=f.read().strip())\n'
+    )
+    version_txt.write('1.0')
+    load = mocker.spy(jinja_context._load_setup_py_data, 'load_setup_py_data')
+    setup_file = str(setup_py)
+
+    assert jinja_context.load_setup_py_data(testing_config, setup_file)['version'] == '1.0'
+    assert jinja_context.load_setup_py_data(testing_config, setup_file)['version'] == '1.0'
+    assert load.call_count == 1
+
+    version_txt.write('1.0.1')
+    assert jinja_context.load_setup_py_data(testing_config, setup_file)['version'] == '1.0.1'
+    assert load.call_count == 2
+
+
+def test_load_setup_py_data_records_helpers_imported_before(tmpdir, monkeypatch):
+    tmpdir.join('cb_setup_helper.py').write('VERSION = "2.0"\n')
+    setup_py = tmpdir.join('setup.py')
+    setup_py.write('from setuptools import setup\n'
+                   'from cb_setup_helper import VERSION\n'
+                   'setup(name="helped", version=VERSION)\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    # imported by an earlier setup.py, so running this one does not load it again
+    __import__('cb_setup_helper')
+    read_files = []
+    try:
+        data = jinja_context._load_setup_py_data.load_setup_py_data(
+            str(setup_py), work_dir=str(tmpdir), read_files=read_files)
+    finally:
+        del sys.modules['cb_setup_helper']
+    assert data['version'] == '2.0'
+    assert str(tmpdir.join('cb_setup_helper.py')) in read_files
@@ -215,3 +215,64 @@ def test_config_member_decoupling(testing_metadata):
     b = testing_metadata.copy()
     b.config.some_member = '123'
     assert b.config.some_member != testing_metadata.config.some_member
+
+
+def test_copies_do_not_share_changes(testing_config):
+    testing_config.variants = [{'python': '2.7'}, {'python': '3.6'}]
+    m = MetaData.fromdict({'package': {'name': 'a', 'version': '1.0'},
+                           'requirements': {'build': ['python']}}, config=testing_config)
+    b = m.copy()
+    b.meta['requirements']['build'].append('zlib')
+    b.final = True
+    assert m.meta['requirements']['build'] == ['python']
+    assert not m.final
+    m.meta['package']['name'] = 'b'
+    assert b.name() == 'a'
+    # the variants list is shared, not copied
+    assert b.config.variants is m.config.variants
+    b.config.variant['some_key'] = 'abc'
+    assert 'some_key' not in m.config.variant
+
+
+def test_plain_dict_copies_do_not_share_changes(testing_config):
+    m = MetaData.fromdict({'package': {'name': 'a', 'version': '1.0'},
+                           'requirements': {'build': ['python']}}, config=testing_config)
+    b = m.copy()
+    dict(m.meta)['requirements']['build'].append('zlib')
+    plain = {}
+    plain.update(b.meta)
+    plain['requirements']['build'].append('cmake')
+    assert m.meta['requirements']['build'] == ['python', 'zlib']
+    assert b.meta['requirements']['build'] == ['python', 'cmake']
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="tracemalloc requires python 3.4")
+def test_copy_memory_with_many_variants_and_outputs(testing_config):
+    """Memory benchmark: the copies made while rendering a 300-variant, 10-output recipe"""
+    import tracemalloc
+    testing_config.variants = [{'python': '3.6', 'numpy': '1.{}'.format(i), 'zlib': '1.2.11',
+                                'pin_run_as_build': {'python': {'min_pin': 'x.x',
+                                                                'max_pin': 'x.x'}},
+                                'zip_keys': [['python', 'numpy']]} for i in range(300)]
+    m = MetaData.fromdict({'package': {'name': 'a', 'version': '1.0'},
+                           'requirements': {'build': ['python', 'numpy', 'zlib']},
+                           'outputs': [{'name': 'out{}'.format(i),
+                                        'requirements': ['python', 'numpy']}
+                                       for i in range(10)]},
+                          config=testing_config)
+    copies = []
+    tracemalloc.start()
+    try:
+        for variant in m.config.variants:
+            om = m.copy()
+            om.config.variant = variant
+            for out in om.meta['outputs']:
+                output_metadata = om.copy()
+                output_metadata.meta['package']['name'] = out['name']
+                copies.append(output_metadata)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(copies) == 3000
+    # deep-copying the variants list for each of these copies takes well over 1GB
+    assert peak < 100 * 1024 ** 2
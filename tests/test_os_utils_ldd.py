@@ -0,0 +1,57 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from conda_build import checksums
+from conda_build.os_utils import ldd
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_get_linkages_remembers_results(testing_workdir, mocker, monkeypatch):
+    monkeypatch.setattr(checksums, 'checksum_db_path', os.path.join(testing_workdir, 'sums.db'))
+    monkeypatch.setattr(checksums, '_memory_cache', {})
+    prefix, exe = os.path.split(os.path.realpath(sys.executable))
+    linkages_of = mocker.spy(ldd, '_linkages_of')
+    linkages = ldd.get_linkages([exe], prefix, '')
+    assert linkages_of.call_count == 1
+    assert linkages[exe]
+    assert all(os.path.isfile(path) for _, path in linkages[exe])
+
+    # the next run finds the result of this one
+    assert ldd.get_linkages([exe], prefix, '') == linkages
+    assert linkages_of.call_count == 1
+    # but it is not shared with other methods
+    ldd.get_linkages([exe], prefix, '', method='verify')
+    assert linkages_of.call_count == 2
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_get_linkages_notices_new_libraries(testing_workdir, mocker, monkeypatch):
+    monkeypatch.setattr(checksums, 'checksum_db_path', os.path.join(testing_workdir, 'sums.db'))
+    prefix = os.path.join(testing_workdir, 'prefix')
+    os.makedirs(prefix)
+    exe = os.path.basename(sys.executable)
+    shutil.copy2(os.path.realpath(sys.executable), os.path.join(prefix, exe))
+    linkages_of = mocker.spy(ldd, '_linkages_of')
+    ldd.get_linkages([exe], prefix, '')
+    ldd.get_linkages([exe], prefix, '')
+    assert linkages_of.call_count == 1
+    # a library that appears next to the file might be found before the one found so far
+    with open(os.path.join(prefix, 'libnew.so'), 'w'):
+        pass
+    os.utime(prefix, (1, 1))
+    ldd.get_linkages([exe], prefix, '')
+    assert linkages_of.call_count == 2
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_get_linkages_in_parallel(testing_workdir, monkeypatch):
+    monkeypatch.setattr(checksums, 'checksum_db_path', os.path.join(testing_workdir, 'sums.db'))
+    prefix = os.path.dirname(os.path.realpath(sys.executable))
+    obj_files = [fn for fn in os.listdir(prefix) if ldd.post.is_obj(os.path.join(prefix, fn))]
+    linkages = ldd.get_linkages(obj_files, prefix, '', threads=4)
+    assert sorted(linkages) == sorted(obj_files)
+    for f in obj_files:
+        assert linkages[f] == ldd._pyldd_linkages(os.path.join(prefix, f), '')
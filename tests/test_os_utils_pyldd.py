@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+from conda_build.os_utils import pyldd
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_mapped_parse_matches_file_parse():
+    exe = os.path.realpath(sys.executable)
+    with open(exe, 'rb') as f:
+        from_file = pyldd.codefile(f)
+    with open(exe, 'rb') as f, pyldd.mappedfile(f) as mf:
+        from_map = pyldd.codefile(mf)
+    assert from_map.dt_needed == from_file.dt_needed
+    assert from_map.dt_rpath == from_file.dt_rpath
+    assert from_map.program_interpreter == from_file.program_interpreter
+
+
+def test_mappedfile_of_empty_file(testing_workdir):
+    open('empty', 'wb').close()
+    with open('empty', 'rb') as f, pyldd.mappedfile(f) as mf:
+        assert mf.read(4) == b''
+        assert mf.tell() == 0
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_linkage_graph_parses_each_file_once(mocker, monkeypatch):
+    monkeypatch.setattr(pyldd, '_needed_libraries', {})
+    monkeypatch.setattr(pyldd, '_direct_linkages', {})
+    monkeypatch.setattr(pyldd, '_transitive_linkages', {})
+    parse = mocker.spy(pyldd, '_inspect_linkages_this')
+    exe = os.path.realpath(sys.executable)
+
+    # what the plain breadth first walk over the graph finds
+    todo, done, expected = set([exe]), set(), set()
+    while todo != done:
+        filename = next(iter(todo - done))
+        resolved = pyldd._inspect_linkages_this(filename)[1]
+        expected.update(resolved)
+        todo.update(resolved)
+        done.add(filename)
+    parse.reset_mock()
+
+    assert pyldd.inspect_linkages(exe) == expected
+    parsed = [call[0][0] for call in parse.call_args_list]
+    assert len(parsed) == len(set(parsed))
+    parse.reset_mock()
+    for dep in expected:
+        pyldd.inspect_linkages(dep)
+    assert pyldd.inspect_linkages(exe) == expected
+    assert not parse.called
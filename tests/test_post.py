@@ -1,10 +1,14 @@
+import json
 import os
 import shutil
+import stat
+import subprocess
 import sys
 
 import pytest
 
 from conda_build import post
+from conda_build.os_utils import pyldd
 from conda_build.utils import on_win
 
 from .utils import add_mangling
@@ -16,11 +20,42 @@ def test_compile_missing_pyc(testing_workdir):
     tmp = os.path.join(testing_workdir, 'tmp')
     shutil.copytree(os.path.join(os.path.dirname(__file__), 'test-recipes',
                                  'metadata', '_compile-test'), tmp)
-    post.compile_missing_pyc(os.listdir(tmp), cwd=tmp,
-                                python_exe=sys.executable)
+    failed = post.compile_missing_pyc(os.listdir(tmp), cwd=tmp,
+                                      python_exe=sys.executable)
     for f in good_files:
         assert os.path.isfile(os.path.join(tmp, add_mangling(f)))
     assert not os.path.isfile(os.path.join(tmp, add_mangling(bad_file)))
+    assert failed == [bad_file]
+
+
+def test_compile_missing_pyc_in_one_process(testing_workdir, mocker):
+    files = [os.path.join('pkg%d' % i, 'mod%d.py' % j) for i in range(3) for j in range(10)]
+    files.append(os.path.join('pkg0', 'skipped.py'))
+    for fn in files:
+        if not os.path.isdir(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        with open(fn, 'w') as f:
+            f.write('x = %r\n' % fn)
+    popen = mocker.spy(post, 'Popen')
+    failed = post.compile_missing_pyc(files, cwd=testing_workdir, python_exe=sys.executable,
+                                      skip_compile_pyc=['*/skipped.py'], jobs=2)
+    assert failed == []
+    assert popen.call_count == 1
+    for fn in files[:-1]:
+        assert os.path.isfile(add_mangling(fn))
+    assert not os.path.isfile(add_mangling(files[-1]))
+
+
+@pytest.mark.skipif(on_win, reason="needs a shell script as python")
+def test_compile_missing_pyc_failing_python_is_not_fatal(testing_workdir):
+    with open('f1.py', 'w') as f:
+        f.write('x = 1\n')
+    broken_python = os.path.join(testing_workdir, 'python')
+    with open(broken_python, 'w') as f:
+        f.write('#!/bin/sh\nexit 3\n')
+    os.chmod(broken_python, 0o755)
+    failed = post.compile_missing_pyc(['f1.py'], cwd=testing_workdir, python_exe=broken_python)
+    assert failed == ['f1.py']
 
 
 @pytest.mark.skipif(on_win, reason="no linking on win")
@@ -48,3 +83,156 @@ def test_postbuild_files_raise(testing_metadata, testing_workdir):
         with pytest.raises(ValueError) as exc:
             post.get_build_metadata(testing_metadata)
         assert f in str(exc)
+
+
+def test_lstat_files_and_fix_permissions(testing_workdir):
+    os.makedirs(os.path.join('old', 'deep'))
+    os.makedirs(os.path.join('new', 'deep'))
+    files = [os.path.join('new', 'deep', 'a'), os.path.join('new', 'b'), 'missing']
+    for fn in files[:2] + [os.path.join('old', 'deep', 'c')]:
+        with open(fn, 'w') as f:
+            f.write('\n')
+        os.chmod(fn, 0o700)
+    os.chmod(os.path.join('old', 'deep'), 0o700)
+    stats = post.lstat_files(files, testing_workdir)
+    assert sorted(stats) == sorted(files[:2])
+
+    post.fix_permissions(files, testing_workdir, stats)
+    assert stat.S_IMODE(os.stat(files[0]).st_mode) == 0o775
+    assert stat.S_IMODE(os.stat(os.path.join('new', 'deep')).st_mode) == 0o775
+    # folders without new files are not touched
+    assert stat.S_IMODE(os.stat(os.path.join('old', 'deep')).st_mode) == 0o700
+
+
+def test_rm_py_along_so_new_files(testing_workdir):
+    for fn in ('ext.so', 'ext.py', 'ext.pyc', 'old.so', 'old.py'):
+        with open(fn, 'w') as f:
+            f.write('\n')
+    post.rm_py_along_so(testing_workdir, ['ext.so', 'ext.py', 'ext.pyc'])
+    assert sorted(os.listdir(testing_workdir)) == ['ext.so', 'old.py', 'old.so']
+
+
+def test_find_lib_walks_the_prefix_once(testing_workdir, mocker, monkeypatch):
+    monkeypatch.setattr(post, '_lib_indexes', {})
+    os.makedirs(os.path.join('lib', 'sub'))
+    for fn in ('libA.dylib', 'libB.dylib', os.path.join('sub', 'libB.dylib')):
+        with open(os.path.join('lib', fn), 'w') as f:
+            f.write('same\n')
+    prefix_files = mocker.spy(post.utils, 'prefix_files')
+    assert post.find_lib('libA.dylib', testing_workdir) == 'lib/libA.dylib'
+    # identical copies; the first one wins
+    assert post.find_lib('@executable_path/libB.dylib', testing_workdir) == 'lib/libB.dylib'
+    assert post.find_lib(os.path.join(testing_workdir, 'lib', 'libA.dylib'),
+                         testing_workdir) == 'lib/libA.dylib'
+    assert prefix_files.call_count == 1
+
+    # files added later are picked up from the list of new files, without another walk
+    with open(os.path.join('lib', 'libC.dylib'), 'w') as f:
+        f.write('\n')
+    post.update_lib_index(testing_workdir, ['lib/libC.dylib'])
+    assert post.find_lib('libC.dylib', testing_workdir) == 'lib/libC.dylib'
+    assert prefix_files.call_count == 1
+
+    # ... or by looking again once a lookup misses
+    with open(os.path.join('lib', 'libD.dylib'), 'w') as f:
+        f.write('\n')
+    assert post.find_lib('libD.dylib', testing_workdir) == 'lib/libD.dylib'
+    assert prefix_files.call_count == 2
+
+    with open(os.path.join('lib', 'sub', 'libB.dylib'), 'w') as f:
+        f.write('different\n')
+    with pytest.raises(SystemExit):
+        post.find_lib('libB.dylib', testing_workdir)
+
+
+def test_lib_indexes_do_not_outlive_a_build(testing_workdir, mocker, monkeypatch):
+    monkeypatch.setattr(post, '_lib_indexes', {})
+    os.makedirs('lib')
+    with open(os.path.join('lib', 'libA.dylib'), 'w') as f:
+        f.write('\n')
+    assert post.find_lib('libA.dylib', testing_workdir) == 'lib/libA.dylib'
+    # the next build has a prefix at the same path, with the library somewhere else
+    os.makedirs(os.path.join('lib', 'sub'))
+    with open(os.path.join('lib', 'sub', 'libA.dylib'), 'w') as f:
+        f.write('different\n')
+    post.reset_lib_indexes()
+    with pytest.raises(SystemExit):
+        post.find_lib('libA.dylib', testing_workdir)
+
+
+def _shared_lib(path, rpath):
+    with open('x.c', 'w') as f:
+        f.write('int x(void) { return 1; }\n')
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    try:
+        subprocess.check_call(['gcc', '-shared', '-fPIC', '-o', path, 'x.c',
+                               '-Wl,-rpath,' + rpath, '-Wl,--enable-new-dtags'])
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("needs gcc")
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_mk_relative_linux_rewrites_rpath_in_place(testing_workdir, mocker):
+    lib = os.path.join(testing_workdir, 'lib', 'libx.so')
+    _shared_lib(lib, os.path.join(testing_workdir, 'lib') + ':/outside/prefix/lib')
+    call = mocker.patch.object(post, 'call')
+    post.mk_relative_linux(os.path.join('lib', 'libx.so'), testing_workdir)
+    assert not call.called
+    assert pyldd.elf_get_rpath(lib) == '$ORIGIN/.'
+    with open(lib, 'rb') as f:
+        # like patchelf --force-rpath, RUNPATH becomes RPATH
+        assert pyldd.elfdynamic(f).rpath_entry()[1] == pyldd.DT_RPATH
+
+    # a longer rpath doesn't fit; that is left to patchelf
+    short = os.path.join(testing_workdir, 'lib', 'sub', 'libx.so')
+    _shared_lib(short, '/a')
+    post.mk_relative_linux(os.path.join('lib', 'sub', 'libx.so'), testing_workdir)
+    assert call.call_args[0][0][-2:] == ['$ORIGIN/..', short]
+    assert pyldd.elf_get_rpath(short) == '/a'
+
+
+def _conda_meta(prefix, name, files):
+    meta_dir = os.path.join(prefix, 'conda-meta')
+    if not os.path.isdir(meta_dir):
+        os.makedirs(meta_dir)
+    with open(os.path.join(meta_dir, name + '-1.0-0.json'), 'w') as f:
+        json.dump({'name': name, 'version': '1.0', 'build': '0', 'build_number': 0,
+                   'files': files}, f)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="ELF only")
+def test_check_overlinking(testing_workdir, testing_metadata):
+    prefix = os.path.join(testing_workdir, 'prefix')
+    lib = os.path.join(prefix, 'lib')
+    for name in ('z', 'bar', 'qux'):
+        _shared_lib(os.path.join(lib, 'lib%s.so' % name), '/a')
+    _conda_meta(prefix, 'zlib', ['lib/libz.so'])
+    _conda_meta(prefix, 'bar', ['lib/libbar.so'])
+    with open('y.c', 'w') as f:
+        f.write('int x(void); int y(void) { return x(); }\n')
+    subprocess.check_call(['gcc', '-shared', '-fPIC', '-o', os.path.join(lib, 'libpkg.so'),
+                           'y.c', '-L' + lib, '-Wl,--no-as-needed', '-lz', '-lbar', '-lqux',
+                           '-Wl,-rpath,$ORIGIN'])
+    # libqux was only there to link against
+    os.remove(os.path.join(lib, 'libqux.so'))
+    testing_metadata.meta['requirements']['run'] = ['zlib']
+
+    report = post.check_overlinking(testing_metadata, ['lib/libpkg.so'], prefix)
+    linkages = report['files']['lib/libpkg.so']
+    assert linkages['libz.so'] == 'zlib'
+    assert linkages['libc.so.6'] == 'system'
+    assert report['overlinking'] == [('lib/libpkg.so', 'libbar.so', 'bar')]
+    assert report['missing'] == [('lib/libpkg.so', 'libqux.so')]
+    with open(os.path.join(testing_metadata.config.info_dir, 'linkages.json')) as f:
+        assert json.load(f)['files'] == report['files']
+
+    testing_metadata.meta['requirements']['run'] = ['zlib', 'bar']
+    testing_metadata.meta['build']['missing_dso_whitelist'] = ['libqux.so']
+    report = post.check_overlinking(testing_metadata, ['lib/libpkg.so'], prefix)
+    assert not report['overlinking'] and not report['missing']
+
+    testing_metadata.meta['requirements']['run'] = ['zlib']
+    testing_metadata.meta['build']['error_overlinking'] = True
+    with pytest.raises(SystemExit):
+        post.check_overlinking(testing_metadata, ['lib/libpkg.so'], prefix)
@@ -1,6 +1,14 @@
+import hashlib
+import io
 import os
 import subprocess
 import tarfile
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 
 import pytest
 
@@ -149,3 +157,319 @@ def test_append_hash_to_fn(testing_metadata, caplog):
     #     serial suite.  Some residual state, somehow.  I suspect the deduplicator logic with the logger,
     #     but attempts to reset it have not been successful.
     # assert any("No hash (md5, sha1, sha256) provided." in rec.message for rec in caplog.records)
+
+
+@pytest.fixture
+def http_payload():
+    """Serve a tarball over http, honoring Range requests, and record what was asked for."""
+    with TemporaryDirectory() as tbz_srcdir:
+        with open(os.path.join(tbz_srcdir, "file.txt"), 'wb') as f:
+            f.write(os.urandom(512 * 1024))
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            tar.add(tbz_srcdir, arcname='payload')
+    payload = buf.getvalue()
+    requested_ranges = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/payload.tar':
+                self.send_error(404)
+                return
+            byte_range = self.headers.get('Range')
+            requested_ranges.append(byte_range)
+            start = int(byte_range.split('=')[1].rstrip('-')) if byte_range else 0
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Length', str(len(payload) - start))
+            self.end_headers()
+            self.wfile.write(payload[start:])
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%d/' % server.server_port, payload, requested_ranges
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_resumes_partial_file(testing_workdir, http_payload):
+    base_url, payload, requested_ranges = http_payload
+    url = base_url + 'payload.tar'
+    sha256 = hashlib.sha256(payload).hexdigest()
+    cache = os.path.join(testing_workdir, 'cache')
+    os.makedirs(cache)
+    path = os.path.join(cache, source.append_hash_to_fn('payload.tar', sha256))
+    with open(source._partial_path(path, url), 'wb') as f:
+        f.write(payload[:1000])
+
+    assert download_to_cache(cache, '', {'url': url, 'sha256': sha256})[0] == path
+    assert requested_ranges == ['bytes=1000-']
+    with open(path, 'rb') as f:
+        assert f.read() == payload
+    assert not os.path.exists(source._partial_path(path, url))
+
+
+def test_download_races_mirrors_and_rejects_bad_hash(testing_workdir, http_payload):
+    base_url, payload, _ = http_payload
+    sha256 = hashlib.sha256(payload).hexdigest()
+    source_dict = {'url': [base_url + 'missing.tar', base_url + 'payload.tar'],
+                   'fn': 'payload.tar', 'sha256': sha256}
+    path, _ = download_to_cache(testing_workdir, '', source_dict)
+    with open(path, 'rb') as f:
+        assert f.read() == payload
+
+    source_dict = {'url': base_url + 'payload.tar', 'fn': 'other.tar', 'sha256': '0' * 64}
+    with pytest.raises(RuntimeError) as exc:
+        download_to_cache(testing_workdir, '', source_dict)
+    assert 'SHA256 mismatch' in str(exc.value)
+
+
+def test_provide_downloads_all_sources(testing_metadata, http_payload):
+    base_url, payload, requested_ranges = http_payload
+    sha256 = hashlib.sha256(payload).hexdigest()
+    testing_metadata.config.download_threads = 2
+    testing_metadata.meta['source'] = [
+        {'folder': 'f1', 'url': base_url + 'payload.tar', 'fn': 'one.tar', 'sha256': sha256},
+        {'folder': 'f2', 'url': base_url + 'payload.tar', 'fn': 'two.tar', 'sha256': sha256}]
+    source.provide(testing_metadata)
+    assert len(requested_ranges) == 2
+    for folder in ('f1', 'f2'):
+        assert os.path.isfile(os.path.join(testing_metadata.config.work_dir, folder, 'file.txt'))
+
+
+def _sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_source_cache_stores_content_once(testing_workdir):
+    cache = os.path.join(testing_workdir, 'cache')
+    archive = os.path.join(thisdir, 'archives', 'a.tar.bz2')
+    sha256 = _sha256(archive)
+    first, _ = download_to_cache(cache, '', {'url': archive, 'sha256': sha256})
+    second, _ = download_to_cache(cache, '', {'url': archive, 'fn': 'other.tar.bz2',
+                                              'sha256': sha256})
+    unhashed, _ = download_to_cache(cache, '', {'url': archive})
+    blob = os.path.join(cache, 'sha256', sha256)
+    assert os.path.isfile(blob)
+    assert os.listdir(os.path.join(cache, 'sha256')) == [sha256]
+    for path in (first, second, unhashed):
+        assert os.path.samefile(path, blob)
+    assert not os.path.exists(os.path.join(cache, 'a.tar.bz2'))
+
+
+def test_source_cache_evicts_least_recently_used(testing_workdir):
+    cache = os.path.join(testing_workdir, 'cache')
+    a = os.path.join(thisdir, 'archives', 'a.tar.bz2')
+    b = os.path.join(thisdir, 'archives', 'b.tar.bz2')
+    path_a, _ = download_to_cache(cache, '', {'url': a, 'sha256': _sha256(a)})
+    os.utime(path_a, (1, 1))
+    path_b, _ = download_to_cache(cache, '', {'url': b, 'sha256': _sha256(b)},
+                                  max_size=os.path.getsize(b))
+    assert not os.path.exists(path_a)
+    assert not os.path.exists(os.path.join(cache, 'sha256', _sha256(a)))
+    assert os.path.isfile(path_b)
+
+    # a cache hit does not evict, and counts as a use
+    download_to_cache(cache, '', {'url': b, 'sha256': _sha256(b)}, max_size=0)
+    assert os.path.isfile(path_b)
+    assert source.evict_source_cache(cache, 0) == os.path.getsize(b)
+    assert not os.path.exists(path_b)
+
+
+def test_source_cache_evicts_prepared_sources(testing_workdir):
+    cache = os.path.join(testing_workdir, 'cache')
+    prepared = os.path.join(testing_workdir, 'prepared')
+    for key in ('old', 'new'):
+        os.makedirs(os.path.join(prepared, key, 'tree'))
+        with open(os.path.join(prepared, key, 'tree', 'file'), 'w') as f:
+            f.write('x' * 100)
+        source._seal_cached_tree(os.path.join(prepared, key))
+    os.utime(os.path.join(prepared, 'old'), (1, 1))
+    assert source.evict_source_cache(cache, 150, prepared_cache=prepared) == 100
+    assert not os.path.exists(os.path.join(prepared, 'old'))
+    assert os.path.isdir(os.path.join(prepared, 'new'))
+
+
+def test_clean_source_cache_without_a_cache(testing_config):
+    assert source.clean_source_cache(testing_config) == 0
+
+
+def test_source_cache_keeps_sources_in_use(testing_workdir):
+    cache = os.path.join(testing_workdir, 'cache')
+    a = os.path.join(thisdir, 'archives', 'a.tar.bz2')
+    path_a, _ = download_to_cache(cache, '', {'url': a, 'sha256': _sha256(a)})
+    with source.filelock.FileLock(path_a + '.lock'):
+        assert source.evict_source_cache(cache, 0) == 0
+    assert os.path.isfile(path_a)
+    assert source.evict_source_cache(cache, 0) == os.path.getsize(a)
+    assert not os.path.exists(path_a)
+
+
+def test_parse_size():
+    assert source._parse_size(None) is None
+    assert source._parse_size(1000) == 1000
+    assert source._parse_size('1000') == 1000
+    assert source._parse_size('2K') == 2048
+    assert source._parse_size('1.5 GB') == int(1.5 * 1024 ** 3)
+    with pytest.raises(ValueError):
+        source._parse_size('lots')
+
+
+def test_unpack_extracts_each_archive_once(testing_workdir, mocker):
+    extract_cache = os.path.join(testing_workdir, 'extracted')
+    archive = os.path.join(thisdir, 'archives', 'a.tar.bz2')
+    downloaded = download_to_cache(os.path.join(testing_workdir, 'cache'), '',
+                                   {'url': archive, 'sha256': _sha256(archive)})
+    tar_xf = mocker.spy(source, 'tar_xf')
+    for work in ('w1', 'w2'):
+        source.unpack({'url': archive}, os.path.join(testing_workdir, work), None, '',
+                      testing_workdir, downloaded=downloaded, extract_cache=extract_cache)
+    assert tar_xf.call_count == 1
+    with open(os.path.join(testing_workdir, 'w1', 'a')) as f:
+        original = f.read()
+    with open(os.path.join(testing_workdir, 'w2', 'a')) as f:
+        assert f.read() == original
+
+    # writing in place in a work dir must not reach the cache, or later work dirs
+    with open(os.path.join(testing_workdir, 'w1', 'a'), 'a') as f:
+        f.write('changed')
+    source.unpack({'url': archive}, os.path.join(testing_workdir, 'w3'), None, '',
+                  testing_workdir, downloaded=downloaded, extract_cache=extract_cache)
+    with open(os.path.join(testing_workdir, 'w3', 'a')) as f:
+        assert f.read() == original
+    assert tar_xf.call_count == 1
+    assert os.stat(os.path.join(testing_workdir, 'w3', 'a')).st_nlink == 1
+
+
+def test_provide_reuses_prepared_source(testing_metadata, testing_workdir, mocker):
+    archive = os.path.join(thisdir, 'archives', 'a.tar.bz2')
+    patch = os.path.join(testing_workdir, 'fill-a.patch')
+    with open(patch, 'w') as f:
+        f.write('--- a/a\n+++ b/a\n@@ -0,0 +1 @@\n+patched\n')
+    testing_metadata.meta['source'] = {'url': archive, 'sha256': _sha256(archive),
+                                       'patches': [patch]}
+    work_file = os.path.join(testing_metadata.config.work_dir, 'a')
+    source.provide(testing_metadata)
+    with open(work_file) as f:
+        assert f.read() == 'patched\n'
+    # the build changes its work dir in place; that must not reach the cached copy
+    with open(work_file, 'a') as f:
+        f.write('built\n')
+
+    source.rm_rf(testing_metadata.config.work_dir)
+    download_sources = mocker.spy(source, 'download_sources')
+    apply_patch = mocker.spy(source, 'apply_patch')
+    source.provide(testing_metadata)
+    with open(work_file) as f:
+        assert f.read() == 'patched\n'
+    assert download_sources.call_count == 0
+    assert apply_patch.call_count == 0
+
+    # a different patch is a different prepared source
+    with open(patch, 'w') as f:
+        f.write('--- a/a\n+++ b/a\n@@ -0,0 +1 @@\n+patched again\n')
+    source.rm_rf(testing_metadata.config.work_dir)
+    source.provide(testing_metadata)
+    with open(work_file) as f:
+        assert f.read() == 'patched again\n'
+    assert apply_patch.call_count == 1
+
+
+def _git(*args, **kwargs):
+    subprocess.check_call(['git', '-c', 'user.name=conda-build', '-c', 'user.email=cb@test',
+                           '-c', 'protocol.file.allow=always'] + list(args),
+                          stdout=subprocess.PIPE, **kwargs)
+
+
+def _bare_repo(base, name, files):
+    """Make base/<name>.git, with one commit holding files, and return its path."""
+    work = os.path.join(base, name + '_work')
+    bare = os.path.join(base, name + '.git')
+    _git('init', '-q', '--bare', bare)
+    _git('config', 'uploadpack.allowFilter', 'true', cwd=bare)
+    _git('config', 'uploadpack.allowAnySHA1InWant', 'true', cwd=bare)
+    _git('clone', '-q', bare, work)
+    for fn, content in files.items():
+        with open(os.path.join(work, fn), 'w') as f:
+            f.write(content)
+    _git('add', '.', cwd=work)
+    _git('commit', '-qm', 'init', cwd=work)
+    _git('push', '-q', 'origin', 'HEAD:master', cwd=work)
+    return bare, work
+
+
+@pytest.fixture
+def git_superproject(testing_workdir, monkeypatch):
+    """A bare repo with two submodules given by relative urls.  Everything is local."""
+    # recent git refuses local submodule clones unless told otherwise
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '1')
+    monkeypatch.setenv('GIT_CONFIG_KEY_0', 'protocol.file.allow')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_0', 'always')
+    base = os.path.join(testing_workdir, 'repos')
+    os.makedirs(base)
+    _bare_repo(base, 'sub1', {'one': '1'})
+    _bare_repo(base, 'sub2', {'two': '2'})
+    bare, work = _bare_repo(base, 'super', {'top': 'top'})
+    for name in ('sub1', 'sub2'):
+        _git('submodule', '-q', 'add', '../%s.git' % name, name, cwd=work)
+    _git('commit', '-qm', 'submodules', cwd=work)
+    _git('push', '-q', 'origin', 'HEAD:master', cwd=work)
+    return bare
+
+
+def _fetches(check_call_env):
+    return [call for call in check_call_env.call_args_list if 'fetch' in call[0][0]]
+
+
+def test_git_mirrors_submodules_and_skips_recent_fetches(testing_workdir, git_superproject,
+                                                          mocker):
+    git_cache = os.path.join(testing_workdir, 'git_cache')
+    source_dict = {'git_url': git_superproject}
+    source.git_source(source_dict, git_cache, os.path.join(testing_workdir, 'w1'))
+    for fn in ('top', os.path.join('sub1', 'one'), os.path.join('sub2', 'two')):
+        assert os.path.isfile(os.path.join(testing_workdir, 'w1', fn))
+
+    check_call_env = mocker.spy(source, 'check_call_env')
+    source.git_source(source_dict, git_cache, os.path.join(testing_workdir, 'w2'),
+                      mirror_max_age=10)
+    assert os.path.isfile(os.path.join(testing_workdir, 'w2', 'sub2', 'two'))
+    assert not _fetches(check_call_env)
+
+    source.git_source(source_dict, git_cache, os.path.join(testing_workdir, 'w3'))
+    assert _fetches(check_call_env)
+
+    # an exact commit that the mirror already has is never fetched again
+    head = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=git_superproject)
+    check_call_env.reset_mock()
+    source.git_source({'git_url': git_superproject, 'git_rev': head.decode('utf-8').strip()},
+                      git_cache, os.path.join(testing_workdir, 'w4'))
+    assert not _fetches(check_call_env)
+
+
+def test_git_partial_and_shallow_mirror(testing_workdir, git_superproject):
+    git_cache = os.path.join(testing_workdir, 'git_cache')
+    url = 'file://' + git_superproject.replace('\\', '/')
+    source.git_source({'git_url': url, 'git_depth': 1}, git_cache,
+                      os.path.join(testing_workdir, 'work'), partial_clone=True)
+    assert os.path.isfile(os.path.join(testing_workdir, 'work', 'sub1', 'one'))
+    mirror_dir = os.path.join(git_cache, url.split('://')[-1].lstrip('/').replace('/', os.sep))
+    assert os.path.isfile(os.path.join(mirror_dir, 'shallow'))
+    promisor = subprocess.check_output(['git', 'config', 'remote.origin.promisor'],
+                                       cwd=mirror_dir)
+    assert promisor.decode('utf-8').strip() == 'true'
+
+
+def test_git_depth_leaves_existing_mirror_full(testing_workdir, git_superproject):
+    git_cache = os.path.join(testing_workdir, 'git_cache')
+    url = 'file://' + git_superproject.replace('\\', '/')
+    source.git_source({'git_url': url}, git_cache, os.path.join(testing_workdir, 'w1'))
+    # another recipe with the same url, that only wants the latest commit
+    source.git_source({'git_url': url, 'git_depth': 1}, git_cache,
+                      os.path.join(testing_workdir, 'w2'))
+    mirror_dir = os.path.join(git_cache, url.split('://')[-1].lstrip('/').replace('/', os.sep))
+    assert not os.path.isfile(os.path.join(mirror_dir, 'shallow'))
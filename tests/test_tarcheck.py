@@ -0,0 +1,59 @@
+import json
+import os
+import tarfile
+
+import pytest
+
+from conda_build import tarcheck
+
+
+def _package(prefix, files, has_prefix=None):
+    info = os.path.join(prefix, 'info')
+    os.makedirs(info)
+    for f in files:
+        if not os.path.isdir(os.path.dirname(os.path.join(prefix, f))):
+            os.makedirs(os.path.dirname(os.path.join(prefix, f)))
+        with open(os.path.join(prefix, f), 'w') as fo:
+            fo.write(f + '\n')
+    with open(os.path.join(info, 'files'), 'w') as fo:
+        fo.write('\n'.join(files) + '\n')
+    with open(os.path.join(info, 'index.json'), 'w') as fo:
+        json.dump({'name': 'pkg', 'version': '1.0', 'build': '0', 'build_number': 0,
+                   'subdir': 'noarch'}, fo)
+    members = ['info/files', 'info/index.json']
+    if has_prefix:
+        with open(os.path.join(info, 'has_prefix'), 'w') as fo:
+            fo.write(has_prefix)
+        members.append('info/has_prefix')
+    return members + files
+
+
+def test_check_while_writing_and_after(testing_workdir, testing_config):
+    prefix = os.path.join(testing_workdir, 'prefix')
+    files = _package(prefix, ['bin/tool', 'lib/libpkg.so'])
+    fn = 'pkg-1.0-0.tar.bz2'
+    with tarfile.open(fn, 'w:bz2') as t:
+        for f in files:
+            t.add(os.path.join(prefix, f), f)
+
+    tarcheck.check_files(fn, files, prefix, testing_config)
+    tarcheck.check_all(fn, testing_config)
+
+    with pytest.raises(Exception):
+        tarcheck.check_files(fn, files + ['lib/stray'], prefix, testing_config)
+    with pytest.raises(Exception):
+        tarcheck.check_files('pkg-2.0-0.tar.bz2', files, prefix, testing_config)
+
+
+def test_prefix_lengths_stop_at_has_prefix(testing_workdir, testing_config, mocker):
+    prefix = os.path.join(testing_workdir, 'prefix')
+    files = _package(prefix, ['lib/libpkg.so'],
+                     has_prefix='/opt/short binary lib/libpkg.so\n')
+    with tarfile.open('pkg-1.0-0.tar.bz2', 'w:bz2') as t:
+        for f in files:
+            t.add(os.path.join(prefix, f), f)
+    extract = mocker.spy(tarfile.TarFile, 'extractfile')
+    testing_config.prefix_length = 255
+    assert tarcheck.check_prefix_lengths(['pkg-1.0-0.tar.bz2'], testing_config) == {
+        'pkg-1.0-0.tar.bz2': len('/opt/short')}
+    assert extract.call_count == 1
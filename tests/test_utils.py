@@ -294,3 +294,44 @@ def test_insert_variant_versions(testing_metadata):
     assert 'numpy 1.13' in testing_metadata.meta['requirements']['build']
     # the overall length does not change
     assert len(testing_metadata.meta['requirements']['build']) == 2
+
+
+def test_conda_meta_index(testing_workdir, mocker):
+    makefile(os.path.join('conda-meta', 'a-1-0.json'), '{}')
+    for fn in ('lib/liba.so', 'lib/libb.so', 'lib/untracked.so', 'a.py', 'a.pyc', 'a.py~'):
+        makefile(fn)
+    records = {'a-1-0': {'files': ['lib/liba.so', 'a.py']},
+               'b-1-0': {'files': ['lib/libb.so', 'lib/liba.so']}}
+    linked_data = mocker.patch.object(utils, 'linked_data', return_value=records)
+    mocker.patch.object(utils, '_conda_meta_indexes', {})
+
+    liba = os.path.join(testing_workdir, 'lib', 'liba.so')
+    assert sorted(utils.which_package(liba)) == ['a-1-0', 'b-1-0']
+    assert list(utils.which_package(os.path.join('lib', 'libb.so'))) == ['b-1-0']
+    assert not list(utils.which_package(os.path.join('lib', 'untracked.so')))
+    assert utils.untracked_files(testing_workdir) == {'lib/untracked.so'}
+    assert linked_data.call_count == 1
+
+    # a change to conda-meta is noticed
+    records['c-1-0'] = {'files': ['lib/untracked.so']}
+    makefile(os.path.join('conda-meta', 'c-1-0.json'), '{}')
+    assert list(utils.which_package(os.path.join('lib', 'untracked.so'))) == ['c-1-0']
+    assert linked_data.call_count == 2
+
+
+def test_get_installed_packages_returns_private_records(testing_workdir, mocker):
+    makefile(os.path.join('conda-meta', 'a-1-0.json'), '{"name": "a", "depends": ["b"]}')
+    mocker.patch.object(utils, '_installed_packages_cache', {})
+    utils.get_installed_packages(testing_workdir)['a']['depends'].append('c')
+    assert utils.get_installed_packages(testing_workdir)['a']['depends'] == ['b']
+
+
+def test_break_hardlink(testing_workdir):
+    with open('original', 'w') as f:
+        f.write('data')
+    os.link('original', 'link')
+    utils.break_hardlink('link')
+    with open('link', 'a') as f:
+        f.write(' more')
+    with open('original') as f:
+        assert f.read() == 'data'
@@ -209,3 +209,26 @@ def test_get_used_loop_vars(testing_config):
     #   python and zlib are both implicitly used (depend on name matching), while
     #   some_package is explicitly used as a jinja2 variable
     assert ms[0][0].get_used_loop_vars() == {'python', 'some_package', 'zlib'}
+
+
+def test_parsed_config_files_are_cached(testing_workdir, testing_config):
+    config_file = os.path.join(testing_workdir, 'conda_build_config.yaml')
+    with open(config_file, 'w') as f:
+        f.write('python:\n  - 2.7\n  - 3.5\n')
+    first = variants.parse_config_file(config_file, testing_config)
+    # callers mutate what they get back; that must not leak into the next parse
+    first['python'].append('3.6')
+    assert variants.parse_config_file(config_file, testing_config) == {'python': ['2.7', '3.5']}
+
+    # editing the file invalidates the cached parse
+    with open(config_file, 'w') as f:
+        f.write('python:\n  - 3.6\n')
+    os.utime(config_file, (0, 0))
+    assert variants.parse_config_file(config_file, testing_config) == {'python': ['3.6']}
+
+
+def test_conform_variants_to_value_leaves_input_alone():
+    input_variants = [{'python': '2.7', 'numpy': '1.11'}, {'python': '3.6', 'numpy': '1.11'}]
+    conformed = variants.conform_variants_to_value(input_variants, {'python': '3.6'})
+    assert conformed == [{'python': '3.6', 'numpy': '1.11'}]
+    assert input_variants[0]['python'] == '2.7'